@@ -0,0 +1,90 @@
+"""
+Maintenance commands for the I-Check memory store.
+
+Usage:
+    python admin.py backfill-digests [--user-id USER_ID]
+    python admin.py ensure-indexes [--user-id USER_ID]
+    python admin.py backfill-lookup-keys [--user-id USER_ID]
+    python admin.py rebuild-retrieval-index [--user-id USER_ID]
+    python admin.py migrate-layout [--user-id USER_ID]
+
+Commands run against the storage backend selected by [STORAGE] backend in config.ini.
+"""
+import argparse, asyncio
+from typing import List, Optional
+from codescripts.i_check import get_memory_manager
+from codescripts.memory_backend import get_memory_backend
+
+
+async def list_user_ids(user_id: Optional[str]) -> List[str]:
+    if user_id:
+        return [user_id]
+    return await get_memory_backend().list_user_ids()
+
+
+async def backfill_digests(user_id: Optional[str]) -> None:
+    memory_manager = get_memory_manager()
+    for uid in await list_user_ids(user_id):
+        counts = await memory_manager.backfill_content_digests(uid)
+        print(f"{uid}: {counts['updated']} digest(s) backfilled, {counts['removed_duplicates']} duplicate(s) removed")
+
+
+async def ensure_indexes(user_id: Optional[str]) -> None:
+    memory_manager = get_memory_manager()
+    for uid in await list_user_ids(user_id):
+        names = await memory_manager.ensure_indexes(uid)
+        print(f"{uid}: indexes ensured ({', '.join(names)})")
+
+
+async def backfill_lookup_keys(user_id: Optional[str]) -> None:
+    memory_manager = get_memory_manager()
+    for uid in await list_user_ids(user_id):
+        updated = await memory_manager.backfill_lookup_keys(uid)
+        print(f"{uid}: {updated} record(s) given lookup keys")
+
+
+async def rebuild_retrieval_index(user_id: Optional[str]) -> None:
+    memory_manager = get_memory_manager()
+    for uid in await list_user_ids(user_id):
+        count = await memory_manager.rebuild_retrieval_index(uid)
+        print(f"{uid}: {count} k_search Q&A(s) indexed")
+
+
+async def migrate_layout(user_id: Optional[str]) -> None:
+    """
+    Moves users' own MongoDB collections into the shared layout, one user at a time, while the service runs
+    (set [STORAGE] mongo_layout = shared on the servers first, so that migrated users are read from the shared collections).
+    """
+    backend = get_memory_backend()
+    if getattr(backend, "layout", None) != "shared":
+        raise SystemExit("migrate-layout needs [STORAGE] backend = mongo and mongo_layout = shared")
+    user_ids = [user_id] if user_id else await backend.list_user_ids()
+    for uid in user_ids:
+        counts = await backend.migrate_user(uid)
+        if not any(counts.values()):
+            print(f"{uid}: already in the shared layout")
+            continue
+        print(f"{uid}: {counts['copied']} record(s) moved, {counts['caught_up']} caught up, {counts['already_shared']} already moved")
+
+
+COMMANDS = {
+    "backfill-digests": backfill_digests,
+    "ensure-indexes": ensure_indexes,
+    "backfill-lookup-keys": backfill_lookup_keys,
+    "rebuild-retrieval-index": rebuild_retrieval_index,
+    "migrate-layout": migrate_layout,
+}
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        await COMMANDS[args.command](args.user_id)
+    finally:
+        await get_memory_backend().close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="I-Check memory store maintenance")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--user-id", help="Only process this user's memory (default: all users)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""
+Load test for the /get_memory and /save_memory endpoints.
+
+The app runs in-process (httpx ASGI transport) against the memory store configured in
+config.ini. With [STORAGE] backend = mongo, point [DB_DETAILS] uri at a local stand-in
+before running, e.g.
+
+    docker run --rm -p 27017:27017 mongo:7
+    python -m benchmarks.load_test --requests 500
+
+With [STORAGE] backend = embedded no server is needed.
+
+Reports p50/p99 latency and requests/second at 1, 10 and 100 concurrent clients.
+k_search is left out of the mix so that no OpenAI calls are made.
+"""
+import argparse, asyncio, os, statistics, tempfile, time, uuid
+from typing import List, Dict, Any
+import docx
+import httpx
+from main import app
+from codescripts.memory_backend import get_memory_backend
+
+CONCURRENCY_LEVELS = [1, 10, 100]
+
+CHECKS = [
+    ("summariser", {"compression_ratio": 50, "focus_areas": [], "model_name": "gpt-4o"}),
+    ("doc_extractor", {"entity_list": ["Party", "Date"], "model_name": "gpt-4o"}),
+    ("faq_generator", {"question_count": 4, "focus_areas": [], "model_name": "gpt-4o"}),
+]
+
+RESPONSES = {
+    "summariser": {"summary": "Benchmark summary."},
+    "doc_extractor": {"entity_table": [{"entity_type": "Party", "values": ["Acme"]}, {"entity_type": "Date", "values": ["2025-01-01"]}]},
+    "faq_generator": {"questions": [{"question": f"Q{i}?", "answer": f"A{i}.", "focus_area": "", "rank": i} for i in range(1, 5)]},
+}
+
+
+def make_documents(directory: str, count: int = 3, paragraphs: int = 200) -> List[str]:
+    paths = []
+    for i in range(count):
+        document = docx.Document()
+        for p in range(paragraphs):
+            document.add_paragraph(f"Document {i} paragraph {p}: the parties agree to the terms set out below.")
+        path = os.path.join(directory, f"bench_{i}.docx")
+        document.save(path)
+        paths.append(path)
+    return paths
+
+
+async def seed_memory(client: httpx.AsyncClient, user_id: str, documents: List[str]) -> None:
+    for agent, parameters in CHECKS:
+        response = await client.post("/save_memory", json={
+            "user_id": user_id,
+            "agent": agent,
+            "documents": documents,
+            "parameters": parameters,
+            "provided_response": RESPONSES[agent],
+        })
+        response.raise_for_status()
+
+
+async def run_level(client: httpx.AsyncClient, user_id: str, documents: List[str], concurrency: int, total: int) -> Dict[str, Any]:
+    latencies = []
+    errors = 0
+    next_request = 0
+
+    async def worker():
+        nonlocal next_request, errors
+        while next_request < total:
+            index = next_request
+            next_request += 1
+            agent, parameters = CHECKS[index % len(CHECKS)]
+            started = time.perf_counter()
+            response = await client.post("/get_memory", json={
+                "user_id": user_id,
+                "agent": agent,
+                "documents": documents,
+                "parameters": parameters,
+            })
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+        "rps": round(total / elapsed, 2),
+    }
+
+
+async def main(total: int) -> None:
+    user_id = f"load_test_{uuid.uuid4().hex[:8]}"
+    transport = httpx.ASGITransport(app=app)
+    with tempfile.TemporaryDirectory() as directory:
+        documents = make_documents(directory)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            await seed_memory(client, user_id, documents)
+            print(f"{'clients':>8} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+            for concurrency in CONCURRENCY_LEVELS:
+                result = await run_level(client, user_id, documents, concurrency, max(total, concurrency))
+                print(f"{result['concurrency']:>8} {result['requests']:>9} {result['errors']:>7} "
+                      f"{result['p50_ms']:>9} {result['p99_ms']:>9} {result['rps']:>9}")
+    await get_memory_backend().delete_user(user_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="get_memory requests per concurrency level")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,131 @@
+"""
+Peak memory of fingerprinting a large document: full-text extraction + hash (previous
+behaviour) vs the streaming digest.
+
+Each measurement runs in a fresh process and reports its peak RSS next to the RSS after
+imports, so the numbers are not polluted by earlier runs.
+
+    python -m benchmarks.memory_bench --pages 2000 --paragraphs 100000
+"""
+import argparse, hashlib, multiprocessing, os, re, resource, tempfile, time
+from typing import Dict, Any
+import docx
+
+LINE = "Clause {n}: the parties agree that the terms set out below apply to every order placed."
+
+
+def make_pdf(path: str, pages: int, lines_per_page: int = 60) -> None:
+    # Minimal hand-written PDF (Helvetica text) so that no PDF writer dependency is needed
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = "".join(
+            f"({LINE.format(n=page * lines_per_page + line)}) Tj T* " for line in range(lines_per_page)
+        )
+        stream = f"BT /F1 8 Tf 10 TL 20 780 Td {lines}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("latin-1")
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def make_docx(path: str, paragraphs: int) -> None:
+    document = docx.Document()
+    for n in range(paragraphs):
+        document.add_paragraph(LINE.format(n=n))
+    document.save(path)
+
+
+def legacy_hash(path: str) -> str:
+    from PyPDF2 import PdfReader
+    if path.lower().endswith('.pdf'):
+        text = ""
+        for page in PdfReader(path).pages:
+            text += page.extract_text()
+    else:
+        text = '\n'.join(para.text for para in docx.Document(path).paragraphs)
+    text = re.sub(r'[\n\t\r]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip() + '\n'
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def streaming_hash(path: str) -> str:
+    from codescripts.text_extractor import ExtractText
+    return ExtractText().digest_local_text(path)["text_hash"]
+
+
+def measure(method: str, path: str, queue) -> None:
+    # Import everything up front so that the baseline includes the libraries for both methods
+    from codescripts.text_extractor import ExtractText
+    from PyPDF2 import PdfReader
+    function = legacy_hash if method == "legacy" else streaming_hash
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        # Silence the extraction preview prints
+        stdout = os.dup(1)
+        os.dup2(devnull.fileno(), 1)
+        try:
+            text_hash = function(path)
+        finally:
+            os.dup2(stdout, 1)
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        "hash": text_hash,
+        "seconds": round(seconds, 2),
+        "baseline_rss_mb": round(baseline_kb / 1024, 1),
+        "peak_rss_mb": round(peak_kb / 1024, 1)
+    })
+
+
+def run(method: str, path: str) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(method, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Peak RSS of document fingerprinting")
+    parser.add_argument("--pages", type=int, default=2000, help="Pages in the synthetic PDF")
+    parser.add_argument("--paragraphs", type=int, default=100000, help="Paragraphs in the synthetic DOCX")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_path = os.path.join(directory, "bench.pdf")
+        docx_path = os.path.join(directory, "bench.docx")
+        make_pdf(pdf_path, args.pages)
+        make_docx(docx_path, args.paragraphs)
+        for path in (pdf_path, docx_path):
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            legacy = run("legacy", path)
+            streaming = run("streaming", path)
+            print(f"{os.path.basename(path)} ({size_mb:.1f} MB)")
+            for label, result in (("full text", legacy), ("streaming", streaming)):
+                print(f"  {label:<10} peak RSS {result['peak_rss_mb']} MB "
+                      f"(after imports {result['baseline_rss_mb']} MB), {result['seconds']}s")
+            print(f"  hashes match: {legacy['hash'] == streaming['hash']}")
+
+
+if __name__ == "__main__":
+    main()
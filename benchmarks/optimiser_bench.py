@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of Optimiser construction + compute.
+
+"before" reproduces the previous behaviour (tiktoken.encoding_for_model looked up on every
+tokenizer call, all prompt templates re-tokenised for every Optimiser, and the whole document
+text tokenised in compute), "after" uses the shared tokenizer registry, the per-model prompt
+token counts and the document token counts stored with the fingerprint at ingestion.
+
+    python -m benchmarks.optimiser_bench --iterations 200
+"""
+import argparse, statistics, time
+from typing import Dict, Any, List
+import tiktoken
+from codescripts.optimiser import Optimiser, warm_up
+from utils.agent_prompts import *
+from utils.tokenizers import count_tokens, tokenizer_name
+
+PARAMS = {"question_count": 10, "focus_areas": ["Payment", "Termination"]}
+PROCESSING_CONTENT = [{"focus_area": "Payment", "question_count": 3}]
+MEMORY_CONTENT = [{"question": "Q?", "answer": "A."}]
+
+
+class LegacyOptimiser(Optimiser):
+    def __init__(self, model_name: str, agent: str, doc_content: str):
+        self.model_name = model_name
+        self.agent = agent.lower()
+        self.tokenizer = self._get_tokenizer()
+        self.chunk_size = self._resolve_chunk_size()
+        self.prompt_tokens = self._compute_prompt_tokens()
+        self.doc_tokens = self.tokenizer(doc_content)
+
+    def _get_tokenizer(self):
+        if "gpt" in self.model_name.lower():
+            return lambda text: len(tiktoken.encoding_for_model(self.model_name).encode(text))
+        return lambda text: max(1, len(text) // 4)
+
+    def _compute_prompt_tokens(self):
+        return {
+            "faq_plain": self.tokenizer(FAQS_WITHOUT_FOCUS),
+            "faq_focus": self.tokenizer(EXTRACT_RELEVANT_TEXT_PROMPT) + self.tokenizer(FAQS_WITH_FOCUS),
+            "summary_plain": self.tokenizer(SUMMARY_PROMPT_WITHOUT_FOCUS),
+            "summary_focus": self.tokenizer(SUMMARY_PROMPT_WITH_FOCUS),
+            "doc_extractor": self.tokenizer(DOC_EXTRACTOR_PROMPT),
+            "k_search": self.tokenizer(K_SEARCH_TEMPLATE)
+        }
+
+
+def make_document(words: int) -> str:
+    return " ".join(f"clause{i % 500} applies to the parties" for i in range(words // 5))
+
+
+def run(optimiser_class, model_name: str, doc_input: Any, iterations: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        optimiser = optimiser_class(model_name, "faq_generator", doc_input)
+        optimiser.compute(PROCESSING_CONTENT, MEMORY_CONTENT, PARAMS)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Optimiser construction + compute micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--words", type=int, default=2000, help="Words in the synthetic document")
+    parser.add_argument("--models", nargs="+", default=["gpt-4o", "gpt-4o-mini", "deepseek-v3"])
+    args = parser.parse_args()
+
+    doc_content = make_document(args.words)
+    warm_up()
+    # Computed once per document at ingestion
+    token_counts = count_tokens(doc_content)
+    for model_name in args.models:
+        before = run(LegacyOptimiser, model_name, doc_content, args.iterations)
+        after = run(Optimiser, model_name, token_counts[tokenizer_name(model_name)], args.iterations)
+        speedup = before["mean_ms"] / after["mean_ms"] if after["mean_ms"] else float("inf")
+        print(f"{model_name:>16}  before {before}  after {after}  speedup x{speedup:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark of k_search candidate ranking over synthetic corpora of stored Q&As.
+
+"before" reproduces the previous ranking (each candidate scored in Python against per-entry
+feature dicts, then heapq.nlargest), "after" scores the candidates with one sparse matrix
+product and an argpartition top-k, for one query at a time and for batches of queries sharing
+their candidates (as on the batch endpoint). Candidates are selected as the retrieval index
+does (rarest query terms first, up to max_candidates), from an in-memory inverted index, so
+the numbers cover ranking only, not the store round trips. Both rankings are checked to return
+the same hits.
+
+    python -m benchmarks.retrieval_bench --sizes 1000 100000 1000000 --scorer tfidf
+"""
+import argparse, heapq, math, statistics, time
+from collections import Counter
+from typing import Dict, Any, List, Tuple
+import numpy as np
+from codescripts.retrieval_index import (
+    SCORERS, IndexStats, MAX_CANDIDATES, TOP_K, select_terms, candidate_batches, rank_candidates
+)
+
+
+def legacy_tfidf(query, entry, entry_length, stats):
+    def weights(counts):
+        w = {t: n * (math.log((1 + stats.doc_count) / (1 + stats.df.get(t, 0))) + 1) for t, n in counts.items()}
+        norm = math.sqrt(sum(v * v for v in w.values()))
+        return {t: v / norm for t, v in w.items()} if norm else w
+    query_weights, entry_weights = weights(query), weights(entry)
+    return sum(w * entry_weights.get(t, 0.0) for t, w in query_weights.items())
+
+
+def legacy_bm25(query, entry, entry_length, stats, k1=1.5, b=0.75):
+    total = 0.0
+    length_norm = 1 - b + b * (entry_length / stats.avg_length if stats.avg_length else 1.0)
+    for term in query:
+        tf = entry.get(term, 0)
+        if not tf:
+            continue
+        df = stats.df.get(term, 0)
+        idf = math.log(1 + (stats.doc_count - df + 0.5) / (df + 0.5))
+        total += idf * tf * (k1 + 1) / (tf + k1 * length_norm)
+    return total
+
+
+def legacy_cosine(query, entry, entry_length, stats):
+    dot = sum(count * entry.get(term, 0) for term, count in query.items())
+    query_norm = math.sqrt(sum(c * c for c in query.values()))
+    entry_norm = math.sqrt(sum(c * c for c in entry.values()))
+    return dot / (query_norm * entry_norm) if query_norm and entry_norm else 0.0
+
+
+LEGACY_SCORES = {"tfidf": legacy_tfidf, "bm25": legacy_bm25, "hashed_ngram": legacy_cosine}
+
+
+def legacy_rank(score, query, candidates, stats, min_score, top_k) -> List[Tuple[Any, float]]:
+    scored = []
+    for entry in candidates:
+        features = {item["t"]: item["n"] for item in entry["features"]}
+        value = score(query, features, entry["length"], stats)
+        if value > min_score:
+            scored.append((entry["qa_id"], value))
+    return heapq.nlargest(top_k, scored, key=lambda hit: hit[1])
+
+
+class SyntheticCorpus:
+    '''
+    Stored queries of 4-12 Zipf-distributed terms, kept as flat arrays with an inverted index so that
+    a million entries fit in memory; only the candidates of a search are materialised as index entries.
+    '''
+
+    def __init__(self, size: int, vocabulary: int, seed: int) -> None:
+        rng = np.random.default_rng(seed)
+        self.size = size
+        self.vocabulary = vocabulary
+        lengths = rng.integers(4, 13, size=size)
+        entry_of_term = np.repeat(np.arange(size, dtype=np.int64), lengths)
+        terms = np.minimum(rng.zipf(1.2, size=len(entry_of_term)), vocabulary) - 1
+        pairs, counts = np.unique(entry_of_term * vocabulary + terms, return_counts=True)
+        self.pair_entries, self.pair_terms, self.pair_counts = pairs // vocabulary, pairs % vocabulary, counts
+        self.entry_starts = np.searchsorted(self.pair_entries, np.arange(size + 1))
+        self.entry_lengths = np.bincount(self.pair_entries, weights=counts, minlength=size).astype(np.int64)
+        self.df = np.bincount(self.pair_terms, minlength=vocabulary)
+        # Postings: entries of each term in entry (insertion) order
+        self.postings = np.argsort(self.pair_terms, kind="stable")
+        self.term_starts = np.searchsorted(self.pair_terms[self.postings], np.arange(vocabulary + 1))
+        self.rng = rng
+
+    def query(self) -> Dict[str, int]:
+        terms = np.minimum(self.rng.zipf(1.3, size=self.rng.integers(2, 7)), self.vocabulary) - 1
+        return {f"t{term}": int(n) for term, n in Counter(terms.tolist()).items()}
+
+    def stats(self, terms) -> IndexStats:
+        return IndexStats(self.size, int(self.entry_lengths.sum()), {t: int(self.df[int(t[1:])]) for t in terms})
+
+    def candidates(self, terms: List[str], limit: int) -> List[Dict[str, Any]]:
+        entries = np.unique(np.concatenate([
+            self.pair_entries[self.postings[self.term_starts[int(t[1:])]:self.term_starts[int(t[1:]) + 1]]] for t in terms
+        ]))[:limit]
+        candidates = []
+        for entry in entries.tolist():
+            start, stop = self.entry_starts[entry], self.entry_starts[entry + 1]
+            candidates.append({
+                "qa_id": entry,
+                "features": [{"t": f"t{t}", "n": int(n)} for t, n in zip(self.pair_terms[start:stop].tolist(), self.pair_counts[start:stop].tolist())],
+                "length": int(self.entry_lengths[entry]),
+            })
+        return candidates
+
+
+def timed(function, *args) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def same_hits(before, after) -> bool:
+    return [qa_id for qa_id, _ in before] == [qa_id for qa_id, _ in after] and all(
+        math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-9) for (_, a), (_, b) in zip(before, after)
+    )
+
+
+def run(corpus: SyntheticCorpus, scorer_name: str, queries: int, batch: int, max_candidates: int, dtype: str) -> Dict[str, Any]:
+    scorer = SCORERS[scorer_name]()
+    legacy_score = LEGACY_SCORES[scorer_name]
+    min_score = scorer.default_min_score
+    before_ms, after_ms, batched_ms, mismatches, candidate_counts = [], [], [], 0, []
+    for _ in range(queries // batch):
+        batch_queries = [corpus.query() for _ in range(batch)]
+        query_terms = {t for query in batch_queries for t in query}
+        query_stats = corpus.stats(query_terms)
+        selected = [select_terms(query, query_stats.df, max_candidates) for query in batch_queries]
+        singles = []
+        for query, terms in zip(batch_queries, selected):
+            candidates = corpus.candidates(terms, max_candidates) if terms else []
+            candidate_counts.append(len(candidates))
+            stats = corpus.stats({item["t"] for entry in candidates for item in entry["features"]} | set(query))
+            before, elapsed = timed(legacy_rank, legacy_score, query, candidates, stats, min_score, TOP_K)
+            before_ms.append(elapsed)
+            after, elapsed = timed(rank_candidates, scorer, [query], candidates, stats, min_score, TOP_K, None, np.dtype(dtype))
+            after_ms.append(elapsed)
+            singles.append(after[0])
+            mismatches += not same_hits(before, after[0])
+
+        # Queries whose candidates fit in the budget share one fetch and one matrix product, as on the batch endpoint
+        batched, elapsed_ms = [[] for _ in batch_queries], 0.0
+        for group in candidate_batches(selected, query_stats.df, max_candidates):
+            candidates = corpus.candidates(sorted({t for i in group for t in selected[i]}), max_candidates * len(group))
+            stats = corpus.stats({item["t"] for entry in candidates for item in entry["features"]} | query_terms)
+            hits, elapsed = timed(rank_candidates, scorer, [batch_queries[i] for i in group], candidates, stats,
+                                  min_score, TOP_K, [selected[i] for i in group], np.dtype(dtype))
+            elapsed_ms += elapsed
+            for i, query_hits in zip(group, hits):
+                batched[i] = query_hits
+        batched_ms.append(elapsed_ms / batch)
+        mismatches += sum(not same_hits(single, hits) for single, hits in zip(singles, batched))
+    return {
+        "candidates_p50": int(statistics.median(candidate_counts)),
+        "before_ms": round(statistics.fmean(before_ms), 3),
+        "after_ms": round(statistics.fmean(after_ms), 3),
+        "batched_ms_per_query": round(statistics.fmean(batched_ms), 3),
+        "mismatches": mismatches,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="k_search candidate ranking benchmark")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 100000, 1000000], help="Stored Q&As per corpus")
+    parser.add_argument("--scorer", choices=sorted(LEGACY_SCORES), default="tfidf")
+    parser.add_argument("--queries", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=8, help="Queries scored together in the batched run")
+    parser.add_argument("--max-candidates", type=int, default=MAX_CANDIDATES)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        corpus, build_ms = timed(SyntheticCorpus, size, args.vocabulary, args.seed)
+        result = run(corpus, args.scorer, args.queries, args.batch, args.max_candidates, args.dtype)
+        before_after = result["before_ms"] / result["after_ms"] if result["after_ms"] else float("inf")
+        print(f"{size:>9} Q&As ({build_ms / 1000:.1f}s to generate)  {result}  speedup x{before_after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import configparser, hashlib, json
+from datetime import datetime, timezone, timedelta
+from typing import List, Any, Optional
+from pymongo import IndexModel, ASCENDING
+from pymongo.asynchronous.database import AsyncDatabase
+from utils.db_client import get_database, INTERNAL_COLLECTION_PREFIX
+from utils.memory_keys import set_key
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+ENABLED = config.getboolean("ANSWER_CACHE", "enabled", fallback=True)
+TTL_SECONDS = config.getint("ANSWER_CACHE", "ttl_seconds", fallback=86400)
+
+
+class AnswerCache:
+    '''
+    Cache of k_search answerability verdicts returned by the LLM.
+
+    A verdict is keyed by the normalised query, the requested document set and the IDs of the
+    stored Q&As that were given to the LLM as context, so the same question asked again over the
+    same memory skips the LLM round-trip. Entries expire after a TTL (Mongo TTL index) and are
+    dropped as soon as new k_search memory is saved for any of their documents.
+    '''
+
+    def __init__(self, db: Optional[AsyncDatabase] = None, ttl_seconds: int = TTL_SECONDS, enabled: bool = ENABLED) -> None:
+        self.db = db if db is not None else get_database()
+        self.collection = self.db[f"{INTERNAL_COLLECTION_PREFIX}k_search_verdicts"]
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._indexes_ready = False
+
+    async def _ensure_indexes(self) -> None:
+        if self._indexes_ready:
+            return
+        await self.collection.create_indexes([
+            IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+            IndexModel([("user_id", ASCENDING), ("doc_hashes", ASCENDING)], name="user_doc_hashes"),
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ])
+        self._indexes_ready = True
+
+    def key(self, user_id: str, query_text: str, doc_hashes: List[str], context_ids: List[Any]) -> str:
+        normalised_query = " ".join(query_text.lower().split())
+        canonical = json.dumps(
+            [user_id, normalised_query, set_key(doc_hashes), sorted(str(qa_id) for qa_id in context_ids)],
+            separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        '''
+        Returns the cached raw LLM verdict for the key, or None on a miss or expired entry.
+        '''
+        if not self.enabled:
+            return None
+        await self._ensure_indexes()
+        # The TTL monitor only runs periodically, so expiry is also checked on read
+        doc = await self.collection.find_one({"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return doc["verdict"] if doc else None
+
+    async def put(self, key: str, user_id: str, doc_hashes: List[str], verdict: str) -> None:
+        if not self.enabled:
+            return
+        await self._ensure_indexes()
+        await self.collection.update_one(
+            {"key": key},
+            {"$set": {
+                "user_id": user_id,
+                "doc_hashes": doc_hashes,
+                "verdict": verdict,
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+            }},
+            upsert=True
+        )
+
+    async def invalidate(self, user_id: str, doc_hashes: List[str]) -> int:
+        '''
+        Drops the user's cached verdicts that involve any of the given documents.
+        '''
+        if not self.enabled:
+            return 0
+        await self._ensure_indexes()
+        result = await self.collection.delete_many({"user_id": user_id, "doc_hashes": {"$in": doc_hashes}})
+        return result.deleted_count
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    '''
+    Returns the process-wide k_search answer cache.
+    '''
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    return _answer_cache
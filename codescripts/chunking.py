@@ -0,0 +1,92 @@
+import configparser, hashlib, zlib
+from typing import List, Dict, Any, Optional
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+ENABLED = config.getboolean("CHUNKING", "enabled", fallback=False)
+# Average chunk size in words; chunks are cut at content-defined points between min_words and max_words
+TARGET_WORDS = config.getint("CHUNKING", "target_words", fallback=1000)
+MIN_WORDS = config.getint("CHUNKING", "min_words", fallback=TARGET_WORDS // 4)
+MAX_WORDS = config.getint("CHUNKING", "max_words", fallback=TARGET_WORDS * 4)
+# Minimum share (by length) of both the requested and the stored document that their common chunks must make up
+# for memory of the stored document to be reused for the requested one
+MIN_COVERAGE = config.getfloat("CHUNKING", "min_coverage", fallback=0.5)
+
+
+class ContentChunker:
+    '''
+    Content-defined chunking of a normalised text, fed in pieces in document order like MinHash.
+
+    A chunk ends after a word when the hash of that word and the one before it hits the boundary condition, so
+    boundaries depend only on the neighbouring words: text inserted in a document changes the chunks around
+    the insertion and leaves the others, and their hashes, as they were.
+    '''
+
+    def __init__(self, target_words: int = TARGET_WORDS, min_words: int = MIN_WORDS, max_words: int = MAX_WORDS) -> None:
+        self.min_words = max(1, min_words)
+        self.max_words = max(self.min_words, max_words)
+        # Past min_words a boundary comes every divisor words on average, so chunks average about target_words
+        self.divisor = max(1, target_words - self.min_words)
+        self.chunks: List[Dict[str, Any]] = []
+        self._carry = ""
+        self._words: List[str] = []
+        self._previous = b""
+        # Offset in the normalised text of the next word, and of the first word of the open chunk
+        self._offset = 0
+        self._start = 0
+
+    def update(self, text: str) -> None:
+        '''
+        Feeds the next piece of normalised text.
+        '''
+        if not text:
+            return
+        text = self._carry + text
+        words = text.split()
+        self._carry = words.pop() if words and not text[-1].isspace() else ""
+        for word in words:
+            self._add(word)
+
+    def _add(self, word: str) -> None:
+        if not self._words:
+            self._start = self._offset
+        self._words.append(word)
+        self._offset += len(word) + 1
+        encoded = word.encode("utf-8")
+        boundary = zlib.crc32(encoded, zlib.crc32(self._previous)) % self.divisor == 0
+        self._previous = encoded
+        if len(self._words) >= self.max_words or (boundary and len(self._words) >= self.min_words):
+            self._cut()
+
+    def _cut(self) -> None:
+        text = " ".join(self._words)
+        self.chunks.append({
+            "hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "start": self._start,
+            "length": len(text)
+        })
+        self._words = []
+
+    def finish(self) -> Optional[List[Dict[str, Any]]]:
+        '''
+        Returns the chunks as {"hash", "start", "length"} (offsets in the normalised text), or None for a text
+        without words.
+        '''
+        if self._carry:
+            self._add(self._carry)
+            self._carry = ""
+        if self._words:
+            self._cut()
+        return self.chunks or None
+
+
+def chunk_coverage(chunks: List[Dict[str, Any]], other_chunks: List[Dict[str, Any]]) -> float:
+    '''
+    Share of the length of the chunks of one document that is made up of chunks the other document has too.
+    '''
+    other_hashes = {chunk["hash"] for chunk in other_chunks}
+    total = sum(chunk["length"] for chunk in chunks)
+    if not total:
+        return 0.0
+    return sum(chunk["length"] for chunk in chunks if chunk["hash"] in other_hashes) / total
@@ -0,0 +1,88 @@
+import configparser, io, os, tempfile
+from typing import Any, Dict, Optional, Union, BinaryIO
+from utils.s3_operations import S3Helper
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+TMP_DIR = config.get("INGESTION", "tmp_dir", fallback="/tmp")
+# S3 objects smaller than this are read into memory; larger ones are spilled to a temp file
+SPOOL_MAX_BYTES = config.getint("INGESTION", "spool_max_bytes", fallback=32 * 1024 * 1024)
+
+if not os.path.exists(TMP_DIR):
+    os.makedirs(TMP_DIR)
+
+
+class DocumentSource:
+    '''
+    A document to extract text from: a local file, or an S3 object read with ranged GETs into
+    an in-memory buffer (or, above the spill threshold, into a uniquely named temp file that is
+    removed on close()).
+    '''
+
+    def __init__(self, name: str, local_path: Optional[str] = None, buffer: Optional[BinaryIO] = None, size: int = 0, owns_file: bool = False) -> None:
+        self.name = name
+        self.local_path = local_path
+        self.buffer = buffer
+        self.size = size
+        self._owns_file = owns_file
+
+    @classmethod
+    def local(cls, path: str) -> "DocumentSource":
+        size = os.path.getsize(path) if os.path.isfile(path) else 0
+        return cls(path, local_path=path, size=size)
+
+    @classmethod
+    def from_s3(cls, bucket: str, key: str, spill_min_bytes: int = SPOOL_MAX_BYTES,
+                metadata: Optional[Dict[str, Any]] = None) -> "DocumentSource":
+        '''
+        Reads an S3 object without writing it to disk unless it is at least `spill_min_bytes` long.
+        `metadata` is the object's S3Helper.head_object() result when the caller already has it; the
+        object is then read as of that HEAD instead of being looked up again.
+        '''
+        s3_helper = S3Helper(bucket)
+        if metadata is None:
+            metadata = s3_helper.head_object(key)
+        size = metadata["content_length"]
+        if size < spill_min_bytes:
+            buffer = io.BytesIO()
+            s3_helper.read_object(key, buffer, size, metadata["etag"], metadata["version_id"])
+            return cls(key, buffer=buffer, size=size)
+
+        temp_file = tempfile.NamedTemporaryFile(
+            dir=TMP_DIR, prefix="icheck-", suffix=os.path.splitext(key)[1], delete=False
+        )
+        try:
+            with temp_file:
+                s3_helper.read_object(key, temp_file, size, metadata["etag"], metadata["version_id"])
+        except Exception:
+            os.remove(temp_file.name)
+            raise
+        return cls(key, local_path=temp_file.name, size=size, owns_file=True)
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.name)[1].lower()
+
+    def open(self) -> Union[str, BinaryIO]:
+        '''
+        Returns something PdfReader and zipfile accept: the rewound buffer, or the local file path.
+        '''
+        if self.buffer is not None:
+            self.buffer.seek(0)
+            return self.buffer
+        return self.local_path
+
+    def close(self) -> None:
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        if self._owns_file and self.local_path and os.path.exists(self.local_path):
+            os.remove(self.local_path)
+            self.local_path = None
+
+    def __enter__(self) -> "DocumentSource":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
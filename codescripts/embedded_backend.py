@@ -0,0 +1,642 @@
+import asyncio, configparser, json, secrets, sqlite3, threading, time
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple
+from utils.memory_keys import set_key, content_digest, merge_key, focus_area_key
+from codescripts.memory_backend import MemoryBackend
+from codescripts.answer_cache import AnswerCache, ENABLED, TTL_SECONDS
+from codescripts.retrieval_index import (
+    Scorer, IndexStats, SCORERS, SCORER_NAME, MIN_SCORE, MAX_CANDIDATES, TOP_K, select_terms, candidate_batches, rank_candidates
+)
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+STORAGE_PATH = config.get("STORAGE", "path", fallback="memory.sqlite3")
+
+# Record fields kept in their own columns rather than in the record JSON
+COLUMN_FIELDS = ["_id", "timestamp", "content_digest", "doc_set_key", "focus_set_key", "query_key"]
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS memory (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        user_id TEXT NOT NULL,
+        agent TEXT NOT NULL,
+        content_digest TEXT NOT NULL,
+        doc_set_key TEXT NOT NULL,
+        focus_set_key TEXT,
+        query_key TEXT,
+        merge_key TEXT,
+        timestamp TEXT,
+        record TEXT NOT NULL
+    )
+    """,
+    # Duplicate detection
+    "CREATE UNIQUE INDEX IF NOT EXISTS memory_user_content_digest ON memory (user_id, content_digest)",
+    # Exact doc-set (and focus-set) equality lookups (summariser, doc_extractor)
+    "CREATE INDEX IF NOT EXISTS memory_user_agent_doc_set_key ON memory (user_id, agent, doc_set_key, focus_set_key)",
+    # Exact k_search query lookups
+    "CREATE INDEX IF NOT EXISTS memory_user_agent_query_key ON memory (user_id, agent, query_key)",
+    # FAQ/Doc Extractor merge targets
+    "CREATE INDEX IF NOT EXISTS memory_user_merge_key ON memory (user_id, merge_key)",
+    # One row per (record, document): serves doc_hashes overlap lookups (faq_generator, k_search)
+    """
+    CREATE TABLE IF NOT EXISTS memory_doc_hashes (
+        user_id TEXT NOT NULL,
+        agent TEXT NOT NULL,
+        doc_hash TEXT NOT NULL,
+        memory_seq INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS memory_doc_hashes_lookup ON memory_doc_hashes (user_id, agent, doc_hash, memory_seq)",
+    """
+    CREATE TABLE IF NOT EXISTS k_search_verdicts (
+        key TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        doc_hashes TEXT NOT NULL,
+        verdict TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS k_search_verdicts_user ON k_search_verdicts (user_id)",
+    # Near-duplicate matching: MinHash signature per document, and one row per LSH band key for candidate lookups
+    """
+    CREATE TABLE IF NOT EXISTS doc_sketches (
+        user_id TEXT NOT NULL,
+        doc_hash TEXT NOT NULL,
+        signature TEXT NOT NULL,
+        PRIMARY KEY (user_id, doc_hash)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS doc_sketch_bands (
+        user_id TEXT NOT NULL,
+        band_key TEXT NOT NULL,
+        doc_hash TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS doc_sketch_bands_lookup ON doc_sketch_bands (user_id, band_key)",
+    "CREATE INDEX IF NOT EXISTS doc_sketch_bands_doc ON doc_sketch_bands (user_id, doc_hash)",
+    # Chunk-level reuse: content-defined chunks per document, and one row per chunk hash for candidate lookups
+    """
+    CREATE TABLE IF NOT EXISTS doc_chunks (
+        user_id TEXT NOT NULL,
+        doc_hash TEXT NOT NULL,
+        chunks TEXT NOT NULL,
+        PRIMARY KEY (user_id, doc_hash)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS doc_chunk_hashes (
+        user_id TEXT NOT NULL,
+        chunk_hash TEXT NOT NULL,
+        doc_hash TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS doc_chunk_hashes_lookup ON doc_chunk_hashes (user_id, chunk_hash)",
+    "CREATE INDEX IF NOT EXISTS doc_chunk_hashes_doc ON doc_chunk_hashes (user_id, doc_hash)",
+]
+
+
+def _placeholders(values: List[Any]) -> str:
+    return ",".join("?" * len(values))
+
+
+class EmbeddedAnswerCache(AnswerCache):
+    '''
+    The k_search answer cache kept in the embedded backend's SQLite file.
+    '''
+
+    def __init__(self, backend: "EmbeddedMemoryBackend", ttl_seconds: int = TTL_SECONDS, enabled: bool = ENABLED) -> None:
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        row = await self.backend._fetchone(
+            "SELECT verdict FROM k_search_verdicts WHERE key = ? AND expires_at > ?", (key, time.time())
+        )
+        return row[0] if row else None
+
+    async def put(self, key: str, user_id: str, doc_hashes: List[str], verdict: str) -> None:
+        if not self.enabled:
+            return
+
+        def write(conn: sqlite3.Connection) -> None:
+            conn.execute(
+                "INSERT OR REPLACE INTO k_search_verdicts (key, user_id, doc_hashes, verdict, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, user_id, json.dumps(doc_hashes), verdict, time.time() + self.ttl_seconds)
+            )
+            # Expired entries are swept on write, there being no TTL monitor
+            conn.execute("DELETE FROM k_search_verdicts WHERE expires_at <= ?", (time.time(),))
+
+        await self.backend._transaction(write)
+
+    async def invalidate(self, user_id: str, doc_hashes: List[str]) -> int:
+        if not self.enabled or not doc_hashes:
+            return 0
+
+        def delete(conn: sqlite3.Connection) -> int:
+            return conn.execute(
+                "DELETE FROM k_search_verdicts WHERE user_id = ? AND EXISTS "
+                f"(SELECT 1 FROM json_each(k_search_verdicts.doc_hashes) WHERE value IN ({_placeholders(doc_hashes)}))",
+                (user_id, *doc_hashes)
+            ).rowcount
+
+        return await self.backend._transaction(delete)
+
+
+class EmbeddedMemoryBackend(MemoryBackend):
+    '''
+    Single-node storage in one local SQLite file (WAL mode), for deployments and tests without a Mongo server.
+
+    Records are stored as JSON with their lookup keys in indexed columns, and a side table holds one
+    row per (record, document) for the doc_hashes overlap lookups. The k_search retrieval index and
+    answer cache live in the same file. SQLite calls block, so every statement and transaction runs in
+    a worker thread (asyncio.to_thread) under the connection lock, keeping the event loop free.
+    '''
+    name = "embedded"
+
+    def __init__(self, path: str = STORAGE_PATH, scorer: Optional[Scorer] = None,
+                 min_score: Optional[float] = MIN_SCORE, max_candidates: int = MAX_CANDIDATES) -> None:
+        self.path = path
+        self.scorer = scorer or SCORERS[SCORER_NAME]()
+        self.min_score = min_score if min_score is not None else self.scorer.default_min_score
+        self.max_candidates = max_candidates
+        # Tables are per scorer so that switching scorer never mixes incompatible features
+        self._entries = f"k_search_entries_{self.scorer.name}"
+        self._postings = f"k_search_postings_{self.scorer.name}"
+        self._terms = f"k_search_terms_{self.scorer.name}"
+        self._summary = f"k_search_summary_{self.scorer.name}"
+        self.answer_cache = EmbeddedAnswerCache(self)
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    # Python's normalisation, so that focus areas match exactly as in the other backends
+                    conn.create_function("focus_area_key", 1, focus_area_key, deterministic=True)
+                    for statement in SCHEMA + self._retrieval_schema():
+                        conn.execute(statement)
+                    self._conn = conn
+        return self._conn
+
+    def _retrieval_schema(self) -> List[str]:
+        return [
+            f"""
+            CREATE TABLE IF NOT EXISTS {self._entries} (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                qa_id TEXT NOT NULL,
+                doc_hashes TEXT NOT NULL,
+                features TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                UNIQUE (user_id, qa_id)
+            )
+            """,
+            f"CREATE TABLE IF NOT EXISTS {self._postings} (user_id TEXT NOT NULL, term TEXT NOT NULL, entry_seq INTEGER NOT NULL)",
+            f"CREATE INDEX IF NOT EXISTS {self._postings}_lookup ON {self._postings} (user_id, term, entry_seq)",
+            f"CREATE TABLE IF NOT EXISTS {self._terms} (user_id TEXT NOT NULL, term TEXT NOT NULL, df INTEGER NOT NULL, PRIMARY KEY (user_id, term))",
+            f"""
+            CREATE TABLE IF NOT EXISTS {self._summary} (
+                user_id TEXT PRIMARY KEY,
+                doc_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL,
+                built INTEGER NOT NULL
+            )
+            """,
+        ]
+
+    def _query(self, sql: str, params: Tuple, one: bool) -> Any:
+        with self._lock:
+            cursor = self._connection().execute(sql, params)
+            return cursor.fetchone() if one else cursor.fetchall()
+
+    async def _fetchall(self, sql: str, params: Tuple = ()) -> List[tuple]:
+        return await asyncio.to_thread(self._query, sql, params, False)
+
+    async def _fetchone(self, sql: str, params: Tuple = ()) -> Optional[tuple]:
+        return await asyncio.to_thread(self._query, sql, params, True)
+
+    async def _transaction(self, body: Callable[[sqlite3.Connection], Any]) -> Any:
+        '''
+        Runs body(conn) in a worker thread, in one explicit transaction, and returns its result.
+        '''
+        def run() -> Any:
+            with _Transaction(self) as conn:
+                return body(conn)
+
+        return await asyncio.to_thread(run)
+
+    def _close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def init(self) -> None:
+        await asyncio.to_thread(self._connection)
+        print(f"Opened embedded memory store '{self.path}'")
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+
+    async def health(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await self._fetchone("SELECT 1")
+            ready = True
+            error = None
+        except Exception as e:
+            ready = False
+            error = str(e)
+        return {
+            "ready": ready,
+            "ping_ms": round((time.perf_counter() - started) * 1000, 2),
+            "error": error,
+            "path": self.path,
+        }
+
+    def new_id(self) -> str:
+        # Same width as an ObjectId
+        return secrets.token_hex(12)
+
+    async def list_user_ids(self) -> List[str]:
+        return [row[0] for row in await self._fetchall("SELECT DISTINCT user_id FROM memory ORDER BY user_id")]
+
+    async def ensure_indexes(self, user_id: str) -> List[str]:
+        '''The schema, indexes included, is created when the file is opened; returns the index names.'''
+        return [row[0] for row in await self._fetchall(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'memory' AND sql IS NOT NULL ORDER BY name"
+        )]
+
+    async def delete_user(self, user_id: str) -> None:
+        def delete(conn: sqlite3.Connection) -> None:
+            for table in ("memory", "memory_doc_hashes", "k_search_verdicts", "doc_sketches", "doc_sketch_bands", "doc_chunks", "doc_chunk_hashes",
+                          self._entries, self._postings, self._terms, self._summary):
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+        await self._transaction(delete)
+
+    def _decode(self, row: tuple) -> dict:
+        _id, timestamp, digest, doc_set_key, focus_set_key, query_key, record = row
+        doc = {"_id": _id, **json.loads(record), "content_digest": digest, "doc_set_key": doc_set_key}
+        if timestamp is not None:
+            doc["timestamp"] = datetime.fromisoformat(timestamp)
+        if focus_set_key is not None:
+            doc["focus_set_key"] = focus_set_key
+        if query_key is not None:
+            doc["query_key"] = query_key
+        return doc
+
+    async def _select(self, where: str, params: Tuple, limit: Optional[int] = None) -> List[dict]:
+        sql = (
+            "SELECT id, timestamp, content_digest, doc_set_key, focus_set_key, query_key, record "
+            f"FROM memory WHERE {where} ORDER BY seq"
+        )
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [self._decode(row) for row in await self._fetchall(sql, params)]
+
+    async def find_exact_set_match(self, user_id, agent, doc_hashes, focus_areas=None):
+        where = "user_id = ? AND agent = ? AND doc_set_key = ?"
+        params = (user_id, agent, set_key(doc_hashes))
+        if focus_areas is not None:
+            where += " AND focus_set_key = ?"
+            params += (set_key(focus_areas),)
+        matched = await self._select(where, params, limit=1)
+        return matched[0] if matched else None
+
+    def _doc_hashes_clause(self, doc_hashes: List[str], seq_column: str = "seq") -> str:
+        return (
+            f"{seq_column} IN (SELECT memory_seq FROM memory_doc_hashes WHERE user_id = ? AND agent = ? "
+            f"AND doc_hash IN ({_placeholders(doc_hashes)}))"
+        )
+
+    async def find_faq_candidates(self, user_id, agent, doc_hashes, focus_limits):
+        limits = {focus: limit for focus, limit in focus_limits.items() if limit > 0}
+        if not limits or not doc_hashes:
+            return {}
+        # RANK() is 1 + the number of better-ranked questions, so "<= limit" keeps every question tied with the last one
+        rows = await self._fetchall(
+            "WITH questions AS ("
+            "  SELECT focus_area_key(json_extract(q.value, '$.focus_area')) AS focus,"
+            "         COALESCE(json_extract(q.value, '$.rank'), 1000) AS rank, q.value AS question, m.seq, q.key AS position"
+            "  FROM memory m, json_each(m.record, '$.questions') q"
+            "  WHERE m.user_id = ? AND m.agent = ? AND " + self._doc_hashes_clause(doc_hashes, "m.seq") +
+            "), ranked AS ("
+            "  SELECT questions.*, RANK() OVER (PARTITION BY focus ORDER BY rank) AS rank_position"
+            "  FROM questions JOIN json_each(?) limits ON limits.key = questions.focus"
+            ") "
+            "SELECT focus, question FROM ranked JOIN json_each(?) limits ON limits.key = ranked.focus "
+            "WHERE rank_position <= limits.value ORDER BY focus, rank, seq, position",
+            (user_id, agent, user_id, agent, *doc_hashes, json.dumps(limits), json.dumps(limits))
+        )
+        candidates = {}
+        for focus, question in rows:
+            candidates.setdefault(focus, []).append(json.loads(question))
+        return candidates
+
+    async def find_k_search_exact(self, user_id, agent, query_key, doc_hashes):
+        if not doc_hashes:
+            return []
+        return await self._select(
+            "user_id = ? AND agent = ? AND query_key = ? AND " + self._doc_hashes_clause(doc_hashes),
+            (user_id, agent, query_key, user_id, agent, *doc_hashes)
+        )
+
+    async def find_by_ids(self, user_id, ids):
+        if not ids:
+            return []
+        return await self._select(f"user_id = ? AND id IN ({_placeholders(ids)})", (user_id, *ids))
+
+    async def existing_digests(self, user_id: str, records: List[dict]) -> Set[str]:
+        digests = sorted({r["content_digest"] for r in records})
+        return {row[0] for row in await self._fetchall(
+            f"SELECT content_digest FROM memory WHERE user_id = ? AND content_digest IN ({_placeholders(digests)})",
+            (user_id, *digests)
+        )}
+
+    async def find_merge_targets(self, user_id: str, records: List[dict]) -> List[dict]:
+        keys = sorted({key for key in (merge_key(r) for r in records) if key is not None})
+        if not keys:
+            return []
+        return await self._select(f"user_id = ? AND merge_key IN ({_placeholders(keys)})", (user_id, *keys))
+
+    def _record_json(self, doc: dict) -> str:
+        return json.dumps({k: v for k, v in doc.items() if k not in COLUMN_FIELDS}, default=str)
+
+    async def write_batch(self, user_id, inserts, faq_pushes, updated_docs):
+        def write(conn: sqlite3.Connection) -> List[bool]:
+            written = []
+            for r in inserts:
+                timestamp = r.get("timestamp")
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO memory (id, user_id, agent, content_digest, doc_set_key, focus_set_key, "
+                    "query_key, merge_key, timestamp, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        r["_id"], user_id, r["agent"], r["content_digest"], r["doc_set_key"], r.get("focus_set_key"),
+                        r.get("query_key"), merge_key(r), timestamp.isoformat() if timestamp else None, self._record_json(r)
+                    )
+                )
+                if not cursor.rowcount:
+                    # Stored concurrently (or earlier in this batch) with the same content
+                    written.append(False)
+                    continue
+                conn.executemany(
+                    "INSERT INTO memory_doc_hashes (user_id, agent, doc_hash, memory_seq) VALUES (?, ?, ?, ?)",
+                    [(user_id, r["agent"], doc_hash, cursor.lastrowid) for doc_hash in set(r.get("doc_hashes", []))]
+                )
+                written.append(True)
+            for _id, doc in updated_docs.items():
+                # The merged record already holds the pushed questions, so it is written whole
+                conn.execute(
+                    "UPDATE memory SET content_digest = ?, record = ? WHERE user_id = ? AND id = ?",
+                    (content_digest(doc), self._record_json(doc), user_id, _id)
+                )
+            return written
+
+        return await self._transaction(write)
+
+    async def save_doc_sketches(self, user_id, sketches):
+        if not sketches:
+            return
+
+        def write(conn: sqlite3.Connection) -> None:
+            doc_hashes = list(sketches)
+            conn.execute(
+                f"DELETE FROM doc_sketch_bands WHERE user_id = ? AND doc_hash IN ({_placeholders(doc_hashes)})",
+                (user_id, *doc_hashes)
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO doc_sketches (user_id, doc_hash, signature) VALUES (?, ?, ?)",
+                [(user_id, doc_hash, json.dumps(signature)) for doc_hash, (signature, _) in sketches.items()]
+            )
+            conn.executemany(
+                "INSERT INTO doc_sketch_bands (user_id, band_key, doc_hash) VALUES (?, ?, ?)",
+                [(user_id, key, doc_hash) for doc_hash, (_, keys) in sketches.items() for key in keys]
+            )
+
+        await self._transaction(write)
+
+    async def find_similar_docs(self, user_id, band_keys):
+        if not band_keys:
+            return {}
+        rows = await self._fetchall(
+            "SELECT doc_hash, signature FROM doc_sketches WHERE user_id = ? AND doc_hash IN "
+            f"(SELECT doc_hash FROM doc_sketch_bands WHERE user_id = ? AND band_key IN ({_placeholders(band_keys)}))",
+            (user_id, user_id, *band_keys)
+        )
+        return {doc_hash: json.loads(signature) for doc_hash, signature in rows}
+
+    async def save_doc_chunks(self, user_id, chunks):
+        if not chunks:
+            return
+
+        def write(conn: sqlite3.Connection) -> None:
+            doc_hashes = list(chunks)
+            conn.execute(
+                f"DELETE FROM doc_chunk_hashes WHERE user_id = ? AND doc_hash IN ({_placeholders(doc_hashes)})",
+                (user_id, *doc_hashes)
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO doc_chunks (user_id, doc_hash, chunks) VALUES (?, ?, ?)",
+                [(user_id, doc_hash, json.dumps(doc_chunks)) for doc_hash, doc_chunks in chunks.items()]
+            )
+            conn.executemany(
+                "INSERT INTO doc_chunk_hashes (user_id, chunk_hash, doc_hash) VALUES (?, ?, ?)",
+                [(user_id, chunk_hash, doc_hash) for doc_hash, doc_chunks in chunks.items()
+                 for chunk_hash in {chunk["hash"] for chunk in doc_chunks}]
+            )
+
+        await self._transaction(write)
+
+    async def find_docs_by_chunks(self, user_id, chunk_hashes):
+        chunk_hashes = list(set(chunk_hashes))
+        if not chunk_hashes:
+            return {}
+        found = {}
+        # Bounded batches keep each statement under SQLite's host-parameter limit
+        for start in range(0, len(chunk_hashes), 500):
+            batch = chunk_hashes[start:start + 500]
+            rows = await self._fetchall(
+                "SELECT doc_hash, chunks FROM doc_chunks WHERE user_id = ? AND doc_hash IN "
+                f"(SELECT doc_hash FROM doc_chunk_hashes WHERE user_id = ? AND chunk_hash IN ({_placeholders(batch)}))",
+                (user_id, user_id, *batch)
+            )
+            found.update((doc_hash, json.loads(doc_chunks)) for doc_hash, doc_chunks in rows)
+        return found
+
+    async def backfill_content_digests(self, user_id: str) -> Dict[str, int]:
+        # Records are always written with their digest
+        return {"updated": 0, "removed_duplicates": 0}
+
+    async def backfill_lookup_keys(self, user_id: str) -> int:
+        # Records are always written with their lookup keys, but the focus set key of focus areas that are not all
+        # strings changed when set_key began keying such values by their JSON with sorted keys
+        def rekey(conn: sqlite3.Connection) -> int:
+            updated = 0
+            rows = conn.execute(
+                "SELECT id, focus_set_key, record FROM memory WHERE user_id = ? AND focus_set_key IS NOT NULL", (user_id,)
+            ).fetchall()
+            for _id, focus_set_key, record in rows:
+                focus_areas = json.loads(record).get("focus_areas") or []
+                if all(isinstance(focus_area, str) for focus_area in focus_areas):
+                    continue
+                key = set_key(focus_areas)
+                if key != focus_set_key:
+                    conn.execute("UPDATE memory SET focus_set_key = ? WHERE id = ?", (key, _id))
+                    updated += 1
+            return updated
+
+        return await self._transaction(rekey)
+
+    async def _stats(self, user_id: str, terms: List[str]) -> IndexStats:
+        summary = await self._fetchone(f"SELECT doc_count, total_length FROM {self._summary} WHERE user_id = ?", (user_id,))
+        df = {}
+        terms = list(set(terms))
+        # Bounded batches keep each statement under SQLite's host-parameter limit
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            for term, n in await self._fetchall(
+                f"SELECT term, df FROM {self._terms} WHERE user_id = ? AND term IN ({_placeholders(batch)})",
+                (user_id, *batch)
+            ):
+                df[term] = n
+        return IndexStats(summary[0] if summary else 0, summary[1] if summary else 0, df)
+
+    def _add_entries(self, conn: sqlite3.Connection, user_id: str, items: List[Tuple[Any, str, List[str]]]) -> Tuple[Counter, int]:
+        df = Counter()
+        total_length = 0
+        for qa_id, query_text, doc_hashes in items:
+            features = self.scorer.features(query_text)
+            length = sum(features.values())
+            cursor = conn.execute(
+                f"INSERT INTO {self._entries} (user_id, qa_id, doc_hashes, features, length) VALUES (?, ?, ?, ?, ?)",
+                (user_id, qa_id, json.dumps(doc_hashes),
+                 json.dumps([{"t": term, "n": count} for term, count in features.items()]), length)
+            )
+            conn.executemany(
+                f"INSERT INTO {self._postings} (user_id, term, entry_seq) VALUES (?, ?, ?)",
+                [(user_id, term, cursor.lastrowid) for term in features]
+            )
+            df.update(features.keys())
+            total_length += length
+        return df, total_length
+
+    async def prepare_k_search(self, user_id: str) -> None:
+        '''Builds the user's retrieval index if it has never been built.'''
+        summary = await self._fetchone(f"SELECT built FROM {self._summary} WHERE user_id = ?", (user_id,))
+        if not summary or not summary[0]:
+            await self.rebuild_retrieval_index(user_id)
+
+    async def index_k_search(self, user_id, entries):
+        if not entries:
+            return
+
+        def write(conn: sqlite3.Connection) -> None:
+            df, total_length = self._add_entries(conn, user_id, entries)
+            conn.executemany(
+                f"INSERT INTO {self._terms} (user_id, term, df) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, term) DO UPDATE SET df = df + excluded.df",
+                [(user_id, term, n) for term, n in df.items()]
+            )
+            conn.execute(
+                f"INSERT INTO {self._summary} (user_id, doc_count, total_length, built) VALUES (?, ?, ?, 0) "
+                "ON CONFLICT (user_id) DO UPDATE SET doc_count = doc_count + excluded.doc_count, "
+                "total_length = total_length + excluded.total_length",
+                (user_id, len(entries), total_length)
+            )
+
+        await self._transaction(write)
+
+    async def rebuild_retrieval_index(self, user_id: str) -> int:
+        # The records are read in the rebuild's transaction, so Q&As indexed meanwhile cannot be dropped
+        def rebuild(conn: sqlite3.Connection) -> List[Tuple[Any, str, List[str]]]:
+            items = []
+            for _id, record in conn.execute(
+                "SELECT id, record FROM memory WHERE user_id = ? AND agent = 'k_search' ORDER BY seq", (user_id,)
+            ).fetchall():
+                record = json.loads(record)
+                items.append((_id, record.get("query_text") or "", record.get("doc_hashes", [])))
+            for table in (self._entries, self._postings, self._terms, self._summary):
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            df, total_length = self._add_entries(conn, user_id, items)
+            conn.executemany(
+                f"INSERT INTO {self._terms} (user_id, term, df) VALUES (?, ?, ?)",
+                [(user_id, term, n) for term, n in df.items()]
+            )
+            conn.execute(
+                f"INSERT INTO {self._summary} (user_id, doc_count, total_length, built) VALUES (?, ?, ?, 1)",
+                (user_id, len(items), total_length)
+            )
+            return items
+
+        items = await self._transaction(rebuild)
+        print(f"Rebuilt {self.scorer.name} retrieval index for {user_id}: {len(items)} Q&A(s)")
+        return len(items)
+
+    async def search_k_search(self, user_id, query_text, doc_hashes, top_k: int = TOP_K):
+        return (await self.search_k_search_many(user_id, [query_text], doc_hashes, top_k))[0]
+
+    async def search_k_search_many(self, user_id, query_texts, doc_hashes, top_k: int = TOP_K):
+        queries = [self.scorer.features(query_text) for query_text in query_texts]
+        query_terms = {term for query in queries for term in query}
+        if not query_terms or not doc_hashes:
+            return [[] for _ in queries]
+        query_stats = await self._stats(user_id, list(query_terms))
+        selected_terms = [select_terms(query, query_stats.df, self.max_candidates) for query in queries]
+        results = [[] for _ in queries]
+        for batch in candidate_batches(selected_terms, query_stats.df, self.max_candidates):
+            batch_terms = sorted({term for i in batch for term in selected_terms[i]})
+            rows = await self._fetchall(
+                f"SELECT qa_id, features, length FROM {self._entries} WHERE user_id = ? "
+                f"AND seq IN (SELECT entry_seq FROM {self._postings} WHERE user_id = ? AND term IN ({_placeholders(batch_terms)})) "
+                f"AND EXISTS (SELECT 1 FROM json_each(doc_hashes) WHERE value IN ({_placeholders(doc_hashes)})) "
+                "ORDER BY seq LIMIT ?",
+                (user_id, user_id, *batch_terms, *doc_hashes, self.max_candidates * len(batch))
+            )
+            if not rows:
+                continue
+            batch_queries = [queries[i] for i in batch]
+            candidates = [{"qa_id": qa_id, "features": json.loads(features), "length": length} for qa_id, features, length in rows]
+            candidate_terms = {item["t"] for entry in candidates for item in entry["features"]}
+            stats = await self._stats(user_id, list(candidate_terms | {term for query in batch_queries for term in query}))
+            hits = rank_candidates(self.scorer, batch_queries, candidates, stats, self.min_score, top_k,
+                                   [selected_terms[i] for i in batch])
+            for i, query_hits in zip(batch, hits):
+                results[i] = query_hits
+        return results
+
+class _Transaction:
+    '''
+    Holds the backend lock for the duration of an explicit transaction, committed on success and rolled back on error.
+    '''
+
+    def __init__(self, backend: EmbeddedMemoryBackend) -> None:
+        self.backend = backend
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.backend._lock.acquire()
+        try:
+            self.conn = self.backend._connection()
+            self.conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.backend._lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.backend._lock.release()
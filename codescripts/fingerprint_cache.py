@@ -0,0 +1,132 @@
+import configparser, json, sqlite3, threading, time
+from typing import Optional, Dict, Any, List
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+CACHE_PATH = config.get("FINGERPRINT_CACHE", "path", fallback="fingerprint_cache.sqlite3")
+MAX_ENTRIES = config.getint("FINGERPRINT_CACHE", "max_entries", fallback=100000)
+# Eviction needs a COUNT(*) so it is only checked every few writes
+EVICTION_CHECK_INTERVAL = 100
+
+
+class FingerprintCache:
+    '''
+    Persistent LRU cache mapping a document's source identity to the hash of its extracted text,
+    the token counts of that text under each tokenizer, its MinHash similarity signature and its
+    content-defined chunks.
+
+    A source identity is built from metadata that changes whenever the content does
+    (S3 bucket/key + ETag/VersionId, or local path + size + mtime), so a hit lets the
+    caller skip downloading and parsing the document altogether.
+    '''
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                source_key TEXT PRIMARY KEY,
+                text_hash TEXT NOT NULL,
+                text_length INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                token_counts TEXT NOT NULL DEFAULT '{}',
+                minhash TEXT NOT NULL DEFAULT '',
+                chunks TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(fingerprints)")]
+        if "token_counts" not in columns:
+            # Cache files created before token counts were stored
+            self._conn.execute("ALTER TABLE fingerprints ADD COLUMN token_counts TEXT NOT NULL DEFAULT '{}'")
+        if "minhash" not in columns:
+            # Cache files created before similarity signatures were stored
+            self._conn.execute("ALTER TABLE fingerprints ADD COLUMN minhash TEXT NOT NULL DEFAULT ''")
+        if "chunks" not in columns:
+            # Cache files created before chunks were stored
+            self._conn.execute("ALTER TABLE fingerprints ADD COLUMN chunks TEXT NOT NULL DEFAULT ''")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fingerprints_last_access ON fingerprints (last_access)"
+        )
+        self._evict()
+
+    @staticmethod
+    def s3_source_key(bucket: str, key: str, etag: str, version_id: Optional[str] = None) -> str:
+        return f"s3://{bucket}/{key}|etag={etag}|version={version_id or ''}"
+
+    @staticmethod
+    def local_source_key(path: str, size: int, mtime_ns: int) -> str:
+        return f"file://{path}|size={size}|mtime_ns={mtime_ns}"
+
+    def get(self, source_key: str) -> Optional[Dict[str, Any]]:
+        '''
+        Returns the cached fingerprint for the source and marks it as recently used, or None on a miss.
+        '''
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text_hash, text_length, token_counts, minhash, chunks FROM fingerprints WHERE source_key = ?",
+                (source_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE fingerprints SET last_access = ? WHERE source_key = ?",
+                (time.time(), source_key)
+            )
+        return {
+            "text_hash": row[0],
+            "text_length": row[1],
+            "token_counts": json.loads(row[2]),
+            "minhash": json.loads(row[3]) if row[3] else None,
+            "chunks": json.loads(row[4]) if row[4] else None
+        }
+
+    def put(self, source_key: str, text_hash: str, text_length: int, token_counts: Optional[Dict[str, int]] = None,
+            minhash: Optional[List[int]] = None, chunks: Optional[List[Dict[str, Any]]] = None) -> None:
+        '''
+        Stores the fingerprint for the source, evicting least recently used entries above the size cap.
+        '''
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (source_key, text_hash, text_length, last_access, token_counts, minhash, chunks) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source_key, text_hash, text_length, time.time(), json.dumps(token_counts or {}),
+                 json.dumps(minhash) if minhash else "", json.dumps(chunks) if chunks else "")
+            )
+            self._writes_since_check += 1
+            if self._writes_since_check >= EVICTION_CHECK_INTERVAL:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._writes_since_check = 0
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM fingerprints WHERE source_key IN "
+                "(SELECT source_key FROM fingerprints ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+            print(f"Evicted {excess} entries from fingerprint cache")
+
+
+_fingerprint_cache: Optional[FingerprintCache] = None
+_fingerprint_cache_lock = threading.Lock()
+
+
+def get_fingerprint_cache() -> FingerprintCache:
+    '''
+    Returns the process-wide fingerprint cache, opening it on first use.
+    '''
+    global _fingerprint_cache
+    if _fingerprint_cache is None:
+        with _fingerprint_cache_lock:
+            if _fingerprint_cache is None:
+                _fingerprint_cache = FingerprintCache()
+    return _fingerprint_cache
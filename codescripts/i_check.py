@@ -1,42 +1,49 @@
-import configparser, random, json
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from typing import List, Dict, Any
+import asyncio, random, json
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timezone
 from collections import defaultdict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from utils.prompts import K_SEARCH_PROMPT
-from utils.llm_utils import call_llm
+from utils.llm_utils import call_llm_async, FALLBACK_RESPONSE
+from utils.memory_keys import content_digest, lookup_keys, merge_key
+from codescripts.memory_backend import MemoryBackend, get_memory_backend
+from codescripts.answer_cache import AnswerCache
+from codescripts.result_cache import ResultCache, get_result_cache
+from codescripts.shared_memory import SharedMemory, get_shared_memory, match_strength
+from codescripts.similarity import band_keys, similarity, THRESHOLD as NEAR_MATCH_THRESHOLD
+from codescripts.chunking import chunk_coverage, MIN_COVERAGE as CHUNK_MIN_COVERAGE
+
+# Agents whose memory of a document can be reused for the chunks a changed version of it shares
+CHUNK_REUSE_AGENTS = ("faq_generator", "summariser", "doc_extractor")
 
 class MemoryManager:
-    def __init__(self):
-        config = configparser.ConfigParser()
-        config.read("config.ini")
-        mongo_uri = config.get("DB_DETAILS", "uri")
-        db_name = config.get("DB_DETAILS", "db")
-
-        self.client = MongoClient(mongo_uri)
-        self.db = self.client[db_name]
-
-    def _remove_meta_fields(self, doc: dict) -> dict:
-        """Remove metadata fields (_id and timestamp) for comparison."""
-        return {k: v for k, v in doc.items() if k not in ["_id", "timestamp"]}
+    def __init__(
+        self,
+        backend: Optional[MemoryBackend] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        result_cache: Optional[ResultCache] = None,
+        shared_memory: Optional[SharedMemory] = None
+    ):
+        # Defaults to the process-wide backend selected by [STORAGE] backend
+        self.backend = backend if backend is not None else get_memory_backend()
+        self.answer_cache = answer_cache if answer_cache is not None else self.backend.answer_cache
+        self.result_cache = result_cache if result_cache is not None else get_result_cache()
+        self.shared_memory = shared_memory if shared_memory is not None else get_shared_memory()
+
+    async def ensure_indexes(self, user_id: str) -> List[str]:
+        """Create the storage indexes for a user's memory (no-op for indexes that already exist)."""
+        return await self.backend.ensure_indexes(user_id)
 
     def _questions_equal(self, q1: dict, q2: dict) -> bool:
         return q1 == q2
 
-    def save_memory_content(
+    def _build_response_obj(
         self,
-        user_id: str,
         agent: str,
         doc_hashes: List[str],
         processed_params: Dict[str, Any],
         provided_response: Dict[str, Any]
     ) -> Dict[str, Any]:
-
-        collection: Collection = self.db[user_id]
-
+        """Build the memory record for an agent response, including its content digest and lookup keys."""
         # Build response_obj based on agent type
         if agent.lower() == "faq_generator":
             response_obj = {
@@ -78,92 +85,508 @@ class MemoryManager:
         else:
             raise ValueError(f"Unsupported agent type: {agent}")
 
-        # Check for full duplication (ignoring _id and timestamp)
-        all_docs = list(collection.find({"agent": agent}))
-        for doc in all_docs:
-            if self._remove_meta_fields(doc) == self._remove_meta_fields(response_obj):
-                return "Not re-inserted since duplicate found"
-
-        # FAQ-specific logic for updating if primary keys match but content differs
-        if agent.lower() == "faq_generator":
-            existing_doc = collection.find_one({
-                "agent": agent,
-                "doc_hashes": doc_hashes,
-                "parameters": processed_params
-            })
-
-            if existing_doc:
-                # Only add non-duplicate questions
-                existing_questions = existing_doc.get("questions", [])
-                new_questions = response_obj["questions"]
+        response_obj["content_digest"] = content_digest(response_obj)
+        response_obj.update(lookup_keys(response_obj))
+        return response_obj
+
+    def _new_faq_questions(self, existing_questions: List[dict], new_questions: List[dict]) -> List[dict]:
+        """Questions from new_questions that are not already stored."""
+        return [
+            q for q in new_questions if all(not self._questions_equal(q, eq) for eq in existing_questions)
+        ]
+
+    def _merge_entity_tables(self, existing_table: List[dict], new_table: List[dict]) -> List[dict]:
+        """Merge entity values by case-insensitive entity type, without duplicates."""
+        updated_table_map = {
+            entry["entity_type"].strip().lower(): set(entry.get("values", []))
+            for entry in existing_table
+        }
+
+        # Merge logic
+        for entry in new_table:
+            etype = entry["entity_type"].strip().lower()
+            new_values = set(entry.get("values", []))
+
+            if etype in updated_table_map:
+                updated_table_map[etype].update(new_values)
+            else:
+                updated_table_map[etype] = new_values
 
-                unique_new_questions = [
-                    q for q in new_questions if all(not self._questions_equal(q, eq) for eq in existing_questions)
-                ]
+        # Reconstruct entity_table with no duplicates
+        return [
+            {
+                "entity_type": etype,
+                "values": sorted(list(values))  # Optional: sorted for consistency
+            }
+            for etype, values in updated_table_map.items()
+        ]
 
+    async def save_memory_content(
+        self,
+        user_id: str,
+        agent: str,
+        doc_hashes: List[str],
+        processed_params: Dict[str, Any],
+        provided_response: Dict[str, Any],
+        doc_sketches: Optional[Dict[str, List[int]]] = None,
+        doc_chunks: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> Dict[str, Any]:
+        # A batch of one, so that single and batch saves share one code path on every backend
+        outcome = (await self.save_memory_contents(
+            user_id, [(agent, doc_hashes, processed_params, provided_response)], doc_sketches, doc_chunks
+        ))[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def save_memory_contents(
+        self,
+        user_id: str,
+        items: List[Tuple[str, List[str], Dict[str, Any], Dict[str, Any]]],
+        doc_sketches: Optional[Dict[str, List[int]]] = None,
+        doc_chunks: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> List[Any]:
+        """
+        Save many (agent, doc_hashes, processed_params, provided_response) items for one user with a single backend write.
+
+        Stored state is prefetched in two lookups and the items are applied to it in order in memory, so an item
+        sees the effect of the ones before it exactly as consecutive save_memory_content calls would. The outcome of
+        each item is the message save_memory_content would have returned, or the exception that rejected it.
+        doc_sketches (MinHash signatures by document hash) are stored for near-duplicate matching of later lookups,
+        and doc_chunks (content-defined chunks by document hash) for chunk-level reuse.
+        """
+        outcomes: List[Any] = [None] * len(items)
+        records = []
+        for index, (agent, doc_hashes, processed_params, provided_response) in enumerate(items):
+            try:
+                records.append((index, self._build_response_obj(agent, doc_hashes, processed_params, provided_response)))
+            except Exception as e:
+                outcomes[index] = e
+        if not records:
+            return outcomes
+
+        # Prefetch: stored digests, and the records later items may merge into
+        seen_digests = await self.backend.existing_digests(user_id, [r for _, r in records])
+        merge_targets = {}
+        for doc in await self.backend.find_merge_targets(user_id, [r for _, r in records]):
+            # The first match wins, as with find_one()
+            merge_targets.setdefault(merge_key(doc), doc)
+
+        inserts = []  # (item index, record)
+        faq_pushes = {}  # _id of stored FAQ record -> questions to push
+        updated_docs = {}  # _id of stored record -> record with its merged content
+        for index, r in records:
+            if r["content_digest"] in seen_digests:
+                outcomes[index] = "Not re-inserted since duplicate found"
+                continue
+
+            agent = r["agent"].lower()
+            target = merge_targets.get(merge_key(r))
+            if target is not None and agent == "faq_generator":
+                existing_questions = target.get("questions", [])
+                unique_new_questions = self._new_faq_questions(existing_questions, r["questions"])
                 if unique_new_questions:
-                    collection.update_one(
-                        {"_id": existing_doc["_id"]},
-                        {"$push": {"questions": {"$each": unique_new_questions}}}
-                    )
-                    return f"Updated existing FAQ memory with {len(unique_new_questions)} new question(s)."
-
+                    seen_digests.discard(content_digest(target))
+                    target["questions"] = existing_questions + unique_new_questions
+                    seen_digests.add(content_digest(target))
+                    if "_id" in target:
+                        faq_pushes.setdefault(target["_id"], []).extend(unique_new_questions)
+                        updated_docs[target["_id"]] = target
+                    outcomes[index] = f"Updated existing FAQ memory with {len(unique_new_questions)} new question(s)."
                 else:
-                    return "No new questions to add to existing FAQ memory."
-        
-        # Doc Extractor logic: merge entities if primary keys match (agent + doc_hashes)
-        if agent.lower() == "doc_extractor":
-            existing_doc = collection.find_one({
-                "agent": agent,
-                "doc_hashes": doc_hashes
-            })
-
-            if existing_doc:
-                existing_table = existing_doc.get("entity_table", [])
-                new_table = response_obj["entity_table"]
-
-                updated_table_map = {
-                    entry["entity_type"].strip().lower(): set(entry.get("values", []))
-                    for entry in existing_table
-                }
-
-                # Merge logic
-                for entry in new_table:
-                    etype = entry["entity_type"].strip().lower()
-                    new_values = set(entry.get("values", []))
-
-                    if etype in updated_table_map:
-                        updated_table_map[etype].update(new_values)
-                    else:
-                        updated_table_map[etype] = new_values
-
-                # Reconstruct entity_table with no duplicates
-                merged_entity_table = [
-                    {
-                        "entity_type": etype,
-                        "values": sorted(list(values))  # Optional: sorted for consistency
-                    }
-                    for etype, values in updated_table_map.items()
-                ]
-
-                collection.update_one(
-                    {"_id": existing_doc["_id"]},
-                    {"$set": {"entity_table": merged_entity_table}}
-                )
-                return f"Updated existing Doc Extractor memory with merged entity data."
-
-        # Insert new entry if not duplicate or not updatable
-        result = collection.insert_one(response_obj)
-        return f"Inserted object with ID: {str(result.inserted_id)}"
-
-    def get_memory_content(
+                    outcomes[index] = "No new questions to add to existing FAQ memory."
+                continue
+
+            if target is not None and agent == "doc_extractor":
+                seen_digests.discard(content_digest(target))
+                target["entity_table"] = self._merge_entity_tables(target.get("entity_table", []), r["entity_table"])
+                seen_digests.add(content_digest(target))
+                if "_id" in target:
+                    updated_docs[target["_id"]] = target
+                outcomes[index] = f"Updated existing Doc Extractor memory with merged entity data."
+                continue
+
+            # New record; later items in the batch may still merge into it before it is written
+            seen_digests.add(r["content_digest"])
+            inserts.append((index, r))
+            if agent in ("faq_generator", "doc_extractor"):
+                merge_targets[merge_key(r)] = r
+
+        for _, r in inserts:
+            r["_id"] = self.backend.new_id()
+            r["content_digest"] = content_digest(r)
+
+        if any(r["agent"].lower() == "k_search" for _, r in inserts):
+            await self.backend.prepare_k_search(user_id)
+
+        written = await self.backend.write_batch(user_id, [r for _, r in inserts], faq_pushes, updated_docs)
+
+        # Cached lookups over the memory written here are stale from now on
+        for doc in [r for (_, r), inserted in zip(inserts, written) if inserted] + list(updated_docs.values()):
+            await self.result_cache.invalidate(user_id, doc["agent"], doc["doc_hashes"])
+
+        k_search_entries = []
+        for (index, r), inserted in zip(inserts, written):
+            if not inserted:
+                outcomes[index] = "Not re-inserted since duplicate found"
+                continue
+            outcomes[index] = f"Inserted object with ID: {str(r['_id'])}"
+            if r["agent"].lower() == "k_search":
+                k_search_entries.append((r["_id"], r.get("query_text") or "", r["doc_hashes"]))
+
+        if k_search_entries:
+            await self.backend.index_k_search(user_id, k_search_entries)
+            # Cached answerability verdicts for these documents were judged without these Q&As
+            await self.answer_cache.invalidate(user_id, sorted({h for _, _, hashes in k_search_entries for h in hashes}))
+
+        if doc_sketches:
+            await self._save_doc_sketches(user_id, {h for _, r in records for h in r["doc_hashes"]}, doc_sketches)
+
+        if doc_chunks:
+            await self._save_doc_chunks(user_id, {h for _, r in records for h in r["doc_hashes"]}, doc_chunks)
+
+        if self.shared_memory.participates(user_id):
+            await self._contribute_to_shared([item for item, outcome in zip(items, outcomes) if not isinstance(outcome, Exception)])
+        return outcomes
+
+    async def _save_doc_sketches(self, user_id: str, doc_hashes: set, doc_sketches: Dict[str, List[int]]) -> None:
+        """Store the similarity signatures of the saved documents; a failure only costs near matches, not the save."""
+        sketches = {h: (doc_sketches[h], band_keys(doc_sketches[h])) for h in sorted(doc_hashes) if doc_sketches.get(h)}
+        try:
+            await self.backend.save_doc_sketches(user_id, sketches)
+        except Exception as e:
+            print(f"Exception in MemoryManager._save_doc_sketches(): {e}")
+
+    async def _save_doc_chunks(self, user_id: str, doc_hashes: set, doc_chunks: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Store the chunks of the saved documents; a failure only costs chunk-level reuse, not the save."""
+        chunks = {h: doc_chunks[h] for h in sorted(doc_hashes) if doc_chunks.get(h)}
+        try:
+            await self.backend.save_doc_chunks(user_id, chunks)
+        except Exception as e:
+            print(f"Exception in MemoryManager._save_doc_chunks(): {e}")
+
+    async def _contribute_to_shared(self, items: List[Tuple[str, List[str], Dict[str, Any], Dict[str, Any]]]) -> None:
+        """
+        Save a participating tenant's items to the shared tier too; its failures do not fail the tenant's own save.
+        Document sketches and chunks are not shared, since the shared tier is only looked up exactly.
+        """
+        if not items:
+            return
+        try:
+            outcomes = await self.save_memory_contents(self.shared_memory.user_id, items)
+            self.shared_memory.count("contributions", sum(1 for outcome in outcomes if not isinstance(outcome, Exception)))
+        except Exception as e:
+            print(f"Exception in MemoryManager._contribute_to_shared(): {e}")
+            self.shared_memory.count("errors")
+
+    async def backfill_content_digests(self, user_id: str) -> Dict[str, int]:
+        """
+        Migration: compute content digests for a user's records saved before digests existed.
+        Exact duplicates found along the way are removed, keeping the oldest.
+        """
+        return await self.backend.backfill_content_digests(user_id)
+
+    async def backfill_lookup_keys(self, user_id: str) -> int:
+        """Migration: add doc-set/focus-set/query keys to a user's records saved before they existed."""
+        return await self.backend.backfill_lookup_keys(user_id)
+
+    async def rebuild_retrieval_index(self, user_id: str) -> int:
+        """Rebuild the user's k_search retrieval index from their stored records."""
+        return await self.backend.rebuild_retrieval_index(user_id)
+
+    async def get_memory_contents(
+        self,
+        user_id: str,
+        doc_hashes: List[str],
+        checks: List[Tuple[str, Dict[str, Any]]],
+        doc_sketches: Optional[Dict[str, List[int]]] = None,
+        doc_chunks: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> List[Any]:
+        """
+        Run several agent lookups against the same documents concurrently.
+        Results are returned in the order of the checks; a check that fails is returned as its exception.
+        With several k_search checks, their retrieval searches are run up front as one batch.
+        """
+        k_search_hits = await self._search_k_search_batch(user_id, doc_hashes, checks)
+        return await asyncio.gather(
+            *(self.get_memory_content(user_id, agent, doc_hashes, params, doc_sketches, doc_chunks, k_search_hits) for agent, params in checks),
+            return_exceptions=True
+        )
+
+    async def _search_k_search_batch(
+        self,
+        user_id: str,
+        doc_hashes: List[str],
+        checks: List[Tuple[str, Dict[str, Any]]]
+    ) -> Optional[Dict[str, List[Tuple[Any, float]]]]:
+        """
+        Retrieval hits, by normalised query text, of the k_search checks of a batch, scored together in one matrix
+        product; None for fewer than two distinct queries, or if the batch search fails (each check then searches alone).
+        """
+        query_texts = list(dict.fromkeys(
+            params.get("query_text", "").strip().lower()
+            for agent, params in checks
+            if agent.lower().startswith("k_search") and params.get("query_text", "").strip()
+        ))
+        if len(query_texts) < 2:
+            return None
+        try:
+            await self.backend.prepare_k_search(user_id)
+            hits = await self.backend.search_k_search_many(user_id, query_texts, doc_hashes)
+        except Exception as e:
+            print(f"Exception in MemoryManager._search_k_search_batch(): {e}")
+            return None
+        return dict(zip(query_texts, hits))
+
+    async def get_memory_content(
         self,
         user_id: str,
         agent: str,
         doc_hashes: List[str],
-        processed_params: Dict[str, Any]
+        processed_params: Dict[str, Any],
+        doc_sketches: Optional[Dict[str, List[int]]] = None,
+        doc_chunks: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        k_search_hits: Optional[Dict[str, List[Tuple[Any, float]]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Look up stored memory for an agent request: the user's own memory first, then, for tenants taking part in the
+        shared tier and without a full match of their own, the shared tier. A result served from the shared tier is
+        marked with "memory_tier": "shared". In the user's own memory, documents without a full match may be matched
+        to near-duplicates by their doc_sketches (see _near_match_lookup), or to earlier versions sharing most of their
+        doc_chunks (see _chunk_match_lookup). The shared tier is only looked up exactly: a near or chunk-level match
+        there would serve one tenant's memory of a document for another tenant's different document. k_search_hits
+        are retrieval hits for these documents already searched for the user's own memory (see _search_k_search_batch).
+        """
+        result = await self._tier_lookup(user_id, agent, doc_hashes, processed_params, doc_sketches, doc_chunks, k_search_hits)
+        if result["i_check_result"] == "Full Match" or not self.shared_memory.participates(user_id):
+            return result
+
+        try:
+            shared_result = await self._cached_lookup(self.shared_memory.user_id, agent, doc_hashes, processed_params)
+        except Exception as e:
+            print(f"Exception in MemoryManager.get_memory_content() shared tier lookup: {e}")
+            self.shared_memory.count("errors")
+            return result
+        self.shared_memory.count("lookups")
+        if not self.shared_memory.prefer(result, shared_result):
+            return result
+        self.shared_memory.count("hits")
+        shared_result["memory_tier"] = "shared"
+        return shared_result
+
+    async def _tier_lookup(
+        self,
+        user_id: str,
+        agent: str,
+        doc_hashes: List[str],
+        processed_params: Dict[str, Any],
+        doc_sketches: Optional[Dict[str, List[int]]],
+        doc_chunks: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        k_search_hits: Optional[Dict[str, List[Tuple[Any, float]]]] = None
+    ) -> Dict[str, Any]:
+        """The exact lookup of one user's memory, replaced by a near or chunk-level match if that matches better."""
+        result = await self._cached_lookup(user_id, agent, doc_hashes, processed_params, k_search_hits)
+        if result["i_check_result"] == "Full Match":
+            return result
+        for lookup, features in ((self._near_match_lookup, doc_sketches), (self._chunk_match_lookup, doc_chunks)):
+            if not features:
+                continue
+            try:
+                other_result = await lookup(user_id, agent, doc_hashes, processed_params, features)
+            except Exception as e:
+                print(f"Exception in MemoryManager.{lookup.__name__}(): {e}")
+                continue
+            if other_result is not None and match_strength(other_result) > match_strength(result):
+                result = other_result
+        return result
+
+    async def _near_match_lookup(
+        self,
+        user_id: str,
+        agent: str,
+        doc_hashes: List[str],
+        processed_params: Dict[str, Any],
+        doc_sketches: Dict[str, List[int]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Repeat the lookup with every requested document that has no memory of its own replaced by its most similar
+        stored document, if their estimated similarity reaches [SIMILARITY] threshold. Candidates come from the LSH
+        band index, so the cost does not grow with the number of stored documents.
+
+        Returns:
+        dict: The result of the repeated lookup as a "Near Match", with "near_match" holding its own i_check_result,
+        the lowest similarity of the substituted documents and the substitutions; None if nothing could be substituted
+        or the repeated lookup found nothing.
+        """
+        substitutes = {}
+        similarities = {}
+        for doc_hash in dict.fromkeys(doc_hashes):
+            signature = doc_sketches.get(doc_hash)
+            if not signature:
+                continue
+            candidates = await self.backend.find_similar_docs(user_id, band_keys(signature))
+            # A document with memory of its own is kept
+            if doc_hash in candidates or not candidates:
+                continue
+            score, best = max((similarity(signature, other), candidate) for candidate, other in candidates.items())
+            if score >= NEAR_MATCH_THRESHOLD:
+                substitutes[doc_hash] = best
+                similarities[doc_hash] = score
+        if not substitutes:
+            return None
+
+        near_hashes = list(dict.fromkeys(substitutes.get(doc_hash, doc_hash) for doc_hash in doc_hashes))
+        result = await self._cached_lookup(user_id, agent, near_hashes, processed_params)
+        if result["i_check_result"] == "No Match":
+            return None
+        result["near_match"] = {
+            "i_check_result": result["i_check_result"],
+            "similarity": round(min(similarities.values()), 4),
+            "documents": substitutes
+        }
+        result["i_check_result"] = "Near Match"
+        return result
+
+    async def _chunk_match_lookup(
+        self,
+        user_id: str,
+        agent: str,
+        doc_hashes: List[str],
+        processed_params: Dict[str, Any],
+        doc_chunks: Dict[str, List[Dict[str, Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Repeat the lookup with every requested document that has no memory of its own replaced by the stored document
+        it shares most chunks with (an earlier version, before an appendix was added), if their common chunks make up
+        at least [CHUNKING] min_coverage of both. Candidates come from the chunk hash index.
+
+        Returns:
+        dict: A "Partial Match" with the memory of the repeated lookup, if that was a full match; processing_content
+        holds the whole request in the agent's usual shape, to be run over the chunks left to process, and "chunk_plan"
+        those chunks: by requested document, the stored document reused ("reused_from"), the indices of its chunks the
+        memory covers ("covered") and the chunks it does not ("uncovered", with their offsets in the normalised text).
+        None if nothing could be substituted or the memory does not fully match.
+        """
+        if not agent.lower().startswith(CHUNK_REUSE_AGENTS):
+            return None
+        substitutes = {}
+        chunk_plan = {}
+        for doc_hash in dict.fromkeys(doc_hashes):
+            chunks = doc_chunks.get(doc_hash)
+            if not chunks:
+                continue
+            candidates = await self.backend.find_docs_by_chunks(user_id, [chunk["hash"] for chunk in chunks])
+            # A document with memory of its own is kept
+            if doc_hash in candidates or not candidates:
+                continue
+            # Memory of a document that lost most of its content would mostly describe text that is gone
+            scored = [
+                (chunk_coverage(chunks, stored_chunks), candidate)
+                for candidate, stored_chunks in candidates.items()
+                if chunk_coverage(stored_chunks, chunks) >= CHUNK_MIN_COVERAGE
+            ]
+            if not scored:
+                continue
+            coverage, best = max(scored)
+            if coverage < CHUNK_MIN_COVERAGE:
+                continue
+            stored_hashes = {chunk["hash"] for chunk in candidates[best]}
+            substitutes[doc_hash] = best
+            chunk_plan[doc_hash] = {
+                "reused_from": best,
+                "covered": [index for index, chunk in enumerate(chunks) if chunk["hash"] in stored_hashes],
+                "uncovered": [{"index": index, **chunk} for index, chunk in enumerate(chunks) if chunk["hash"] not in stored_hashes]
+            }
+        if not substitutes:
+            return None
+
+        reused_hashes = list(dict.fromkeys(substitutes.get(doc_hash, doc_hash) for doc_hash in doc_hashes))
+        result = await self._cached_lookup(user_id, agent, reused_hashes, processed_params)
+        if result["i_check_result"] != "Full Match":
+            return None
+        return {
+            "i_check_result": "Partial Match",
+            "memory_content": result["memory_content"],
+            "processing_content": self._request_processing_content(agent, processed_params),
+            "chunk_plan": chunk_plan
+        }
+
+    def _request_processing_content(self, agent: str, processed_params: Dict[str, Any]) -> Any:
+        """The processing_content of the whole request, in the shape the agent's own lookup gives when nothing matches."""
+        if agent.lower().startswith("faq"):
+            focus_areas = processed_params.get("focus_areas", []) or [""]
+            split_map = self._split_question_count(focus_areas, processed_params.get("question_count", 0))
+            return [{"focus_areas": [fa], "question_count": split_map[fa]} for fa in focus_areas]
+        elif agent.lower().startswith("summariser"):
+            return {
+                "focus_areas": processed_params.get("focus_areas", []) or [],
+                "compression_ratio": processed_params.get("compression_ratio")
+            }
+        return {"entity_list": processed_params.get("entity_list", [])}
+
+    def _split_question_count(self, focus_areas: List[str], total_required: int) -> Dict[str, int]:
+        """Split the requested question count evenly over the focus areas, randomly distributing the odd remainder."""
+        per_focus_required = total_required // len(focus_areas)
+        remainder = total_required % len(focus_areas)
+        indices = list(range(len(focus_areas)))
+        random.shuffle(indices)
+        return {
+            fa: per_focus_required + (1 if idx in indices[:remainder] else 0)
+            for idx, fa in enumerate(focus_areas)
+        }
+
+    async def _cached_lookup(
+        self,
+        user_id: str,
+        agent: str,
+        doc_hashes: List[str],
+        processed_params: Dict[str, Any],
+        k_search_hits: Optional[Dict[str, List[Tuple[Any, float]]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Look up one user's stored memory, serving repeats of the same lookup from the result cache.
+        FAQ selection is random, so for FAQ only the candidate questions are cached and the selection runs every time.
+        """
+        if agent.lower().startswith("faq"):
+            return await self._lookup_memory_content(user_id, agent, doc_hashes, processed_params)
+
+        cache_key = await self.result_cache.key(user_id, agent, doc_hashes, processed_params)
+        if cache_key is not None:
+            cached = await self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        result = await self._lookup_memory_content(user_id, agent, doc_hashes, processed_params, k_search_hits)
+        # A k_search miss may come from a failed LLM call, so it is retried (answered verdicts are in the answer cache)
+        if cache_key is not None and not (agent.lower().startswith("k_search") and result["i_check_result"] == "No Match"):
+            await self.result_cache.put(cache_key, result)
+        return result
+
+    async def _faq_candidates(self, user_id: str, agent: str, doc_hashes: List[str], focus_limits: Dict[str, int]) -> Dict[str, List[dict]]:
+        """
+        Best-ranked stored questions per focus area of FAQ records sharing a document (see MemoryBackend.find_faq_candidates),
+        cached until one of those documents gets new FAQ memory. The candidates are deterministic; the random choice among
+        tied questions is made by the caller.
+        """
+        cache_key = await self.result_cache.key(user_id, agent, doc_hashes, {"focus_limits": focus_limits})
+        if cache_key is not None:
+            cached = await self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        candidates = await self.backend.find_faq_candidates(user_id, agent, doc_hashes, focus_limits)
+
+        if cache_key is not None:
+            await self.result_cache.put(cache_key, candidates)
+        return candidates
+
+    async def _lookup_memory_content(
+        self,
+        user_id: str,
+        agent: str,
+        doc_hashes: List[str],
+        processed_params: Dict[str, Any],
+        k_search_hits: Optional[Dict[str, List[Tuple[Any, float]]]] = None
     ) -> Dict[str, Any]:
-        collection = self.db[user_id]
         if agent.lower().startswith("faq"):
             focus_areas = processed_params.get("focus_areas", [])
             total_required = processed_params.get("question_count", 0)
@@ -172,34 +595,19 @@ class MemoryManager:
             if not focus_areas:
                 focus_areas = [""]  # target blank focus area questions only
 
-            # Find memory entries with overlapping document hashes
-            matched_docs = list(collection.find({
-                "agent": agent,
-                "doc_hashes": {"$in": doc_hashes}
-            }))
-
-            # Flatten all questions from matched docs
-            all_questions = []
-            for doc in matched_docs:
-                all_questions.extend(doc.get("questions", []))
+            # Only the best-ranked questions a focus area can need are fetched: the per-focus share rounded up
+            max_needed = -(-total_required // len(focus_areas))
+            candidates = await self._faq_candidates(
+                user_id, agent, doc_hashes, {req_focus.lower(): max_needed for req_focus in focus_areas}
+            )
 
-            # Bucket questions by focus area
+            # Bucket questions by focus area (a fresh copy, since the selection below re-ranks them in place)
             focus_area_buckets = defaultdict(list)
-            for q in all_questions:
-                fa = q.get("focus_area", "").strip().lower()
-                for req_focus in focus_areas:
-                    if fa == req_focus.lower():
-                        focus_area_buckets[req_focus].append(q)
-
-            # Randomly distribute odd remainder
-            per_focus_required = total_required // len(focus_areas)
-            remainder = total_required % len(focus_areas)
-            indices = list(range(len(focus_areas)))
-            random.shuffle(indices)
-            split_map = {
-                fa: per_focus_required + (1 if idx in indices[:remainder] else 0)
-                for idx, fa in enumerate(focus_areas)
-            }
+            for req_focus in focus_areas:
+                for q in candidates.get(req_focus.lower(), []):
+                    focus_area_buckets[req_focus].append(q)
+
+            split_map = self._split_question_count(focus_areas, total_required)
 
             selected_questions = []
             processing_plan = []
@@ -268,11 +676,7 @@ class MemoryManager:
             focus_areas_key = focus_areas if focus_areas else []
 
             # Match only documents with exact doc_hashes and focus_areas
-            matched_doc = collection.find_one({
-                "agent": "summariser",
-                "doc_hashes": {"$all": doc_hashes, "$size": len(doc_hashes)},
-                "focus_areas": {"$all": focus_areas_key, "$size": len(focus_areas_key)}
-            })
+            matched_doc = await self.backend.find_exact_set_match(user_id, "summariser", doc_hashes, focus_areas_key)
 
             if not matched_doc:
                 return {
@@ -333,10 +737,10 @@ class MemoryManager:
             if not query_text:
                 raise ValueError("Missing 'query_text' in parameters for k_search")
 
-            matched_docs = list(collection.find({
-                "agent": agent,
-                "doc_hashes": {"$in": doc_hashes}
-            }))
+            await self.backend.prepare_k_search(user_id)
+
+            # Exact match check — question and sources count must match
+            matched_docs = await self.backend.find_k_search_exact(user_id, agent, query_text, doc_hashes)
 
             qas = []
             for doc in matched_docs:
@@ -346,7 +750,6 @@ class MemoryManager:
                     "sources": doc.get("sources", "")  
                 })
 
-            # Exact match check — question and sources count must match
             for qa in qas:
                 if (
                     query_text == qa["query_text"].strip().lower()
@@ -361,15 +764,22 @@ class MemoryManager:
                         "processing_content": {}
                     }
 
-            # Fast semantic search using TF-IDF
-            corpus = [qa["query_text"] for qa in qas]
-            tfidf = TfidfVectorizer().fit(corpus + [query_text])
-            vecs = tfidf.transform(corpus)
-            query_vec = tfidf.transform([query_text])
-            sims = cosine_similarity(query_vec, vecs).flatten()
-            top_indices = sims.argsort()[-10:][::-1]
-
-            relevant_qas = [qas[i] for i in top_indices if sims[i] > 0.1]
+            # Fast semantic search over the persisted retrieval index
+            if k_search_hits is not None and query_text in k_search_hits:
+                hits = k_search_hits[query_text]
+            else:
+                hits = await self.backend.search_k_search(user_id, query_text, doc_hashes)
+            hit_docs = await self.backend.find_by_ids(user_id, [qa_id for qa_id, _ in hits])
+            docs_by_id = {doc["_id"]: doc for doc in hit_docs}
+            context_ids = [qa_id for qa_id, _ in hits if qa_id in docs_by_id]
+            relevant_qas = [
+                {
+                    "query_text": docs_by_id[qa_id].get("query_text", ""),
+                    "response": docs_by_id[qa_id].get("response", ""),
+                    "sources": docs_by_id[qa_id].get("sources", "")
+                }
+                for qa_id in context_ids
+            ]
             print(f"Found relevant QAs based on semantic search: {(relevant_qas)}")
             if not relevant_qas:
                 return {
@@ -389,7 +799,16 @@ class MemoryManager:
                 context_text=context_text
             )
 
-            llm_response = call_llm(prompt).strip()
+            # Reuse the verdict if this query was already judged against the same context
+            cache_key = self.answer_cache.key(user_id, query_text, doc_hashes, context_ids)
+            llm_response = await self.answer_cache.get(cache_key)
+            if llm_response is None:
+                llm_response = (await call_llm_async(prompt)).strip()
+                # Failed calls are not cached so that they are retried
+                if llm_response != FALLBACK_RESPONSE:
+                    await self.answer_cache.put(cache_key, user_id, doc_hashes, llm_response)
+            else:
+                print("Answerability verdict served from cache")
             try:
                 parsed = json.loads(llm_response)
                 if parsed.get("answerable") is True and parsed.get("answer"):
@@ -413,10 +832,7 @@ class MemoryManager:
             requested_entities = processed_params.get("entity_list", [])
 
             # Find memory doc with exact doc_hashes
-            matched_doc = collection.find_one({
-                "agent": "doc_extractor",
-                "doc_hashes": {"$all": doc_hashes, "$size": len(doc_hashes)}
-            })
+            matched_doc = await self.backend.find_exact_set_match(user_id, "doc_extractor", doc_hashes)
 
             if not matched_doc:
                 return {
@@ -481,4 +897,15 @@ class MemoryManager:
             }
 
         else:
-            raise ValueError(f"Unsupported agent: {agent}")
\ No newline at end of file
+            raise ValueError(f"Unsupported agent: {agent}")
+
+
+_memory_manager: Optional[MemoryManager] = None
+
+
+def get_memory_manager() -> MemoryManager:
+    """Return the process-wide MemoryManager shared by all requests."""
+    global _memory_manager
+    if _memory_manager is None:
+        _memory_manager = MemoryManager()
+    return _memory_manager
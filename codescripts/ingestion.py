@@ -0,0 +1,172 @@
+import asyncio, configparser, multiprocessing, os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from PyPDF2 import PdfReader
+from codescripts.text_extractor import ExtractText
+from codescripts.text_digest import TextDigest
+from codescripts.document_source import SPOOL_MAX_BYTES
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+MAX_CONCURRENCY = config.getint("INGESTION", "max_concurrency", fallback=8)
+IO_WORKERS = config.getint("INGESTION", "io_workers", fallback=16)
+PROCESS_WORKERS = config.getint("INGESTION", "process_workers", fallback=os.cpu_count() or 1)
+# PDFs smaller than this are parsed in the I/O thread pool since process hand-off would cost more than it saves
+PROCESS_MIN_BYTES = config.getint("INGESTION", "process_min_bytes", fallback=1024 * 1024)
+# Large PDFs are split into tasks of this many pages, with at most two tasks per worker in flight
+PDF_PAGES_PER_TASK = config.getint("INGESTION", "pdf_pages_per_task", fallback=16)
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+_process_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> Tuple[List[str], List[str]]:
+    # Module-level so that it can be pickled into the process pool
+    errors = []
+    pages = list(ExtractText().iter_pdf_pages(path, errors, start, stop))
+    return pages, errors
+
+
+def _pdf_page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _update_digest(digest: TextDigest, pages: List[str]) -> None:
+    for page_text in pages:
+        digest.update(page_text)
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="ingestion-io")
+    return _io_executor
+
+
+def get_process_executor() -> ProcessPoolExecutor:
+    global _process_executor
+    if _process_executor is None:
+        _process_executor = ProcessPoolExecutor(
+            max_workers=PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_executor
+
+
+def shutdown_executors() -> None:
+    '''
+    Shuts down the ingestion thread and process pools (called on application shutdown).
+    '''
+    global _io_executor, _process_executor
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=True)
+        _io_executor = None
+    if _process_executor is not None:
+        _process_executor.shutdown(wait=True)
+        _process_executor = None
+
+
+class DocumentIngestor:
+    '''
+    Fingerprints the documents of a request concurrently without blocking the event loop.
+
+    Cache lookups and S3 reads run in a thread pool, the pages of large PDFs are parsed in
+    parallel in a process pool, and at most `max_concurrency` documents of a request are in
+    flight at once. Text is streamed into the hash page by page rather than concatenated.
+    '''
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY) -> None:
+        self.max_concurrency = max_concurrency
+        self.extractor = ExtractText()
+
+    async def ingest(self, documents: List[str]) -> List[Dict[str, Any]]:
+        '''
+        Fingerprints all documents and returns the results in the original document order.
+
+        Args:
+        documents (List[str]): Paths of the PDF/DOCX files (local or s3://bucket/key).
+
+        Returns:
+        List[dict]: One fingerprint per document, as returned by ExtractText.get_fingerprint().
+        '''
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def ingest_one(path: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._fingerprint(path)
+
+        return list(await asyncio.gather(*(ingest_one(doc) for doc in documents)))
+
+    async def _fingerprint(self, path: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        io_executor = get_io_executor()
+
+        source_key, cached, metadata = await loop.run_in_executor(io_executor, self.extractor.lookup_fingerprint, path)
+        if cached:
+            return {**cached, "extraction_errors": []}
+
+        print(f"\n--- Started text extraction: {path} ---\n")
+        # Large PDFs are parsed by worker processes, which need a file path rather than a buffer
+        spill_min_bytes = min(SPOOL_MAX_BYTES, PROCESS_MIN_BYTES) if path.lower().endswith('.pdf') else SPOOL_MAX_BYTES
+        try:
+            document = await loop.run_in_executor(io_executor, self.extractor.open_document, path, spill_min_bytes, metadata)
+        except Exception as e:
+            print(f"Exception in DocumentIngestor._fingerprint(): {e}")
+            return self.extractor.build_fingerprint(None, None)
+
+        try:
+            is_large_pdf = (
+                document.extension == '.pdf'
+                and document.local_path is not None
+                and os.path.isfile(document.local_path)
+                and document.size >= PROCESS_MIN_BYTES
+            )
+            if is_large_pdf:
+                digest = await self._digest_large_pdf(document.local_path)
+            else:
+                digest = await loop.run_in_executor(io_executor, self.extractor.digest_document, document)
+        finally:
+            document.close()
+
+        return await loop.run_in_executor(io_executor, self.extractor.build_fingerprint, source_key, digest)
+
+    async def _digest_large_pdf(self, local_path: str) -> Dict[str, Any]:
+        '''
+        Extracts page ranges of a PDF in the process pool and feeds them into the digest in page order
+        as they complete, keeping a bounded number of ranges in flight.
+        '''
+        loop = asyncio.get_running_loop()
+        io_executor = get_io_executor()
+        process_executor = get_process_executor()
+        try:
+            page_count = await loop.run_in_executor(io_executor, _pdf_page_count, local_path)
+        except Exception as e:
+            print(f"Exception in DocumentIngestor._digest_large_pdf(): {e}")
+            return self.extractor.empty_digest([str(e)])
+
+        digest = TextDigest()
+        errors = []
+        in_flight = deque()
+        max_in_flight = 2 * PROCESS_WORKERS
+
+        async def consume_oldest() -> None:
+            pages, page_errors = await in_flight.popleft()
+            errors.extend(page_errors)
+            await loop.run_in_executor(io_executor, _update_digest, digest, pages)
+
+        try:
+            for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                stop = min(start + PDF_PAGES_PER_TASK, page_count)
+                in_flight.append(loop.run_in_executor(process_executor, _extract_pdf_pages, local_path, start, stop))
+                if len(in_flight) >= max_in_flight:
+                    await consume_oldest()
+            while in_flight:
+                await consume_oldest()
+        except Exception as e:
+            print(f"Exception in DocumentIngestor._digest_large_pdf(): {e}")
+            # Let the remaining ranges finish before the caller removes the file they read
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            return self.extractor.empty_digest(errors + [str(e)])
+        return self.extractor.finish_digest(digest, errors)
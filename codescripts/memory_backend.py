@@ -0,0 +1,168 @@
+import configparser
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+# mongo | embedded
+BACKEND_NAME = config.get("STORAGE", "backend", fallback="mongo")
+
+
+class MemoryBackend:
+    '''
+    Storage operations MemoryManager needs, expressed in terms of memory records rather than queries.
+
+    Records are dicts as built by MemoryManager._build_response_obj() (content, "content_digest",
+    lookup keys and an "_id" from new_id()). Every backend must return the same results for the
+    same sequence of operations; tests/test_backend_conformance.py runs the conformance scenario
+    against each of them.
+    '''
+    name = ""
+
+    async def init(self) -> None:
+        '''Opens connections/files (called on application startup).'''
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        '''Releases connections/files (called on application shutdown).'''
+        raise NotImplementedError
+
+    async def health(self) -> Dict[str, Any]:
+        '''Readiness of the store; must contain "ready".'''
+        raise NotImplementedError
+
+    def new_id(self) -> Any:
+        '''A new record ID, assigned before the record is written.'''
+        raise NotImplementedError
+
+    async def list_user_ids(self) -> List[str]:
+        raise NotImplementedError
+
+    async def ensure_indexes(self, user_id: str) -> List[str]:
+        raise NotImplementedError
+
+    async def delete_user(self, user_id: str) -> None:
+        '''Removes all of a user's memory, retrieval index entries and cached verdicts.'''
+        raise NotImplementedError
+
+    async def find_exact_set_match(self, user_id: str, agent: str, doc_hashes: List[str], focus_areas: Optional[List[str]] = None) -> Optional[dict]:
+        '''The record for exactly this set of documents (and focus areas, if given), in any order.'''
+        raise NotImplementedError
+
+    async def find_faq_candidates(self, user_id: str, agent: str, doc_hashes: List[str], focus_limits: Dict[str, int]) -> Dict[str, List[dict]]:
+        '''
+        The best-ranked stored FAQ questions per focus area, from the agent's records sharing at least one of the documents.
+
+        Args:
+        focus_limits (Dict[str, int]): Number of questions wanted per normalised focus area (see focus_area_key).
+
+        Returns:
+        Dict[str, List[dict]]: Questions per focus area ordered by rank (missing rank = 1000), then by record and
+        position. Questions tied on rank with the last wanted one are all included, so that the caller can pick
+        among them at random.
+        '''
+        raise NotImplementedError
+
+    async def find_k_search_exact(self, user_id: str, agent: str, query_key: str, doc_hashes: List[str]) -> List[dict]:
+        '''k_search records with this normalised query sharing at least one of the documents, oldest first.'''
+        raise NotImplementedError
+
+    async def find_by_ids(self, user_id: str, ids: List[Any]) -> List[dict]:
+        raise NotImplementedError
+
+    async def prepare_k_search(self, user_id: str) -> None:
+        '''Makes the user's k_search records searchable (e.g. builds a missing retrieval index).'''
+        raise NotImplementedError
+
+    async def search_k_search(self, user_id: str, query_text: str, doc_hashes: List[str]) -> List[Tuple[Any, float]]:
+        '''(record ID, score) of the stored k_search queries most similar to the query, best first.'''
+        raise NotImplementedError
+
+    async def search_k_search_many(self, user_id: str, query_texts: List[str], doc_hashes: List[str]) -> List[List[Tuple[Any, float]]]:
+        '''search_k_search() for several queries over the same documents, in the order of the queries.'''
+        return [await self.search_k_search(user_id, query_text, doc_hashes) for query_text in query_texts]
+
+    async def existing_digests(self, user_id: str, records: List[dict]) -> Set[str]:
+        '''Content digests of the given records that are already stored.'''
+        raise NotImplementedError
+
+    async def find_merge_targets(self, user_id: str, records: List[dict]) -> List[dict]:
+        '''Stored FAQ/Doc Extractor records that the given records would be merged into, oldest first.'''
+        raise NotImplementedError
+
+    async def write_batch(self, user_id: str, inserts: List[dict], faq_pushes: Dict[Any, List[dict]], updated_docs: Dict[Any, dict]) -> List[bool]:
+        '''
+        Applies inserts (skipping any whose digest is already stored) and updates of merged records, in order.
+
+        Args:
+        inserts (List[dict]): New records.
+        faq_pushes (Dict[Any, List[dict]]): Questions appended to stored FAQ records, by record ID.
+        updated_docs (Dict[Any, dict]): Full merged state of every updated record, by record ID.
+
+        Returns:
+        List[bool]: Whether each insert was written.
+        '''
+        raise NotImplementedError
+
+    async def index_k_search(self, user_id: str, entries: List[Tuple[Any, str, List[str]]]) -> None:
+        '''Adds newly inserted k_search records, as (record ID, query_text, doc_hashes), to the retrieval index.'''
+        raise NotImplementedError
+
+    async def rebuild_retrieval_index(self, user_id: str) -> int:
+        raise NotImplementedError
+
+    async def save_doc_sketches(self, user_id: str, sketches: Dict[str, Tuple[List[int], List[str]]]) -> None:
+        '''
+        Stores the similarity signature and LSH band keys of documents the user has memory for.
+
+        Args:
+        sketches (Dict[str, tuple]): (MinHash signature, band keys) by document hash; replaces any stored sketch.
+        '''
+        raise NotImplementedError
+
+    async def find_similar_docs(self, user_id: str, band_keys: List[str]) -> Dict[str, List[int]]:
+        '''Signatures, by document hash, of the user's documents sharing at least one LSH band key (an index lookup).'''
+        raise NotImplementedError
+
+    async def save_doc_chunks(self, user_id: str, chunks: Dict[str, List[Dict[str, Any]]]) -> None:
+        '''
+        Stores the content-defined chunks of documents the user has memory for.
+
+        Args:
+        chunks (Dict[str, list]): Chunks ({"hash", "start", "length"}) by document hash; replaces any stored chunks.
+        '''
+        raise NotImplementedError
+
+    async def find_docs_by_chunks(self, user_id: str, chunk_hashes: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        '''Chunks, by document hash, of the user's documents sharing at least one of the chunks (an index lookup).'''
+        raise NotImplementedError
+
+    async def backfill_content_digests(self, user_id: str) -> Dict[str, int]:
+        raise NotImplementedError
+
+    async def backfill_lookup_keys(self, user_id: str) -> int:
+        raise NotImplementedError
+
+
+_memory_backend: Optional[MemoryBackend] = None
+
+
+def create_memory_backend(name: str = BACKEND_NAME) -> MemoryBackend:
+    # Imported here so that a deployment only loads the backend it uses
+    if name == "mongo":
+        from codescripts.mongo_backend import MongoMemoryBackend
+        return MongoMemoryBackend()
+    if name == "embedded":
+        from codescripts.embedded_backend import EmbeddedMemoryBackend
+        return EmbeddedMemoryBackend()
+    raise ValueError(f"Unsupported storage backend: {name}")
+
+
+def get_memory_backend() -> MemoryBackend:
+    '''
+    Returns the process-wide memory storage backend selected by [STORAGE] backend.
+    '''
+    global _memory_backend
+    if _memory_backend is None:
+        _memory_backend = create_memory_backend()
+    return _memory_backend
@@ -0,0 +1,600 @@
+import asyncio, configparser, hashlib, time
+from datetime import datetime, timezone
+from pymongo import UpdateOne, DeleteOne, IndexModel, ASCENDING
+from bson import ObjectId
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from typing import List, Dict, Any, Optional, Set, Tuple
+from utils.db_client import get_database, init_db, close_db, get_db_health, INTERNAL_COLLECTION_PREFIX
+from utils.memory_keys import set_key, remove_meta_fields, content_digest, lookup_keys
+from codescripts.memory_backend import MemoryBackend
+from codescripts.retrieval_index import RetrievalIndex, get_retrieval_index
+from codescripts.answer_cache import AnswerCache, get_answer_cache
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+# per_user: one collection per user | shared: SHARED_COLLECTIONS collections keyed by (user_id, agent, doc_set_key)
+LAYOUT = config.get("STORAGE", "mongo_layout", fallback="per_user")
+# Users are spread over the shared collections by a hash of their ID, so this must not change once data is written
+SHARED_COLLECTIONS = config.getint("STORAGE", "mongo_shared_collections", fallback=4)
+SHARED_COLLECTION_PREFIX = f"{INTERNAL_COLLECTION_PREFIX}memory."
+# Users whose memory has been moved from their own collection to a shared one
+LAYOUT_MARKERS_COLLECTION = f"{INTERNAL_COLLECTION_PREFIX}memory_layout"
+# Similarity signatures of documents with memory, for near-duplicate matching (any layout)
+DOC_SKETCHES_COLLECTION = f"{INTERNAL_COLLECTION_PREFIX}doc_sketches"
+# Content-defined chunks of documents with memory, for chunk-level reuse (any layout)
+DOC_CHUNKS_COLLECTION = f"{INTERNAL_COLLECTION_PREFIX}doc_chunks"
+
+BACKFILL_BATCH_SIZE = 1000
+MIGRATION_BATCH_SIZE = config.getint("STORAGE", "migration_batch_size", fallback=BACKFILL_BATCH_SIZE)
+# Time given to requests that resolved a user's old collection before the switch to finish writing to it
+MIGRATION_GRACE_SECONDS = config.getfloat("STORAGE", "migration_grace_seconds", fallback=5.0)
+# How long a user found in their own collection is served from it without checking again. Kept well within the
+# grace period, so that every process has stopped writing to a migrated collection before the catch-up reads it
+LAYOUT_RECHECK_SECONDS = min(config.getfloat("STORAGE", "layout_recheck_seconds", fallback=1.0), MIGRATION_GRACE_SECONDS / 2)
+
+# Fields of the shared layout's shard key, which every record carries and every update is targeted by
+SHARD_KEY_FIELDS = ["user_id", "agent", "doc_set_key"]
+
+# Indexes every per-user memory collection needs for the lookups below
+MEMORY_INDEXES = [
+    # Duplicate detection; partial so that legacy records without a digest do not collide on null
+    IndexModel(
+        [("content_digest", ASCENDING)],
+        name="content_digest_unique",
+        unique=True,
+        partialFilterExpression={"content_digest": {"$exists": True}}
+    ),
+    # Multikey: serves doc_hashes $in (faq_generator, k_search) and exact/$all matches (summariser, doc_extractor)
+    IndexModel([("agent", ASCENDING), ("doc_hashes", ASCENDING)], name="agent_doc_hashes"),
+    # Exact doc-set (and focus-set) equality lookups (summariser, doc_extractor)
+    IndexModel(
+        [("agent", ASCENDING), ("doc_set_key", ASCENDING), ("focus_set_key", ASCENDING)],
+        name="agent_doc_set_key_focus_set_key"
+    ),
+    # Exact k_search query lookups
+    IndexModel([("agent", ASCENDING), ("query_key", ASCENDING)], name="agent_query_key"),
+]
+
+# The same lookups in the shared layout, each prefixed by the user. The digest is unique per user, which the
+# shard key prefix does not weaken: records with equal content also have equal agent and doc_set_key.
+SHARED_MEMORY_INDEXES = [
+    IndexModel(
+        [(field, ASCENDING) for field in SHARD_KEY_FIELDS] + [("content_digest", ASCENDING)],
+        name="shard_key_content_digest_unique",
+        unique=True,
+        partialFilterExpression={"content_digest": {"$exists": True}}
+    ),
+    IndexModel([("user_id", ASCENDING), ("agent", ASCENDING), ("doc_hashes", ASCENDING)], name="user_agent_doc_hashes"),
+    IndexModel(
+        [(field, ASCENDING) for field in SHARD_KEY_FIELDS] + [("focus_set_key", ASCENDING)],
+        name="shard_key_focus_set_key"
+    ),
+    IndexModel([("user_id", ASCENDING), ("agent", ASCENDING), ("query_key", ASCENDING)], name="user_agent_query_key"),
+]
+
+
+DOC_SKETCH_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("doc_hash", ASCENDING)], name="user_doc_hash_unique", unique=True),
+    # Multikey: LSH candidate lookups
+    IndexModel([("user_id", ASCENDING), ("band_keys", ASCENDING)], name="user_band_keys"),
+]
+
+DOC_CHUNK_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("doc_hash", ASCENDING)], name="user_doc_hash_unique", unique=True),
+    # Multikey: documents sharing a chunk
+    IndexModel([("user_id", ASCENDING), ("chunk_hashes", ASCENDING)], name="user_chunk_hashes"),
+]
+
+
+def shared_collection_name(user_id: str) -> str:
+    '''
+    Name of the shared collection holding a user's memory in the shared layout.
+    '''
+    bucket = int(hashlib.sha256(user_id.encode("utf-8")).hexdigest(), 16) % SHARED_COLLECTIONS
+    return f"{SHARED_COLLECTION_PREFIX}{bucket}"
+
+
+class MongoMemoryBackend(MemoryBackend):
+    '''
+    MongoDB storage of memory records, with the k_search retrieval index and answer cache in shared
+    internal collections.
+
+    Records live either in one collection per user (per_user layout) or, with the shared layout, in a
+    few shared collections where every record carries its user_id and is keyed by (user_id, agent,
+    doc_set_key), a shard-friendly key. In the shared layout a user who still has their own collection
+    is served from it until `python admin.py migrate-layout` has moved it, so the switch can be made
+    before the migration and users are moved one at a time while the service runs.
+    '''
+    name = "mongo"
+
+    def __init__(
+        self,
+        db: Optional[AsyncDatabase] = None,
+        retrieval_index: Optional[RetrievalIndex] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        layout: str = LAYOUT
+    ):
+        if layout not in ("per_user", "shared"):
+            raise ValueError(f"Unsupported MongoDB storage layout: {layout}")
+        # Defaults to the process-wide pooled client rather than opening a connection per instance
+        self.db = db if db is not None else get_database()
+        self.retrieval_index = retrieval_index if retrieval_index is not None else get_retrieval_index()
+        self.answer_cache = answer_cache if answer_cache is not None else get_answer_cache()
+        self.layout = layout
+        self.layout_markers = self.db[LAYOUT_MARKERS_COLLECTION]
+        self.doc_sketches = self.db[DOC_SKETCHES_COLLECTION]
+        self.doc_chunks = self.db[DOC_CHUNKS_COLLECTION]
+        # Readiness state belongs to this instance's database, so backends on other databases never share it
+        # Collections whose indexes have already been ensured
+        self._indexed_collections = set()
+        # Users whose k_search records and retrieval index have been checked
+        self._k_search_ready = set()
+        # Users known to be stored in the shared layout (they never move back)
+        self._shared_users = set()
+        # Users found in their own collection -> time.monotonic() until which that is trusted
+        self._own_collection_until: Dict[str, float] = {}
+        self._doc_sketch_indexes_ready = False
+        self._doc_chunk_indexes_ready = False
+
+    async def init(self) -> None:
+        await init_db()
+
+    async def close(self) -> None:
+        await close_db()
+
+    async def health(self) -> Dict[str, Any]:
+        return {**await get_db_health(), "layout": self.layout}
+
+    def new_id(self) -> ObjectId:
+        return ObjectId()
+
+    async def list_user_ids(self) -> List[str]:
+        """Users with their own collection and, in the shared layout, users stored in the shared collections."""
+        names = await self.db.list_collection_names()
+        user_ids = {
+            name for name in names
+            if not name.startswith("system.") and not name.startswith(INTERNAL_COLLECTION_PREFIX)
+        }
+        if self.layout == "shared":
+            for name in names:
+                if name.startswith(SHARED_COLLECTION_PREFIX):
+                    user_ids.update(await self.db[name].distinct("user_id"))
+        return sorted(user_ids)
+
+    async def _has_own_collection(self, user_id: str) -> bool:
+        return bool(await self.db.list_collection_names(filter={"name": user_id}))
+
+    async def _is_shared(self, user_id: str) -> bool:
+        """
+        Whether a user's memory is in the shared layout: always for new users, and for users with their own
+        collection once it has been migrated. Being shared is final and cached for good; not being shared is
+        cached for LAYOUT_RECHECK_SECONDS, so a migration made by another process is seen within that time.
+        """
+        if self.layout != "shared":
+            return False
+        if user_id in self._shared_users:
+            return True
+        if self._own_collection_until.get(user_id, 0.0) > time.monotonic():
+            return False
+        if await self.layout_markers.find_one({"_id": user_id}) or not await self._has_own_collection(user_id):
+            self._shared_users.add(user_id)
+            self._own_collection_until.pop(user_id, None)
+            return True
+        self._own_collection_until[user_id] = time.monotonic() + LAYOUT_RECHECK_SECONDS
+        return False
+
+    async def _location(self, user_id: str, ensure: bool = True) -> Tuple[AsyncCollection, dict]:
+        """
+        The collection holding a user's memory and the filter selecting their records in it (empty for a
+        collection of their own). Indexes are created the first time a collection is touched in this process.
+        """
+        if await self._is_shared(user_id):
+            collection, scope, indexes = self.db[shared_collection_name(user_id)], {"user_id": user_id}, SHARED_MEMORY_INDEXES
+        else:
+            collection, scope, indexes = self.db[user_id], {}, MEMORY_INDEXES
+        if ensure and collection.name not in self._indexed_collections:
+            await collection.create_indexes(indexes)
+            self._indexed_collections.add(collection.name)
+        return collection, scope
+
+    def _record_filter(self, scope: dict, doc: dict) -> dict:
+        """Filter targeting one stored record; in the shared layout it includes the shard key."""
+        if not scope:
+            return {"_id": doc["_id"]}
+        return {"_id": doc["_id"], **scope, "agent": doc.get("agent"), "doc_set_key": doc.get("doc_set_key")}
+
+    async def ensure_indexes(self, user_id: str) -> List[str]:
+        """Create the memory indexes on the collection holding a user's memory (no-op for indexes that already exist)."""
+        collection, scope = await self._location(user_id, ensure=False)
+        names = await collection.create_indexes(SHARED_MEMORY_INDEXES if scope else MEMORY_INDEXES)
+        self._indexed_collections.add(collection.name)
+        return names
+
+    async def delete_user(self, user_id: str) -> None:
+        if self.layout == "shared":
+            await self.db[shared_collection_name(user_id)].delete_many({"user_id": user_id})
+            await self.layout_markers.delete_one({"_id": user_id})
+            self._shared_users.discard(user_id)
+            self._own_collection_until.pop(user_id, None)
+        await self.db.drop_collection(user_id)
+        await self.retrieval_index.entries.delete_many({"user_id": user_id})
+        await self.retrieval_index.terms.delete_many({"user_id": user_id})
+        await self.answer_cache.collection.delete_many({"user_id": user_id})
+        await self.doc_sketches.delete_many({"user_id": user_id})
+        await self.doc_chunks.delete_many({"user_id": user_id})
+        self._indexed_collections.discard(user_id)
+        self._k_search_ready.discard(user_id)
+
+    async def find_exact_set_match(self, user_id, agent, doc_hashes, focus_areas=None):
+        """
+        Find the record for exactly this set of documents (and focus areas, if given) with an equality lookup on the set keys.
+        Records saved before set keys existed are matched by their document array instead, their focus areas
+        compared on the normalised set key in Python (so that subdocuments match whatever their key order),
+        and upgraded in place (the shared layout only holds migrated records, which all have their keys).
+        """
+        collection, scope = await self._location(user_id)
+        query = {**scope, "agent": agent, "doc_set_key": set_key(doc_hashes)}
+        if focus_areas is not None:
+            query["focus_set_key"] = set_key(focus_areas)
+
+        matched_doc = await collection.find_one(query)
+        if matched_doc or scope:
+            return matched_doc
+
+        legacy_query = {
+            "agent": agent,
+            "doc_set_key": {"$exists": False},
+            "doc_hashes": {"$all": doc_hashes, "$size": len(doc_hashes)}
+        }
+        async for doc in collection.find(legacy_query):
+            if focus_areas is None or set_key(doc.get("focus_areas") or []) == query["focus_set_key"]:
+                await collection.update_one({"_id": doc["_id"]}, {"$set": lookup_keys(doc)})
+                return doc
+        return None
+
+    async def find_faq_candidates(self, user_id, agent, doc_hashes, focus_limits):
+        """
+        Selects the questions in an aggregation pipeline so that only the wanted ones leave the database.
+        Note that $toLower only folds ASCII letters, whereas focus_area_key() folds any.
+        """
+        limits = [{"focus": focus, "limit": limit} for focus, limit in focus_limits.items() if limit > 0]
+        if not limits or not doc_hashes:
+            return {}
+        collection, scope = await self._location(user_id)
+        pipeline = [
+            {"$match": {**scope, "agent": agent, "doc_hashes": {"$in": doc_hashes}}},
+            {"$project": {"questions": 1}},
+            {"$unwind": {"path": "$questions", "includeArrayIndex": "position"}},
+            {"$project": {
+                "position": 1,
+                "question": "$questions",
+                "focus": {"$toLower": {"$trim": {"input": {"$ifNull": ["$questions.focus_area", ""]}}}},
+                "rank": {"$ifNull": ["$questions.rank", 1000]}
+            }},
+            {"$match": {"focus": {"$in": [item["focus"] for item in limits]}}},
+            {"$sort": {"focus": 1, "rank": 1, "_id": 1, "position": 1}},
+            {"$group": {"_id": "$focus", "questions": {"$push": {"question": "$question", "rank": "$rank"}}}},
+            {"$project": {"questions": {"$let": {
+                "vars": {"limit": {"$let": {
+                    "vars": {"entry": {"$arrayElemAt": [
+                        {"$filter": {"input": {"$literal": limits}, "cond": {"$eq": ["$$this.focus", "$_id"]}}}, 0
+                    ]}},
+                    "in": "$$entry.limit"
+                }}},
+                # Slice to the limit, extended to every question tied on rank with the last one kept
+                "in": {"$cond": [
+                    {"$gt": [{"$size": "$questions"}, "$$limit"]},
+                    {"$let": {
+                        "vars": {"cutoff": {"$arrayElemAt": ["$questions.rank", {"$subtract": ["$$limit", 1]}]}},
+                        "in": {"$filter": {"input": "$questions", "cond": {"$lte": ["$$this.rank", "$$cutoff"]}}}
+                    }},
+                    "$questions"
+                ]}
+            }}}}
+        ]
+        candidates = {}
+        async for group in await collection.aggregate(pipeline):
+            candidates[group["_id"]] = [item["question"] for item in group["questions"]]
+        return candidates
+
+    async def find_k_search_exact(self, user_id, agent, query_key, doc_hashes):
+        collection, scope = await self._location(user_id)
+        return await collection.find({
+            **scope,
+            "agent": agent,
+            "query_key": query_key,
+            "doc_hashes": {"$in": doc_hashes}
+        }).to_list(None)
+
+    async def find_by_ids(self, user_id, ids):
+        if not ids:
+            return []
+        collection, scope = await self._location(user_id)
+        return await collection.find({**scope, "_id": {"$in": ids}}).to_list(None)
+
+    async def prepare_k_search(self, user_id: str) -> None:
+        """Give legacy k_search records their query key and build the user's retrieval index, once per process."""
+        if user_id in self._k_search_ready:
+            return
+        collection, scope = await self._location(user_id)
+        if not scope:
+            await self._backfill_lookup_keys(user_id, {"agent": "k_search", "query_key": {"$exists": False}})
+        await self.retrieval_index.ensure_built(user_id, collection, scope)
+        self._k_search_ready.add(user_id)
+
+    async def search_k_search(self, user_id, query_text, doc_hashes):
+        return await self.retrieval_index.search(user_id, query_text, doc_hashes)
+
+    async def search_k_search_many(self, user_id, query_texts, doc_hashes):
+        return await self.retrieval_index.search_many(user_id, query_texts, doc_hashes)
+
+    async def index_k_search(self, user_id, entries):
+        await self.retrieval_index.add_many(user_id, entries)
+
+    async def rebuild_retrieval_index(self, user_id: str) -> int:
+        collection, scope = await self._location(user_id)
+        return await self.retrieval_index.rebuild(user_id, collection, scope)
+
+    async def _doc_sketch_collection(self) -> AsyncCollection:
+        if not self._doc_sketch_indexes_ready:
+            await self.doc_sketches.create_indexes(DOC_SKETCH_INDEXES)
+            self._doc_sketch_indexes_ready = True
+        return self.doc_sketches
+
+    async def save_doc_sketches(self, user_id, sketches):
+        if not sketches:
+            return
+        collection = await self._doc_sketch_collection()
+        await collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "doc_hash": doc_hash},
+                {"$set": {"signature": signature, "band_keys": keys}},
+                upsert=True
+            )
+            for doc_hash, (signature, keys) in sketches.items()
+        ], ordered=False)
+
+    async def find_similar_docs(self, user_id, band_keys):
+        if not band_keys:
+            return {}
+        collection = await self._doc_sketch_collection()
+        similar = {}
+        async for doc in collection.find({"user_id": user_id, "band_keys": {"$in": band_keys}}, {"doc_hash": 1, "signature": 1}):
+            similar[doc["doc_hash"]] = doc["signature"]
+        return similar
+
+    async def _doc_chunk_collection(self) -> AsyncCollection:
+        if not self._doc_chunk_indexes_ready:
+            await self.doc_chunks.create_indexes(DOC_CHUNK_INDEXES)
+            self._doc_chunk_indexes_ready = True
+        return self.doc_chunks
+
+    async def save_doc_chunks(self, user_id, chunks):
+        if not chunks:
+            return
+        collection = await self._doc_chunk_collection()
+        await collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "doc_hash": doc_hash},
+                {"$set": {"chunks": doc_chunks, "chunk_hashes": sorted({chunk["hash"] for chunk in doc_chunks})}},
+                upsert=True
+            )
+            for doc_hash, doc_chunks in chunks.items()
+        ], ordered=False)
+
+    async def find_docs_by_chunks(self, user_id, chunk_hashes):
+        if not chunk_hashes:
+            return {}
+        collection = await self._doc_chunk_collection()
+        found = {}
+        query = {"user_id": user_id, "chunk_hashes": {"$in": list(set(chunk_hashes))}}
+        async for doc in collection.find(query, {"doc_hash": 1, "chunks": 1}):
+            found[doc["doc_hash"]] = doc["chunks"]
+        return found
+
+    async def existing_digests(self, user_id: str, records: List[dict]) -> Set[str]:
+        """Stored digests, including those of matching legacy records saved before digests existed."""
+        collection, scope = await self._location(user_id)
+        seen_digests = set()
+        if scope:
+            # Every shared record has its digest; each clause is served by the unique index
+            query = {**scope, "$or": [
+                {"agent": r["agent"], "doc_set_key": r["doc_set_key"], "content_digest": r["content_digest"]} for r in records
+            ]}
+            async for doc in collection.find(query, {"content_digest": 1}):
+                seen_digests.add(doc["content_digest"])
+            return seen_digests
+        async for doc in collection.find({"content_digest": {"$in": [r["content_digest"] for r in records]}}, {"content_digest": 1}):
+            seen_digests.add(doc["content_digest"])
+        legacy_query = {"content_digest": {"$exists": False}, "$or": [remove_meta_fields(r) for r in records]}
+        async for doc in collection.find(legacy_query):
+            seen_digests.add(content_digest(doc))
+        return seen_digests
+
+    async def find_merge_targets(self, user_id: str, records: List[dict]) -> List[dict]:
+        merge_clauses = []
+        for r in records:
+            if r["agent"].lower() == "faq_generator":
+                merge_clauses.append({"agent": r["agent"], "doc_hashes": r["doc_hashes"], "parameters": r["parameters"]})
+            elif r["agent"].lower() == "doc_extractor":
+                merge_clauses.append({"agent": r["agent"], "doc_hashes": r["doc_hashes"]})
+        if not merge_clauses:
+            return []
+        collection, scope = await self._location(user_id)
+        return await collection.find({**scope, "$or": merge_clauses}).to_list(None)
+
+    async def write_batch(self, user_id, inserts, faq_pushes, updated_docs):
+        """Applies the batch with a single ordered bulk write."""
+        collection, scope = await self._location(user_id)
+        operations = []
+        for r in inserts:
+            # Upsert on the digest so that a record stored concurrently is not inserted twice
+            upsert_filter = {"content_digest": r["content_digest"]}
+            if scope:
+                upsert_filter.update({**scope, "agent": r["agent"], "doc_set_key": r["doc_set_key"]})
+            new_doc = {k: v for k, v in r.items() if k not in upsert_filter}
+            operations.append(UpdateOne(upsert_filter, {"$setOnInsert": new_doc}, upsert=True))
+        for _id, doc in updated_docs.items():
+            update = {"$set": {"content_digest": content_digest(doc)}}
+            if _id in faq_pushes:
+                update["$push"] = {"questions": {"$each": faq_pushes[_id]}}
+            else:
+                update["$set"]["entity_table"] = doc["entity_table"]
+            operations.append(UpdateOne(self._record_filter(scope, doc), update))
+
+        upserted = {}
+        if operations:
+            result = await collection.bulk_write(operations, ordered=True)
+            upserted = result.upserted_ids
+        return [op_index in upserted for op_index in range(len(inserts))]
+
+    async def backfill_content_digests(self, user_id: str) -> Dict[str, int]:
+        """
+        Migration: compute content digests for a user's records saved before digests existed.
+        Exact duplicates found along the way (which the unique index would reject) are removed, keeping the oldest.
+        """
+        collection, scope = await self._location(user_id, ensure=False)
+        seen = set()
+        async for doc in collection.find({**scope, "content_digest": {"$exists": True}}, {"content_digest": 1}):
+            seen.add(doc["content_digest"])
+
+        counts = {"updated": 0, "removed_duplicates": 0}
+        operations = []
+        async for doc in collection.find({**scope, "content_digest": {"$exists": False}}).sort("_id", 1):
+            digest = content_digest(doc)
+            if digest in seen:
+                operations.append(DeleteOne(self._record_filter(scope, doc)))
+                counts["removed_duplicates"] += 1
+            else:
+                seen.add(digest)
+                operations.append(UpdateOne(self._record_filter(scope, doc), {"$set": {"content_digest": digest}}))
+                counts["updated"] += 1
+            if len(operations) >= BACKFILL_BATCH_SIZE:
+                await collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+
+        self._indexed_collections.discard(collection.name)
+        await self._location(user_id)
+        return counts
+
+    async def backfill_lookup_keys(self, user_id: str) -> int:
+        """
+        Migration: add doc-set/focus-set/query keys to a user's records saved before they existed. Records with focus
+        areas that are not all strings are re-keyed too, since set_key now keys such values by their JSON with sorted keys.
+        """
+        return await self._backfill_lookup_keys(user_id, {"$or": [
+            {"doc_set_key": {"$exists": False}},
+            {"agent": "k_search", "query_key": {"$exists": False}},
+            {"focus_areas": {"$elemMatch": {"$not": {"$type": "string"}}}}
+        ]})
+
+    async def _backfill_lookup_keys(self, user_id: str, query: dict) -> int:
+        collection, scope = await self._location(user_id, ensure=False)
+        updated = 0
+        operations = []
+        projection = {"agent": 1, "doc_hashes": 1, "focus_areas": 1, "query_text": 1, "doc_set_key": 1}
+        async for doc in collection.find({**scope, **query}, projection):
+            operations.append(UpdateOne(self._record_filter(scope, doc), {"$set": lookup_keys(doc)}))
+            updated += 1
+            if len(operations) >= BACKFILL_BATCH_SIZE:
+                await collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+        return updated
+
+    def _shared_record(self, user_id: str, doc: dict) -> dict:
+        """A record of a user's own collection as stored in the shared layout."""
+        record = {**doc, **lookup_keys(doc), "user_id": user_id}
+        if "content_digest" not in record:
+            record["content_digest"] = content_digest(record)
+        return record
+
+    def _shared_insert(self, record: dict) -> UpdateOne:
+        """Insert of a record into the shared layout under its existing ID, unless it is already there."""
+        upsert_filter = {"_id": record["_id"], **{field: record[field] for field in SHARD_KEY_FIELDS}}
+        new_doc = {k: v for k, v in record.items() if k not in upsert_filter}
+        return UpdateOne(upsert_filter, {"$setOnInsert": new_doc}, upsert=True)
+
+    async def migrate_user(self, user_id: str, batch_size: int = MIGRATION_BATCH_SIZE,
+                           grace_seconds: float = MIGRATION_GRACE_SECONDS) -> Dict[str, int]:
+        """
+        Moves a user's own collection into the shared layout while the service keeps running.
+
+        Records are copied in batches under their existing IDs (so retrieval index entries stay valid), then the
+        user is switched over by their layout marker. After a grace period for requests that were already writing
+        to the old collection, records saved or merged into it since the copy are carried over as well, every
+        record is checked to be present and the old collection is dropped. Safe to re-run after an interruption.
+
+        Returns:
+        Dict[str, int]: Counts of copied, caught-up and pre-existing (already copied) records.
+        """
+        if self.layout != "shared":
+            raise ValueError("Migration needs [STORAGE] mongo_layout = shared")
+        counts = {"copied": 0, "caught_up": 0, "already_shared": 0}
+        if not await self._has_own_collection(user_id):
+            return counts
+        source = self.db[user_id]
+        target = self.db[shared_collection_name(user_id)]
+        if target.name not in self._indexed_collections:
+            await target.create_indexes(SHARED_MEMORY_INDEXES)
+            self._indexed_collections.add(target.name)
+
+        # Digests and duplicate removal first, so that the unique index of the shared collection accepts every record
+        if not await self.layout_markers.find_one({"_id": user_id}):
+            await self.backfill_content_digests(user_id)
+
+        copied = {}  # _id -> digest as copied
+        operations = []
+        async for doc in source.find({}).sort("_id", 1):
+            record = self._shared_record(user_id, doc)
+            copied[record["_id"]] = record["content_digest"]
+            operations.append(self._shared_insert(record))
+            if len(operations) >= batch_size:
+                result = await target.bulk_write(operations, ordered=False)
+                counts["copied"] += result.upserted_count
+                operations = []
+        if operations:
+            result = await target.bulk_write(operations, ordered=False)
+            counts["copied"] += result.upserted_count
+        counts["already_shared"] = len(copied) - counts["copied"]
+
+        await self.layout_markers.update_one(
+            {"_id": user_id},
+            {"$setOnInsert": {"layout": "shared", "migrated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        self._shared_users.add(user_id)
+        self._own_collection_until.pop(user_id, None)
+        self._k_search_ready.discard(user_id)
+        await asyncio.sleep(grace_seconds)
+
+        # Catch up with writes that reached the old collection after the copy. A record merged there replaces
+        # its shared copy only if that copy has not itself been changed since.
+        operations = []
+        async for doc in source.find({}).sort("_id", 1):
+            record = self._shared_record(user_id, doc)
+            if record["_id"] not in copied:
+                operations.append(self._shared_insert(record))
+            elif record["content_digest"] != copied[record["_id"]]:
+                target_filter = {**self._record_filter({"user_id": user_id}, record), "content_digest": copied[record["_id"]]}
+                operations.append(UpdateOne(target_filter, {"$set": {k: v for k, v in record.items() if k != "_id"}}))
+        if operations:
+            result = await target.bulk_write(operations, ordered=False)
+            counts["caught_up"] = result.upserted_count + result.modified_count
+
+        source_ids = [doc["_id"] async for doc in source.find({}, {"_id": 1})]
+        present = set()
+        for start in range(0, len(source_ids), batch_size):
+            batch = source_ids[start:start + batch_size]
+            async for doc in target.find({"user_id": user_id, "_id": {"$in": batch}}, {"_id": 1}):
+                present.add(doc["_id"])
+        if len(present) != len(source_ids):
+            raise RuntimeError(f"{len(source_ids) - len(present)} record(s) of {user_id} missing after migration; old collection kept")
+        await self.db.drop_collection(user_id)
+        self._indexed_collections.discard(user_id)
+        return counts
@@ -1,25 +1,43 @@
-import tiktoken
 import math
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
 from utils.agent_prompts import *  
 from utils.model_prices import MODEL_PRICING 
+from utils.tokenizers import get_tokenizer
+
+@lru_cache(maxsize=None)
+def prompt_token_counts(model_name: str) -> Dict[str, int]:
+    """
+    Token counts of the agent prompt templates for a model, computed once per process.
+    """
+    tokens = get_tokenizer(model_name)
+    return {
+        "faq_plain": tokens(FAQS_WITHOUT_FOCUS),
+        "faq_focus": tokens(EXTRACT_RELEVANT_TEXT_PROMPT) + tokens(FAQS_WITH_FOCUS),
+        "summary_plain": tokens(SUMMARY_PROMPT_WITHOUT_FOCUS),
+        "summary_focus": tokens(SUMMARY_PROMPT_WITH_FOCUS),
+        "doc_extractor": tokens(DOC_EXTRACTOR_PROMPT),
+        "k_search": tokens(K_SEARCH_TEMPLATE) 
+    }
+
+def warm_up() -> None:
+    """
+    Load the tokenizers and prompt token counts of every priced model (called at application startup).
+    """
+    for model_name in MODEL_PRICING:
+        prompt_token_counts(model_name)
 
 class Optimiser:
-    def __init__(self, model_name: str, agent: str, doc_content: str):
+    def __init__(self, model_name: str, agent: str, doc_tokens: int, uncovered_tokens: Optional[int] = None):
         self.model_name = model_name
         self.agent = agent.lower()
-        self.doc_content = doc_content
-        self.tokenizer = self._get_tokenizer(model_name)
-        self.prompt_tokens = self._compute_prompt_tokens()
+        # Token count of the documents, summed from the per-document counts stored at ingestion
+        self.doc_tokens = doc_tokens
+        # Token count of the chunks memory does not cover, for a chunk-level reuse (None otherwise)
+        self.uncovered_tokens = uncovered_tokens
+        self.prompt_tokens = prompt_token_counts(model_name)
         self.chunk_size = self._resolve_chunk_size()
 
-    def _get_tokenizer(self, model_name: str):
-        if model_name.lower().startswith("gpt"):
-            return lambda text: len(tiktoken.encoding_for_model(model_name).encode(text))
-        else:
-            # Fallback: assume ~4 chars per token as heuristic
-            return lambda text: max(1, len(text) // 4)
-
     def _resolve_chunk_size(self):
         if "gpt" in self.model_name:
             return 12000 if "3" in self.model_name else 45000
@@ -30,24 +48,23 @@ class Optimiser:
         else:
             return 45000
 
-    def _compute_prompt_tokens(self) -> Dict[str, int]:
-        def tokens(text):
-            return self.tokenizer(text)
-
-        return {
-            "faq_plain": tokens(FAQS_WITHOUT_FOCUS),
-            "faq_focus": tokens(EXTRACT_RELEVANT_TEXT_PROMPT) + tokens(FAQS_WITH_FOCUS),
-            "summary_plain": tokens(SUMMARY_PROMPT_WITHOUT_FOCUS),
-            "summary_focus": tokens(SUMMARY_PROMPT_WITH_FOCUS),
-            "doc_extractor": tokens(DOC_EXTRACTOR_PROMPT),
-            "k_search": tokens(K_SEARCH_TEMPLATE) 
-        }
-
-    def compute(self, processing_content: Any, memory_content: Any, params:dict,  i_check_result: str =None) -> Dict[str, Any]:
-        total_doc_tokens = self.tokenizer(self.doc_content)
+    def compute(self, processing_content: Any, memory_content: Any, params:dict,  i_check_result: str =None, memory_tier: str = "user") -> Dict[str, Any]:
+        metrics = self._agent_metrics(processing_content, memory_content, params, i_check_result)
+        if metrics:
+            # Savings owed to memory other tenants stored in the shared tier
+            from_shared = memory_tier == "shared"
+            metrics["memory_tier"] = memory_tier
+            metrics["shared_tier_saved_tokens"] = metrics["saved_tokens"] if from_shared else 0
+            metrics["shared_tier_saved_cost"] = metrics["saved_cost"] if from_shared else 0
+        return metrics
+
+    def _agent_metrics(self, processing_content, memory_content, params, i_check_result):
+        total_doc_tokens = self.doc_tokens
         num_chunks = math.ceil(total_doc_tokens / self.chunk_size)
         prices = MODEL_PRICING[self.model_name]
 
+        if self.uncovered_tokens is not None and self.agent in ("faq_generator", "summariser", "doc_extractor"):
+            return self._chunk_reuse_metrics(params, prices)
         if self.agent == "faq_generator":
             return self._faq_metrics(processing_content, memory_content, num_chunks, total_doc_tokens, params, prices)
         elif self.agent == "summariser":
@@ -110,6 +127,24 @@ class Optimiser:
 
         return self._finalise_metrics(orig_tokens, saved_tokens, prices)
 
+    def _chunk_reuse_metrics(self, params, prices):
+        # Only the uncovered chunks are processed, in as many LLM chunks as they fill
+        orig_tokens = self._processing_tokens(self.doc_tokens, params)
+        remaining_tokens = self._processing_tokens(self.uncovered_tokens, params)
+        return self._finalise_metrics(orig_tokens, max(0, orig_tokens - remaining_tokens), prices)
+
+    def _processing_tokens(self, doc_tokens, params):
+        num_chunks = math.ceil(doc_tokens / self.chunk_size)
+        focus = bool(params.get("focus_areas"))
+        if self.agent == "faq_generator":
+            prompt_cost = self.prompt_tokens["faq_focus"] if focus else self.prompt_tokens["faq_plain"]
+            return num_chunks * (self.chunk_size + prompt_cost)
+        elif self.agent == "summariser":
+            prompt_cost = self.prompt_tokens["summary_focus"] if focus else self.prompt_tokens["summary_plain"]
+            return num_chunks * (self.chunk_size + prompt_cost)
+        else:
+            return num_chunks * self.prompt_tokens["doc_extractor"] * len(params.get("entity_list", [])) + doc_tokens
+
     def _ksearch_metrics(self, processing_content, memory_content, num_chunks, prices,  i_check_result):
         # Assume 10 retrieved vectors, 1 final prompt
         orig_tokens = (num_chunks * self.prompt_tokens["k_search"] // 100) + self.prompt_tokens["k_search"] * 10
@@ -0,0 +1,221 @@
+import configparser, copy, hashlib, json, secrets, threading, time
+from typing import List, Dict, Any, Optional
+from cachetools import LRUCache, TTLCache
+from utils.memory_keys import set_key
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+# Second tier shared by all workers: none | redis | local (in-process stand-in with the same behaviour)
+SHARED_TIER = config.get("RESULT_CACHE", "shared", fallback="none")
+# Without a shared tier a worker never sees other workers' saves, so the cache is off unless explicitly enabled
+ENABLED = config.getboolean("RESULT_CACHE", "enabled", fallback=SHARED_TIER != "none")
+MAX_ENTRIES = config.getint("RESULT_CACHE", "max_entries", fallback=10000)
+TTL_SECONDS = config.getint("RESULT_CACHE", "ttl_seconds", fallback=300)
+REDIS_URL = config.get("RESULT_CACHE", "redis_url", fallback="redis://localhost:6379/0")
+KEY_PREFIX = config.get("RESULT_CACHE", "key_prefix", fallback="icheck:")
+# Generations outlive any entry stored under them
+GENERATION_TTL_SECONDS = max(TTL_SECONDS * 10, 86400)
+
+# Lookups of these agents match any record sharing a document, so their generations are per document;
+# the others match exactly one document set
+OVERLAP_AGENTS = ("faq", "k_search")
+
+
+class LocalTier:
+    '''
+    In-process stand-in for the shared tier, with the same semantics as the Redis one
+    (string values, per-key expiry, set-if-absent). Useful for development and tests.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: Dict[str, tuple] = {}
+
+    def _get(self, key: str) -> Optional[str]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.time():
+            del self._values[key]
+            return None
+        return item[0]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl_seconds)
+
+    async def add(self, key: str, value: str, ttl_seconds: int) -> Optional[str]:
+        '''Sets the key only if it is absent, and returns the value it ends up holding.'''
+        with self._lock:
+            current = self._get(key)
+            if current is None:
+                self._values[key] = (value, time.time() + ttl_seconds)
+                return value
+            return current
+
+
+class RedisTier:
+    '''
+    Shared tier on any Redis-compatible server (redis.asyncio client, imported only when configured).
+    '''
+
+    def __init__(self, url: str = REDIS_URL) -> None:
+        import redis.asyncio as redis
+        self.client = redis.from_url(url, decode_responses=True)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return await self.client.mget(keys)
+
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        await self.client.set(key, value, ex=ttl_seconds)
+
+    async def add(self, key: str, value: str, ttl_seconds: int) -> Optional[str]:
+        if await self.client.set(key, value, ex=ttl_seconds, nx=True):
+            return value
+        return await self.client.get(key)
+
+
+class ResultCache:
+    '''
+    Two-tier read-through cache of get_memory_content results: an in-process LRU (with TTL) in front
+    of an optional shared tier.
+
+    Entries are keyed by the lookup and by the current generation of the memory it reads. A save bumps
+    the generation of the user/agent/document set (or, for FAQ and k_search lookups, of each document)
+    it writes to, so stale entries are never served again and simply age out. Generations are random
+    tokens rather than counters, so losing one (eviction, restart) can only cause misses. With a shared
+    tier, generations live there and invalidation reaches every worker; otherwise a worker only sees its
+    own saves and other workers' entries stay served until their TTL, so the cache is then off by default.
+    '''
+
+    def __init__(self, enabled: bool = ENABLED, max_entries: int = MAX_ENTRIES, ttl_seconds: int = TTL_SECONDS,
+                 shared_tier: str = SHARED_TIER) -> None:
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self._local = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self._local_generations = LRUCache(maxsize=max_entries * 4)
+        self._lock = threading.Lock()
+        self.shared = None
+        if enabled and shared_tier == "redis":
+            self.shared = RedisTier()
+        elif enabled and shared_tier == "local":
+            self.shared = LocalTier()
+        elif enabled:
+            print("Result cache enabled without a shared tier: only safe with a single worker, others may serve stale results")
+        self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0, "errors": 0}
+
+    def _generation_keys(self, user_id: str, agent: str, doc_hashes: List[str]) -> List[str]:
+        agent = agent.lower()
+        if agent.startswith(OVERLAP_AGENTS):
+            return [f"{KEY_PREFIX}gen:{user_id}:{agent}:doc:{doc_hash}" for doc_hash in sorted(set(doc_hashes))]
+        return [f"{KEY_PREFIX}gen:{user_id}:{agent}:set:{set_key(doc_hashes)}"]
+
+    async def _generations(self, keys: List[str]) -> List[str]:
+        if self.shared is None:
+            with self._lock:
+                return [self._local_generations.setdefault(key, secrets.token_hex(8)) for key in keys]
+        generations = await self.shared.get_many(keys)
+        for index, generation in enumerate(generations):
+            if generation is None:
+                generations[index] = await self.shared.add(keys[index], secrets.token_hex(8), GENERATION_TTL_SECONDS)
+        return generations
+
+    async def key(self, user_id: str, agent: str, doc_hashes: List[str], processed_params: Optional[Dict[str, Any]]) -> Optional[str]:
+        '''
+        Cache key of a lookup under the current generation of the memory it reads, or None if it is not to be cached.
+
+        Args:
+        processed_params (dict): Lookup parameters, or None for an entry that depends only on the stored memory
+        (e.g. the FAQ candidate pool).
+        '''
+        if not self.enabled:
+            return None
+        try:
+            generations = await self._generations(self._generation_keys(user_id, agent, doc_hashes))
+        except Exception as e:
+            print(f"Exception in ResultCache.key(): {e}")
+            self.stats["errors"] += 1
+            return None
+        canonical = json.dumps(
+            [user_id, agent.lower(), set_key(doc_hashes), processed_params, generations],
+            sort_keys=True, separators=(",", ":"), default=str
+        )
+        return f"{KEY_PREFIX}result:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        '''
+        Returns a copy of the cached value (callers may mutate it), or None on a miss.
+        '''
+        with self._lock:
+            value = self._local.get(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return copy.deepcopy(value)
+        if self.shared is not None:
+            try:
+                (raw,) = await self.shared.get_many([key])
+            except Exception as e:
+                print(f"Exception in ResultCache.get(): {e}")
+                self.stats["errors"] += 1
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                with self._lock:
+                    self._local[key] = value
+                self.stats["shared_hits"] += 1
+                return copy.deepcopy(value)
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._local[key] = copy.deepcopy(value)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, json.dumps(value, default=str), self.ttl_seconds)
+            except Exception as e:
+                print(f"Exception in ResultCache.put(): {e}")
+                self.stats["errors"] += 1
+
+    async def invalidate(self, user_id: str, agent: str, doc_hashes: List[str]) -> None:
+        '''
+        Moves the user/agent/document set written by a save to a new generation.
+        '''
+        if not self.enabled:
+            return
+        keys = self._generation_keys(user_id, agent, doc_hashes)
+        self.stats["invalidations"] += 1
+        if self.shared is None:
+            with self._lock:
+                for key in keys:
+                    self._local_generations[key] = secrets.token_hex(8)
+            return
+        try:
+            for key in keys:
+                await self.shared.set(key, secrets.token_hex(8), GENERATION_TTL_SECONDS)
+        except Exception as e:
+            # The save itself succeeded; entries of the old generation stay served until their TTL
+            print(f"Exception in ResultCache.invalidate(): {e}")
+            self.stats["errors"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "shared_tier": SHARED_TIER if self.shared is not None else "none",
+                "entries": len(self._local), **self.stats}
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    '''
+    Returns the process-wide get_memory result cache.
+    '''
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
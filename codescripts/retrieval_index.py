@@ -0,0 +1,539 @@
+import asyncio, configparser, hashlib, re, time
+from collections import Counter
+from itertools import chain, repeat
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+import numpy as np
+from scipy.sparse import csr_matrix
+from pymongo import IndexModel, ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from utils.db_client import get_database, INTERNAL_COLLECTION_PREFIX
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+SCORER_NAME = config.get("RETRIEVAL", "scorer", fallback="tfidf")
+MIN_SCORE = config.getfloat("RETRIEVAL", "min_score", fallback=None)
+TOP_K = config.getint("RETRIEVAL", "top_k", fallback=10)
+# Upper bound on entries fetched for scoring; the rarest query terms are used to select them. A query whose rarest
+# term alone has more entries than this is scored on an unranked subset of them, so it may miss its best match
+MAX_CANDIDATES = config.getint("RETRIEVAL", "max_candidates", fallback=2000)
+# Precision of the scoring matrices: float32 halves their memory, at the cost of ties and near-threshold scores
+# possibly coming out differently than with float64
+DTYPE = np.dtype(config.get("RETRIEVAL", "dtype", fallback="float64"))
+REBUILD_BATCH_SIZE = 1000
+# A rebuild claims the user's index for this long; a claim left by a worker that died mid-rebuild expires after it
+BUILD_CLAIM_SECONDS = config.getfloat("RETRIEVAL", "build_claim_seconds", fallback=300.0)
+# How often a worker waiting for another one's rebuild checks whether it has finished
+BUILD_POLL_SECONDS = 0.5
+
+# Same tokenisation as sklearn's TfidfVectorizer default
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+# Key of the per-user summary document in the terms collection (analysers never emit an empty term)
+SUMMARY_TERM = ""
+
+
+class IndexStats:
+    '''
+    Corpus statistics a scorer may need: number of indexed entries, average entry length and document frequencies.
+    '''
+
+    def __init__(self, doc_count: int, total_length: int, df: Dict[str, int]) -> None:
+        self.doc_count = doc_count
+        self.avg_length = (total_length / doc_count) if doc_count else 0.0
+        self.df = df
+
+
+class TermMatrices:
+    '''
+    Term counts of a batch of queries and of their candidate entries over the terms they use, built once per search.
+
+    - vocabulary: term -> column
+    - data, indices, indptr: the (candidates x terms) counts as preallocated CSR arrays; rows: the row of each count
+    - entry_lengths: length of each candidate entry
+    - queries: dense (queries x terms) counts
+    '''
+
+    def __init__(self, queries: List[Dict[str, int]], candidates: List[Dict[str, Any]], dtype: np.dtype = DTYPE) -> None:
+        # The per-item work runs in map()/fromiter() rather than Python loops: it dominates the cost of a search
+        entry_features = list(map(itemgetter("features"), candidates))
+        features = list(chain.from_iterable(entry_features))
+        feature_terms = list(map(itemgetter("t"), features))
+        self.terms = list(dict.fromkeys(chain(chain.from_iterable(queries), feature_terms)))
+        self.vocabulary: Dict[str, int] = dict(zip(self.terms, range(len(self.terms))))
+        self.shape = (len(candidates), len(self.terms))
+
+        row_sizes = np.fromiter(map(len, entry_features), dtype=np.int64, count=len(candidates))
+        self.indptr = np.zeros(len(candidates) + 1, dtype=np.int64)
+        np.cumsum(row_sizes, out=self.indptr[1:])
+        self.rows = np.repeat(np.arange(len(candidates)), row_sizes)
+        self.indices = np.fromiter(map(self.vocabulary.__getitem__, feature_terms), dtype=np.int32, count=len(features))
+        self.data = np.fromiter(map(itemgetter("n"), features), dtype=dtype, count=len(features))
+        self.entry_lengths = np.fromiter(map(itemgetter("length"), candidates), dtype=dtype, count=len(candidates))
+
+        self.queries = np.zeros((len(queries), len(self.terms)), dtype=dtype)
+        for row, query in enumerate(queries):
+            self.queries[row, [self.vocabulary[term] for term in query]] = list(query.values())
+
+    def df(self, stats: IndexStats) -> np.ndarray:
+        return np.fromiter(map(stats.df.get, self.terms, repeat(0)), dtype=self.queries.dtype, count=len(self.terms))
+
+    def row_sums(self, values: np.ndarray) -> np.ndarray:
+        '''Per-candidate sums of values given for every stored count.'''
+        return np.bincount(self.rows, weights=values, minlength=self.shape[0]).astype(self.data.dtype, copy=False)
+
+    def product(self, entry_values: np.ndarray, query_values: np.ndarray) -> np.ndarray:
+        '''
+        (queries x candidates) dot products of the entries, with entry_values in place of their counts, and the query rows.
+        '''
+        entries = csr_matrix((entry_values, self.indices, self.indptr), shape=self.shape, copy=False)
+        return np.asarray(entries @ query_values.T).T
+
+
+def _inverse_norms(squared_sums: np.ndarray) -> np.ndarray:
+    # Rows with a zero norm are all zeros and stay so
+    norms = np.sqrt(squared_sums)
+    return np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+
+class Scorer:
+    '''
+    Base class of the pluggable retrieval scorers: turns text into term counts and scores the candidate entries
+    against a batch of queries at once.
+    '''
+    name = ""
+    default_min_score = 0.0
+
+    def features(self, text: str) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def score_matrix(self, matrices: TermMatrices, stats: IndexStats) -> np.ndarray:
+        '''
+        Returns the dense (queries x candidates) score matrix.
+        '''
+        raise NotImplementedError
+
+
+class TfidfScorer(Scorer):
+    '''
+    Cosine similarity of TF-IDF vectors, weighted like sklearn's TfidfVectorizer (smooth idf, l2 norm).
+    '''
+    name = "tfidf"
+    default_min_score = 0.1
+
+    def features(self, text: str) -> Dict[str, int]:
+        return dict(Counter(TOKEN_PATTERN.findall(text.lower())))
+
+    def score_matrix(self, matrices, stats):
+        idf = np.log((1 + stats.doc_count) / (1 + matrices.df(stats))) + 1
+        queries = matrices.queries * idf
+        queries *= _inverse_norms((queries * queries).sum(axis=1))[:, None]
+        weights = matrices.data * idf[matrices.indices]
+        weights *= _inverse_norms(matrices.row_sums(weights * weights))[matrices.rows]
+        return matrices.product(weights, queries)
+
+
+class BM25Scorer(Scorer):
+    '''
+    Okapi BM25 over word tokens. Scores are unnormalised, so min_score is in BM25 units.
+    '''
+    name = "bm25"
+    default_min_score = 1.0
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+
+    def features(self, text: str) -> Dict[str, int]:
+        return dict(Counter(TOKEN_PATTERN.findall(text.lower())))
+
+    def score_matrix(self, matrices, stats):
+        df = matrices.df(stats)
+        idf = np.log(1 + (stats.doc_count - df + 0.5) / (df + 0.5))
+        relative_lengths = matrices.entry_lengths / stats.avg_length if stats.avg_length else np.ones_like(matrices.entry_lengths)
+        length_norm = 1 - self.b + self.b * relative_lengths
+        # Saturated term frequencies, computed on the stored (non-zero) counts only
+        tf = matrices.data
+        weights = idf[matrices.indices] * tf * (self.k1 + 1) / (tf + self.k1 * length_norm[matrices.rows])
+        # Query term counts do not weigh: each query term counts once
+        return matrices.product(weights, (matrices.queries > 0).astype(matrices.data.dtype))
+
+
+class HashedNgramScorer(Scorer):
+    '''
+    Cosine similarity of hashed character n-gram counts (n-grams taken within word boundaries).
+    Robust to typos and inflections, and the vocabulary is bounded by the number of hash buckets.
+    '''
+    name = "hashed_ngram"
+    default_min_score = 0.3
+
+    def __init__(self, ngram_range: Tuple[int, int] = (3, 4), n_features: int = 2 ** 20) -> None:
+        self.ngram_range = ngram_range
+        self.n_features = n_features
+
+    def _bucket(self, gram: str) -> str:
+        # Stable across processes, unlike hash()
+        digest = hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest()
+        return str(int.from_bytes(digest, "little") % self.n_features)
+
+    def features(self, text: str) -> Dict[str, int]:
+        counts = Counter()
+        for word in TOKEN_PATTERN.findall(text.lower()):
+            padded = f" {word} "
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for i in range(max(1, len(padded) - n + 1)):
+                    counts[self._bucket(padded[i:i + n])] += 1
+        return dict(counts)
+
+    def score_matrix(self, matrices, stats):
+        # Dot products of the raw counts over the product of the norms, so equal scores compare equal
+        query_norms = np.sqrt((matrices.queries * matrices.queries).sum(axis=1))
+        entry_norms = np.sqrt(matrices.row_sums(matrices.data * matrices.data))
+        norms = query_norms[:, None] * entry_norms[None, :]
+        dots = matrices.product(matrices.data, matrices.queries)
+        return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+
+SCORERS = {
+    scorer.name: scorer for scorer in (TfidfScorer, BM25Scorer, HashedNgramScorer)
+}
+
+
+def select_terms(query: Dict[str, int], df: Dict[str, int], max_candidates: int) -> List[str]:
+    '''
+    Query terms whose postings are read to find candidates: rarest first, so the candidate
+    budget is spent on the most selective postings, stopping once `max_candidates` is reached.
+    '''
+    selected_terms = []
+    budget = 0
+    for term in sorted(query, key=lambda t: df.get(t, 0)):
+        n = df.get(term, 0)
+        if not n:
+            continue
+        if selected_terms and budget + n > max_candidates:
+            break
+        selected_terms.append(term)
+        budget += n
+    return selected_terms
+
+
+def candidate_batches(selected_terms: List[List[str]], df: Dict[str, int], max_candidates: int) -> List[List[int]]:
+    '''
+    Groups queries (by position) whose candidates can be fetched with one query. The postings of a query whose
+    selected terms hold at most max_candidates entries fit whole in a shared fetch of max_candidates per query;
+    a query with more is cut at max_candidates on its own, so it is fetched alone to see the same candidates.
+
+    The cut is not by score: ranking the whole posting list is what the cap avoids, so such a query (one whose
+    rarest term is in more than max_candidates entries) is ranked over whichever max_candidates entries the store
+    returns first (in insertion order on the embedded store), and can miss a better match outside them.
+    '''
+    bounded = [i for i, terms in enumerate(selected_terms) if terms and sum(df.get(t, 0) for t in terms) <= max_candidates]
+    unbounded = [[i] for i, terms in enumerate(selected_terms) if terms and i not in bounded]
+    return ([bounded] if bounded else []) + unbounded
+
+
+def top_k_indices(scores: np.ndarray, eligible: np.ndarray, min_score: float, top_k: int) -> np.ndarray:
+    '''
+    Indices of the top_k eligible scores above min_score, best first; equal scores keep their candidate order.
+    Only the entries above the k-th best score are sorted (argpartition), not the whole row.
+    '''
+    indices = np.flatnonzero(eligible & (scores > min_score))
+    if top_k <= 0:
+        return indices[:0]
+    if len(indices) > top_k:
+        kth = scores[indices[np.argpartition(-scores[indices], top_k - 1)[top_k - 1]]]
+        above = indices[scores[indices] > kth]
+        indices = np.concatenate([above, indices[scores[indices] == kth][:top_k - len(above)]])
+    return indices[np.lexsort((indices, -scores[indices]))]
+
+
+def rank_candidates(scorer: Scorer, queries: List[Dict[str, int]], candidates: List[Dict[str, Any]], stats: IndexStats,
+                    min_score: float, top_k: int, selected_terms: Optional[List[List[str]]] = None,
+                    dtype: np.dtype = DTYPE) -> List[List[Tuple[Any, float]]]:
+    '''
+    Scores the candidate entries against every query with one matrix product and returns, per query, the best
+    (qa_id, score) pairs above min_score.
+
+    Args:
+    selected_terms (List[list]): Per query, the terms its candidates were selected by (see select_terms); when a
+    batch of queries shares its candidates, a query only ranks the candidates it would have fetched on its own.
+    '''
+    if not candidates or not queries:
+        return [[] for _ in queries]
+    matrices = TermMatrices(queries, candidates, dtype)
+    scores = scorer.score_matrix(matrices, stats)
+    if selected_terms is None:
+        eligible = np.ones(scores.shape, dtype=bool)
+    else:
+        selected = np.zeros(matrices.queries.shape, dtype=dtype)
+        for row, terms in enumerate(selected_terms):
+            selected[row, [matrices.vocabulary[term] for term in terms if term in matrices.vocabulary]] = 1
+        eligible = matrices.product(np.ones_like(matrices.data), selected) > 0
+    return [
+        [(candidates[index]["qa_id"], float(row_scores[index])) for index in top_k_indices(row_scores, row_eligible, min_score, top_k)]
+        for row_scores, row_eligible in zip(scores, eligible)
+    ]
+
+
+class RetrievalIndex:
+    '''
+    Persistent inverted index over stored k_search queries, kept per user in two shared collections:
+
+    - entries: one document per stored Q&A with its term counts (multikey-indexed on the terms)
+    - terms:   document frequency per (user, term), plus one summary document per user
+
+    Entries are added incrementally when a k_search response is saved, and a lookup only reads
+    the entries that share a query term, so its cost does not grow with the size of the memory.
+    The index is derived data and can be rebuilt from the memory collection at any time. A rebuild first
+    claims the user's summary document, so that only one worker rebuilds a user's index at a time, and
+    additions wait until no rebuild of the user's index holds a claim.
+    '''
+
+    def __init__(self, db: Optional[AsyncDatabase] = None, scorer: Optional[Scorer] = None,
+                 min_score: Optional[float] = MIN_SCORE, max_candidates: int = MAX_CANDIDATES) -> None:
+        self.db = db if db is not None else get_database()
+        self.scorer = scorer or SCORERS[SCORER_NAME]()
+        self.min_score = min_score if min_score is not None else self.scorer.default_min_score
+        self.max_candidates = max_candidates
+        # Collections are per scorer so that switching scorer never mixes incompatible features
+        self.entries: AsyncCollection = self.db[f"{INTERNAL_COLLECTION_PREFIX}k_search_entries.{self.scorer.name}"]
+        self.terms: AsyncCollection = self.db[f"{INTERNAL_COLLECTION_PREFIX}k_search_terms.{self.scorer.name}"]
+        self._indexes_ready = False
+        self._built_users = set()
+        # Serialises the builds of a user's index within this process; the summary claim does so across workers
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+
+    async def _ensure_indexes(self) -> None:
+        if self._indexes_ready:
+            return
+        await self.entries.create_indexes([
+            IndexModel([("user_id", ASCENDING), ("qa_id", ASCENDING)], name="user_qa_unique", unique=True),
+            IndexModel([("user_id", ASCENDING), ("features.t", ASCENDING)], name="user_feature_terms"),
+        ])
+        await self.terms.create_indexes([
+            IndexModel([("user_id", ASCENDING), ("term", ASCENDING)], name="user_term_unique", unique=True),
+        ])
+        self._indexes_ready = True
+
+    def _entry(self, user_id: str, qa_id: Any, query_text: str, doc_hashes: List[str]) -> Dict[str, Any]:
+        features = self.scorer.features(query_text)
+        return {
+            "user_id": user_id,
+            "qa_id": qa_id,
+            "doc_hashes": doc_hashes,
+            "features": [{"t": term, "n": count} for term, count in features.items()],
+            "length": sum(features.values()),
+        }
+
+    async def _stats(self, user_id: str, terms: Iterable[str]) -> IndexStats:
+        summary = await self.terms.find_one({"user_id": user_id, "term": SUMMARY_TERM}) or {}
+        df = {}
+        async for doc in self.terms.find({"user_id": user_id, "term": {"$in": list(set(terms))}}):
+            df[doc["term"]] = doc["df"]
+        return IndexStats(summary.get("doc_count", 0), summary.get("total_length", 0), df)
+
+    async def ensure_built(self, user_id: str, memory_collection: AsyncCollection, memory_filter: Optional[Dict[str, Any]] = None) -> None:
+        '''
+        Builds the user's index from their memory collection if it has never been built. If another worker is
+        building it, waits for that build instead.
+        '''
+        if user_id in self._built_users:
+            return
+        await self._ensure_indexes()
+        async with self._build_locks.setdefault(user_id, asyncio.Lock()):
+            while user_id not in self._built_users:
+                summary = await self.terms.find_one({"user_id": user_id, "term": SUMMARY_TERM}, {"built": 1})
+                if summary and summary.get("built"):
+                    self._built_users.add(user_id)
+                elif await self._claim_build(user_id, force=False):
+                    await self._build(user_id, memory_collection, memory_filter)
+                else:
+                    await asyncio.sleep(BUILD_POLL_SECONDS)
+
+    async def _claim_build(self, user_id: str, force: bool) -> bool:
+        '''
+        Atomically claims the rebuild of the user's index on their summary document. Fails while another worker
+        holds an unexpired claim, and, unless forced, once the index is built.
+        '''
+        now = time.time()
+        claim_filter = {"user_id": user_id, "term": SUMMARY_TERM, "building_until": {"$not": {"$gt": now}}}
+        if not force:
+            claim_filter["built"] = {"$ne": True}
+        try:
+            # Without a matching summary the upsert inserts one, which the unique index rejects if a summary exists
+            await self.terms.find_one_and_update(
+                claim_filter, {"$set": {"building_until": now + BUILD_CLAIM_SECONDS}}, upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def add(self, user_id: str, qa_id: Any, query_text: str, doc_hashes: List[str]) -> None:
+        '''
+        Adds one stored k_search Q&A to the user's index.
+        '''
+        await self.add_many(user_id, [(qa_id, query_text, doc_hashes)])
+
+    async def _wait_for_build(self, user_id: str) -> None:
+        # Polls until no worker holds an unexpired claim on the user's index
+        while await self.terms.find_one({"user_id": user_id, "term": SUMMARY_TERM, "building_until": {"$gt": time.time()}}, {"_id": 1}):
+            await asyncio.sleep(BUILD_POLL_SECONDS)
+
+    async def add_many(self, user_id: str, items: List[Tuple[Any, str, List[str]]]) -> None:
+        '''
+        Adds stored k_search Q&As, given as (qa_id, query_text, doc_hashes), to the user's index in one write per collection.
+
+        The Q&As are already saved, so a rebuild reads them from memory itself: additions wait for a rebuild in this
+        process (on the user's build lock) or another worker (on its claim) to finish rather than write into an index
+        being replaced. A rebuild claimed in another worker between that check and these writes leaves the Q&As
+        indexed once (an entry it already wrote is skipped here), but may count their terms twice until the next rebuild.
+        '''
+        if not items:
+            return
+        await self._ensure_indexes()
+        entries = [self._entry(user_id, qa_id, query_text, doc_hashes) for qa_id, query_text, doc_hashes in items]
+        async with self._build_locks.setdefault(user_id, asyncio.Lock()):
+            await self._wait_for_build(user_id)
+            entries = await self._insert_entries(entries)
+            if not entries:
+                return
+            df = Counter(item["t"] for entry in entries for item in entry["features"])
+            operations = [
+                UpdateOne({"user_id": user_id, "term": term}, {"$inc": {"df": n}}, upsert=True)
+                for term, n in df.items()
+            ]
+            operations.append(UpdateOne(
+                {"user_id": user_id, "term": SUMMARY_TERM},
+                {"$inc": {"doc_count": len(entries), "total_length": sum(entry["length"] for entry in entries)}},
+                upsert=True
+            ))
+            await self.terms.bulk_write(operations, ordered=False)
+
+    async def search(self, user_id: str, query_text: str, doc_hashes: List[str], top_k: int = TOP_K) -> List[Tuple[Any, float]]:
+        '''
+        Finds the stored Q&As most similar to the query among those sharing at least one of the documents.
+
+        Returns:
+        List[tuple]: (qa_id, score) pairs above the scorer's minimum score, best first.
+        '''
+        return (await self.search_many(user_id, [query_text], doc_hashes, top_k))[0]
+
+    async def search_many(self, user_id: str, query_texts: List[str], doc_hashes: List[str],
+                          top_k: int = TOP_K) -> List[List[Tuple[Any, float]]]:
+        '''
+        search() for several queries over the same documents: the candidates of all of them are fetched with one
+        query and scored with one matrix product (a query with more candidates than max_candidates is fetched on its
+        own). Each query gets the hits search() would return for it alone, with scores equal up to rounding.
+        '''
+        queries = [self.scorer.features(query_text) for query_text in query_texts]
+        query_terms = {term for query in queries for term in query}
+        if not query_terms:
+            return [[] for _ in queries]
+        query_stats = await self._stats(user_id, query_terms)
+        selected_terms = [select_terms(query, query_stats.df, self.max_candidates) for query in queries]
+        results: List[List[Tuple[Any, float]]] = [[] for _ in queries]
+        for batch in candidate_batches(selected_terms, query_stats.df, self.max_candidates):
+            batch_terms = sorted({term for i in batch for term in selected_terms[i]})
+            candidates = await self.entries.find({
+                "user_id": user_id,
+                "features.t": {"$in": batch_terms},
+                "doc_hashes": {"$in": doc_hashes}
+            }).to_list(self.max_candidates * len(batch))
+            if not candidates:
+                continue
+            batch_queries = [queries[i] for i in batch]
+            candidate_terms = {item["t"] for entry in candidates for item in entry["features"]}
+            stats = await self._stats(user_id, candidate_terms | {term for query in batch_queries for term in query})
+            hits = rank_candidates(self.scorer, batch_queries, candidates, stats, self.min_score, top_k,
+                                   [selected_terms[i] for i in batch])
+            for i, query_hits in zip(batch, hits):
+                results[i] = query_hits
+        return results
+
+    async def rebuild(self, user_id: str, memory_collection: AsyncCollection, memory_filter: Optional[Dict[str, Any]] = None) -> int:
+        '''
+        Rebuilds the user's index from the k_search records in their memory collection, after any rebuild of it
+        already running in another worker.
+
+        Args:
+        memory_filter (dict): Selects the user's records in a collection shared with other users.
+
+        Returns:
+        int: The number of indexed Q&As.
+        '''
+        await self._ensure_indexes()
+        async with self._build_locks.setdefault(user_id, asyncio.Lock()):
+            while not await self._claim_build(user_id, force=True):
+                await asyncio.sleep(BUILD_POLL_SECONDS)
+            return await self._build(user_id, memory_collection, memory_filter)
+
+    async def _insert_entries(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        '''
+        Inserts index entries, skipping those already indexed (written by a rebuild or addition racing this one).
+
+        Returns:
+        List[dict]: The entries inserted.
+        '''
+        try:
+            await self.entries.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            existing = {error["index"] for error in errors}
+            return [entry for index, entry in enumerate(entries) if index not in existing]
+        return entries
+
+    async def _build(self, user_id: str, memory_collection: AsyncCollection, memory_filter: Optional[Dict[str, Any]]) -> int:
+        # Runs under a claim on the summary document, which is kept (and the claim with it) while the rest is replaced.
+        # Term counts are set rather than inserted, so that they replace any an addition racing the claim wrote.
+        try:
+            await self.entries.delete_many({"user_id": user_id})
+            await self.terms.delete_many({"user_id": user_id, "term": {"$ne": SUMMARY_TERM}})
+
+            df = Counter()
+            total_length = 0
+            count = 0
+            batch = []
+            async for record in memory_collection.find({**(memory_filter or {}), "agent": "k_search"}, {"query_text": 1, "doc_hashes": 1}):
+                entry = self._entry(user_id, record["_id"], record.get("query_text") or "", record.get("doc_hashes", []))
+                df.update(item["t"] for item in entry["features"])
+                total_length += entry["length"]
+                count += 1
+                batch.append(entry)
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    await self._insert_entries(batch)
+                    batch = []
+            if batch:
+                await self._insert_entries(batch)
+
+            term_updates = [
+                UpdateOne({"user_id": user_id, "term": term}, {"$set": {"df": n}}, upsert=True) for term, n in df.items()
+            ]
+            for start in range(0, len(term_updates), REBUILD_BATCH_SIZE):
+                await self.terms.bulk_write(term_updates[start:start + REBUILD_BATCH_SIZE], ordered=False)
+        except Exception:
+            await self.terms.update_one({"user_id": user_id, "term": SUMMARY_TERM}, {"$unset": {"building_until": ""}})
+            raise
+        await self.terms.update_one(
+            {"user_id": user_id, "term": SUMMARY_TERM},
+            {"$set": {"doc_count": count, "total_length": total_length, "built": True}, "$unset": {"building_until": ""}}
+        )
+        self._built_users.add(user_id)
+        print(f"Rebuilt {self.scorer.name} retrieval index for {user_id}: {count} Q&A(s)")
+        return count
+
+
+_retrieval_index: Optional[RetrievalIndex] = None
+
+
+def get_retrieval_index() -> RetrievalIndex:
+    '''
+    Returns the process-wide k_search retrieval index for the configured scorer.
+    '''
+    global _retrieval_index
+    if _retrieval_index is None:
+        _retrieval_index = RetrievalIndex()
+    return _retrieval_index
@@ -0,0 +1,82 @@
+import configparser, threading
+from typing import Dict, Any, Optional
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+ENABLED = config.getboolean("SHARED_MEMORY", "enabled", fallback=False)
+# opt_in: only the listed tenants take part | opt_out: every tenant except the listed ones
+POLICY = config.get("SHARED_MEMORY", "policy", fallback="opt_in")
+TENANTS = [t.strip() for t in config.get("SHARED_MEMORY", "tenants", fallback="").split(",") if t.strip()]
+# Pseudo-user whose memory is the shared tier
+SHARED_USER_ID = config.get("SHARED_MEMORY", "user_id", fallback="__shared__")
+
+# Order in which a result of the shared tier is preferred to the user's own
+MATCH_STRENGTH = {"No Match": 0, "Partial Match": 1, "Full Match": 2}
+
+
+def match_strength(result: Dict[str, Any]) -> float:
+    '''
+    Rank of a lookup result. A near match ranks just below the same result on the exact documents.
+    '''
+    if result.get("i_check_result") == "Near Match":
+        return MATCH_STRENGTH.get(result["near_match"]["i_check_result"], 0) - 0.5
+    return MATCH_STRENGTH.get(result.get("i_check_result"), 0)
+
+
+class SharedMemory:
+    '''
+    Cross-user tier of memory for documents several tenants work on (public regulations, standard contracts).
+
+    The tier is the memory of a pseudo-user, so its records are keyed, like any user's, purely by the
+    document hashes and the canonical agent parameters. Participating tenants add everything they save
+    to it, and their lookups fall back to it when their own memory has no full match. A tenant only
+    takes part if the policy allows it: opted in under `opt_in`, or not opted out under `opt_out`.
+    '''
+
+    def __init__(self, enabled: bool = ENABLED, policy: str = POLICY, tenants: Optional[list] = None,
+                 user_id: str = SHARED_USER_ID) -> None:
+        if policy not in ("opt_in", "opt_out"):
+            raise ValueError(f"Unsupported shared memory policy: {policy}")
+        self.enabled = enabled
+        self.policy = policy
+        self.tenants = set(TENANTS if tenants is None else tenants)
+        self.user_id = user_id
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "contributions": 0, "errors": 0}
+
+    def participates(self, user_id: str) -> bool:
+        '''
+        Whether a tenant reads from and contributes to the shared tier.
+        '''
+        if not self.enabled or user_id == self.user_id:
+            return False
+        listed = user_id in self.tenants
+        return listed if self.policy == "opt_in" else not listed
+
+    def prefer(self, own_result: Dict[str, Any], shared_result: Dict[str, Any]) -> bool:
+        '''
+        Whether the shared tier's result is used instead of the user's own: only if it matches strictly better.
+        '''
+        return match_strength(shared_result) > match_strength(own_result)
+
+    def count(self, stat: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += n
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "policy": self.policy, **self.stats}
+
+
+_shared_memory: Optional[SharedMemory] = None
+
+
+def get_shared_memory() -> SharedMemory:
+    '''
+    Returns the process-wide shared memory tier policy.
+    '''
+    global _shared_memory
+    if _shared_memory is None:
+        _shared_memory = SharedMemory()
+    return _shared_memory
@@ -0,0 +1,122 @@
+import configparser, hashlib
+from typing import List, Dict, Optional
+import numpy as np
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+ENABLED = config.getboolean("SIMILARITY", "enabled", fallback=False)
+SHINGLE_SIZE = config.getint("SIMILARITY", "shingle_size", fallback=5)
+NUM_PERM = config.getint("SIMILARITY", "num_perm", fallback=128)
+# num_perm / bands rows per band: with 32 x 4, documents from ~0.6 similarity on are likely to share a band
+BANDS = config.getint("SIMILARITY", "bands", fallback=32)
+# Minimum estimated Jaccard similarity of two documents for memory of one to be reused for the other
+THRESHOLD = config.getfloat("SIMILARITY", "threshold", fallback=0.8)
+
+# Shingles are folded into the signature in batches of this many, bounding the (batch x num_perm) work array
+BATCH_SHINGLES = 8192
+# Signatures are only comparable when computed with the same permutations, so the seed is fixed
+PERMUTATION_SEED = 1
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHINGLE_MULTIPLIER = np.uint64(1000003)
+
+
+def _permutations(num_perm: int):
+    # RandomState (rather than Generator) keeps its stream stable across numpy versions
+    rng = np.random.RandomState(PERMUTATION_SEED)
+    a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+class MinHash:
+    '''
+    Streaming MinHash signature of a normalised text over its lower-cased word shingles.
+
+    The text is fed in pieces in document order (a piece may end in the middle of a word), so the signature
+    is built alongside the text hash without holding the text. Two signatures estimate the Jaccard similarity
+    of the documents' shingle sets; see similarity().
+    '''
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE) -> None:
+        self.shingle_size = shingle_size
+        self.signature = np.full(num_perm, _MAX_HASH, dtype=np.uint64)
+        self._a, self._b = _permutations(num_perm)
+        self._carry = ""
+        # Hashes of the words not folded yet, preceded by the last shingle_size - 1 words already folded
+        self._words: List[int] = []
+        self._word_hashes: Dict[str, int] = {}
+        self._folded = False
+
+    def _word_hash(self, word: str) -> int:
+        value = self._word_hashes.get(word)
+        if value is None:
+            value = int.from_bytes(hashlib.blake2b(word.lower().encode("utf-8"), digest_size=4).digest(), "little")
+            self._word_hashes[word] = value
+        return value
+
+    def update(self, text: str) -> None:
+        '''
+        Feeds the next piece of normalised text.
+        '''
+        if not text:
+            return
+        text = self._carry + text
+        words = text.split()
+        self._carry = words.pop() if words and not text[-1].isspace() else ""
+        self._words.extend(self._word_hash(word) for word in words)
+        if len(self._words) >= BATCH_SHINGLES + self.shingle_size - 1:
+            self._fold(self.shingle_size)
+
+    def _fold(self, shingle_size: int) -> None:
+        count = len(self._words) - shingle_size + 1
+        if count <= 0:
+            return
+        hashes = np.array(self._words, dtype=np.uint64)
+        shingles = hashes[:count].copy()
+        for offset in range(1, shingle_size):
+            shingles = (shingles * _SHINGLE_MULTIPLIER + hashes[offset:offset + count]) & _MAX_HASH
+        # Operands are below 2**32, so a * x + b cannot overflow 64 bits
+        permuted = ((shingles[:, None] * self._a + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        np.minimum(self.signature, permuted.min(axis=0), out=self.signature)
+        self._words = self._words[count:]
+        self._folded = True
+
+    def finish(self) -> Optional[List[int]]:
+        '''
+        Returns the signature, or None for a text without words. A text shorter than one shingle is a single shingle.
+        '''
+        if self._carry:
+            self._words.append(self._word_hash(self._carry))
+            self._carry = ""
+        if not self._folded and len(self._words) < self.shingle_size:
+            if not self._words:
+                return None
+            self._fold(len(self._words))
+        else:
+            self._fold(self.shingle_size)
+        return [int(value) for value in self.signature]
+
+
+def band_keys(signature: List[int], bands: int = BANDS) -> List[str]:
+    '''
+    LSH keys of a signature, one per band of rows: documents sharing a key are candidates for a near match,
+    so candidates are found with an index lookup rather than by comparing against every stored document.
+    '''
+    rows = len(signature) // bands
+    values = np.array(signature, dtype=np.uint32)
+    return [
+        f"{band}:{hashlib.blake2b(values[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(bands)
+    ]
+
+
+def similarity(signature: List[int], other: List[int]) -> float:
+    '''
+    Estimated Jaccard similarity of the shingle sets of two documents (0 for signatures of different sizes).
+    '''
+    if len(signature) != len(other) or not signature:
+        return 0.0
+    return float(np.mean(np.array(signature, dtype=np.uint64) == np.array(other, dtype=np.uint64)))
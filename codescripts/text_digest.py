@@ -0,0 +1,116 @@
+import hashlib
+from typing import Callable, Dict, Any, List, Optional
+from utils.tokenizers import count_tokens, HEURISTIC_TOKENIZER
+from codescripts.similarity import MinHash, ENABLED as SIMILARITY_ENABLED
+from codescripts.chunking import ContentChunker, ENABLED as CHUNKING_ENABLED
+
+# Raw text is normalised, and normalised text token-counted, in pieces of about this many characters
+UPDATE_CHUNK_CHARS = 64 * 1024
+TOKEN_COUNT_CHUNK_CHARS = 64 * 1024
+PREVIEW_CHARS = 500
+
+
+class TextDigest:
+    '''
+    Incremental equivalent of hash_text(remove_formatting(text) + '\\n').
+
+    Raw text is fed in pieces (e.g. one PDF page at a time) in document order. Whitespace is
+    collapsed across piece boundaries exactly as remove_formatting() does on the full text, and the
+    normalised output is fed straight into SHA-256 and the token counters, so the full document
+    text never has to be held in memory. Large pieces are processed in bounded-size chunks so
+    that normalisation never copies more than UPDATE_CHUNK_CHARS at a time. With [SIMILARITY]
+    enabled, the normalised text also feeds a MinHash signature for near-duplicate matching, and
+    with [CHUNKING] enabled, a content-defined chunker for chunk-level memory reuse.
+
+    token_counter is called on word-aligned pieces of the normalised text and its counts are summed per
+    tokenizer; it defaults to count_tokens, and None leaves token_counts empty.
+    '''
+
+    def __init__(self, similarity: bool = SIMILARITY_ENABLED, chunking: bool = CHUNKING_ENABLED,
+                 token_counter: Optional[Callable[[str], Dict[str, int]]] = count_tokens) -> None:
+        self._sha = hashlib.sha256()
+        self._length = 0
+        # Whether any non-whitespace text has been emitted, and whether whitespace followed it
+        self._started = False
+        self._pending_space = False
+        self._token_buffer: List[str] = []
+        self._token_buffered = 0
+        self.token_counts: Dict[str, int] = {}
+        self.preview = ""
+        self._minhash = MinHash() if similarity else None
+        self._chunker = ContentChunker() if chunking else None
+        self._token_counter = token_counter
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def update(self, text: Optional[str]) -> None:
+        '''
+        Feeds the next piece of raw (unnormalised) text.
+        '''
+        if not text:
+            return
+        for offset in range(0, len(text), UPDATE_CHUNK_CHARS):
+            self._update_chunk(text[offset:offset + UPDATE_CHUNK_CHARS])
+
+    def _update_chunk(self, text: str) -> None:
+        # str.split() and the \s class used by remove_formatting() share the same definition of whitespace
+        words = text.split()
+        if not words:
+            self._pending_space = self._started
+            return
+        if self._started and (self._pending_space or text[0].isspace()):
+            self._emit(" ")
+        self._emit(" ".join(words))
+        self._started = True
+        self._pending_space = text[-1].isspace()
+
+    def _emit(self, normalised: str) -> None:
+        self._sha.update(normalised.encode('utf-8'))
+        if self._minhash is not None:
+            self._minhash.update(normalised)
+        if self._chunker is not None:
+            self._chunker.update(normalised)
+        self._length += len(normalised)
+        if len(self.preview) < PREVIEW_CHARS:
+            self.preview += normalised[:PREVIEW_CHARS - len(self.preview)]
+        if self._token_counter is None:
+            return
+        self._token_buffer.append(normalised)
+        self._token_buffered += len(normalised)
+        if self._token_buffered >= TOKEN_COUNT_CHUNK_CHARS:
+            self._count_buffered_tokens(final=False)
+
+    def _count_buffered_tokens(self, final: bool) -> None:
+        buffered = "".join(self._token_buffer)
+        # Cut before the last space so that no word is split between two counts
+        cut = len(buffered) if final else buffered.rfind(" ")
+        if cut <= 0:
+            self._token_buffer, self._token_buffered = [buffered], len(buffered)
+            return
+        for name, count in self._token_counter(buffered[:cut]).items():
+            self.token_counts[name] = self.token_counts.get(name, 0) + count
+        rest = buffered[cut:]
+        self._token_buffer, self._token_buffered = ([rest], len(rest)) if rest else ([], 0)
+
+    def finish(self) -> Dict[str, Any]:
+        '''
+        Completes the digest with the trailing newline that extract_local_text() appends.
+
+        Returns:
+        dict: "text_hash", "text_length" and "token_counts" of the normalised text, its "minhash"
+        signature (None unless similarity is enabled) and its "chunks" (None unless chunking is enabled).
+        '''
+        self._emit("\n")
+        self._count_buffered_tokens(final=True)
+        if HEURISTIC_TOKENIZER in self.token_counts:
+            # The heuristic is not additive over pieces, so it is taken over the whole length
+            self.token_counts[HEURISTIC_TOKENIZER] = max(1, self._length // 4)
+        return {
+            "text_hash": self._sha.hexdigest(),
+            "text_length": self._length,
+            "token_counts": self.token_counts,
+            "minhash": self._minhash.finish() if self._minhash is not None else None,
+            "chunks": self._chunker.finish() if self._chunker is not None else None
+        }
@@ -1,18 +1,182 @@
 from PyPDF2 import PdfReader
-from typing import Optional
-import re,docx
+from typing import Optional, Dict, Any, Tuple, List, Iterator, Union, BinaryIO
+import zipfile
+from lxml import etree
+from docx.oxml import parse_xml
+from docx.text.paragraph import Paragraph
 from utils.s3_operations import S3Helper
+from codescripts.fingerprint_cache import get_fingerprint_cache, FingerprintCache
+from codescripts.text_digest import TextDigest
+from codescripts.similarity import ENABLED as SIMILARITY_ENABLED
+from codescripts.chunking import ENABLED as CHUNKING_ENABLED
+from codescripts.document_source import DocumentSource, SPOOL_MAX_BYTES
 import os, hashlib
 
-TMP_DIR = '/tmp'
-if not os.path.exists(TMP_DIR):
-    os.makedirs(TMP_DIR)
+W_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+OFFICE_DOCUMENT_RELATIONSHIP = '/officeDocument'
 
 class ExtractText:        
     def remove_formatting(self, text: str) -> str:
-        text = re.sub(r'[\n\t\r]', ' ', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+        # Collapses every whitespace run to one space and strips the ends in a single pass
+        # (str.split() whitespace is the same set as the regex \s class)
+        return ' '.join(text.split())
+
+    def open_document(self, path: str, spill_min_bytes: int = SPOOL_MAX_BYTES, metadata: Optional[Dict[str, Any]] = None) -> DocumentSource:
+        '''
+        Opens a document for extraction. S3 objects are streamed into memory, or into a unique
+        temp file when at least `spill_min_bytes` long; local paths are used in place.
+        The caller must close() the returned source.
+        
+        Args:
+        path (str): The path of the PDF/DOCX file (local or s3://bucket/key).
+        spill_min_bytes (int): Size from which an S3 object is written to disk instead of memory.
+        metadata (Optional[dict]): The S3 object's metadata from an earlier HEAD (see lookup_fingerprint), if any.
+        
+        Returns:
+        DocumentSource: The opened document.
+        '''
+        if path.startswith('s3://'):
+            # Extract the S3 bucket and object key
+            s3_bucket = path.split('/')[2]
+            s3_key = '/'.join(path.split('/')[3:])
+            return DocumentSource.from_s3(s3_bucket, s3_key, spill_min_bytes, metadata)
+        return DocumentSource.local(path)
+
+    def iter_pdf_pages(self, source: Union[str, BinaryIO], errors: List[str], start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        '''
+        Yields the raw text of each page of a PDF in order. Pages that fail to extract are
+        skipped and reported in `errors` instead of aborting the document.
+        
+        Args:
+        source (Union[str, BinaryIO]): The local path of the PDF file, or a binary file object.
+        errors (List[str]): Receives one message per page that could not be extracted.
+        start (int): Index of the first page to extract.
+        stop (Optional[int]): Index after the last page to extract (default: the last page).
+        
+        Returns:
+        Iterator[str]: The text of each successfully extracted page.
+        '''
+        pages = PdfReader(source).pages
+        for page_number in range(start, len(pages) if stop is None else stop):
+            try:
+                page_text = pages[page_number].extract_text()
+            except Exception as e:
+                errors.append(f"page {page_number + 1}: {e}")
+                continue
+            if page_text is None:
+                errors.append(f"page {page_number + 1}: no text returned")
+                continue
+            yield page_text
+
+    def _docx_document_part(self, archive: zipfile.ZipFile) -> str:
+        relationships = etree.fromstring(archive.read('_rels/.rels'))
+        for relationship in relationships:
+            if relationship.get('Type', '').endswith(OFFICE_DOCUMENT_RELATIONSHIP):
+                return relationship.get('Target').lstrip('/')
+        return 'word/document.xml'
+
+    def iter_docx_text(self, source: Union[str, BinaryIO]) -> Iterator[str]:
+        '''
+        Yields the raw text of a DOCX file (local path or binary file object) paragraph by paragraph, with the newlines that join them.
+
+        The document XML is parsed incrementally and each body element is discarded once read, so
+        memory stays bounded by the largest paragraph or table instead of the whole document.
+        Paragraph text comes from python-docx itself, so it is identical to docx.Document(path).paragraphs.
+        '''
+        with zipfile.ZipFile(source) as archive:
+            with archive.open(self._docx_document_part(archive)) as part:
+                index = 0
+                for _, element in etree.iterparse(part, events=('end',)):
+                    parent = element.getparent()
+                    if parent is None or parent.tag != W_NAMESPACE + 'body':
+                        continue
+                    if element.tag == W_NAMESPACE + 'p':
+                        if index:
+                            yield '\n'
+                        yield Paragraph(parse_xml(etree.tostring(element)), None).text
+                        index += 1
+                    # Free the body element just read and everything before it
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del parent[0]
+
+    def iter_document_text(self, document: DocumentSource, errors: List[str]) -> Iterator[str]:
+        '''
+        Yields the raw text of a PDF/DOCX document in pieces; unsupported file types yield nothing.
+        '''
+        if document.extension == '.pdf':
+            yield from self.iter_pdf_pages(document.open(), errors)
+        elif document.extension == '.docx':
+            yield from self.iter_docx_text(document.open())
+
+    def extract_local_text(self, path: str) -> str:
+        '''
+        Extracts text from a local PDF/DOCX file.
+        
+        Args:
+        path (str): The local path of the PDF/DOCX file.
+        
+        Returns:
+        str: A plain string containing text content, or an empty string if the file cannot be read.
+        '''
+        return self.extract_document_text(DocumentSource.local(path))
+
+    def extract_document_text(self, document: DocumentSource) -> str:
+        errors = []
+        try:
+            text = ''.join(self.iter_document_text(document, errors))
+        except Exception as e:
+            print("Exception in extract_local_text():   ", e)
+            return ""
+        if errors:
+            print(f"Exception in extract_local_text(): {len(errors)} page(s) skipped: {errors}")
+        if document.extension not in ('.pdf', '.docx') or (errors and not text):
+            return ""
+        text = self.remove_formatting(text)
+        print(text[:500])
+        print(f"--- Text extraction completed---")
+        return text + '\n'
+
+    def digest_local_text(self, path: str) -> Dict[str, Any]:
+        '''
+        Streams the text of a local PDF/DOCX file into a TextDigest without materialising it.
+        The hash equals hash_text(extract_local_text(path)) for documents that extract without errors.
+        
+        Args:
+        path (str): The local path of the PDF/DOCX file.
+        
+        Returns:
+        dict: "text_hash", "text_length" and "token_counts" of the text, and "extraction_errors"
+        listing the pages that were skipped. The hash is empty if nothing could be extracted.
+        '''
+        return self.digest_document(DocumentSource.local(path))
+
+    def digest_document(self, document: DocumentSource) -> Dict[str, Any]:
+        errors = []
+        if document.extension not in ('.pdf', '.docx'):
+            return self.empty_digest(errors)
+        digest = TextDigest()
+        try:
+            for piece in self.iter_document_text(document, errors):
+                digest.update(piece)
+        except Exception as e:
+            print("Exception in digest_local_text():   ", e)
+            return self.empty_digest(errors + [str(e)])
+        return self.finish_digest(digest, errors)
+
+    def finish_digest(self, digest: TextDigest, errors: List[str]) -> Dict[str, Any]:
+        if errors:
+            print(f"Exception in text extraction: {len(errors)} page(s) skipped: {errors}")
+            if not digest.started:
+                return self.empty_digest(errors)
+        result = digest.finish()
+        print(digest.preview)
+        print(f"--- Text extraction completed---")
+        return {**result, "extraction_errors": errors}
+
+    @staticmethod
+    def empty_digest(errors: List[str]) -> Dict[str, Any]:
+        return {"text_hash": "", "text_length": 0, "token_counts": {}, "minhash": None, "chunks": None, "extraction_errors": errors}
 
     def get_text(self, path: str) -> Optional[str]:
         '''
@@ -22,52 +186,16 @@ class ExtractText:
         path (str): The path of the PDF/DOCX files.
         
         Returns:
-        str: A plain string containing text content, or None if the files cannot be read.
+        str: A plain string containing text content, or an empty string if the files cannot be read.
         '''
         print(f"\n--- Started text extraction ---\n")
-        extracted_text = ""
         try:
-                if path.startswith('s3://'):
-                # Extract the S3 bucket and object key
-                    s3_bucket = path.split('/')[2]
-                    s3_helper = S3Helper(s3_bucket)
-                    s3_key = '/'.join(path.split('/')[3:])
-                    local_file_path = os.path.join(TMP_DIR, os.path.basename(s3_key))
-                    # Download the file from S3
-                    s3_helper.download_file_from_s3(s3_key, local_file_path)
-                    path = local_file_path
-                    
-                if path.lower().endswith('.pdf'):
-                    content = PdfReader(path)
-                    pdf_text = ""
-                    for page in content.pages:
-                        try:
-                            pdf_text += page.extract_text()
-                        except:
-                            return None
-                    pdf_text = self.remove_formatting(pdf_text)
-                    extracted_text += pdf_text
-                    extracted_text += '\n'
-                    print(pdf_text[:500])
-                    print(f"--- PDF text extraction completed---")
-
-                elif path.lower().endswith('.docx'):
-                    doc = docx.Document(path)
-                    fullText = []
-                    for para in doc.paragraphs:
-                        fullText.append(para.text)
-                    doc_text = '\n'.join(fullText)
-                    doc_text = self.remove_formatting(doc_text)
-                    print(doc_text[:500])
-                    print(f"--- DOCX text extraction completed---")
-                    extracted_text += doc_text
-                    extracted_text += '\n'
-
+            document = self.open_document(path)
         except Exception as e:
             print("Exception in get_text():   ", e)
-            return None
-        finally:
-            return extracted_text
+            return ""
+        with document:
+            return self.extract_document_text(document)
         
     def hash_text(self, text: str) -> str:
         '''
@@ -79,4 +207,85 @@ class ExtractText:
         Returns:
         str: A hash of the text.
         '''
-        return hashlib.sha256(text.encode('utf-8')).hexdigest() if text else ''
\ No newline at end of file
+        return hashlib.sha256(text.encode('utf-8')).hexdigest() if text else ''
+
+    def _source_key(self, path: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        '''
+        Builds the fingerprint cache key for a document from its metadata only (HEAD request for S3, stat for local files).
+        Returns None if the metadata cannot be read, in which case the cache is bypassed, along with the S3 metadata.
+        '''
+        try:
+            if path.startswith('s3://'):
+                s3_bucket = path.split('/')[2]
+                s3_key = '/'.join(path.split('/')[3:])
+                metadata = S3Helper(s3_bucket).head_object(s3_key)
+                return FingerprintCache.s3_source_key(s3_bucket, s3_key, metadata["etag"], metadata["version_id"]), metadata
+            stat = os.stat(path)
+            return FingerprintCache.local_source_key(os.path.abspath(path), stat.st_size, stat.st_mtime_ns), None
+        except Exception as e:
+            print(f"Exception in _source_key(): {e}")
+            return None, None
+
+    def lookup_fingerprint(self, path: str) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        '''
+        Looks up the document in the fingerprint cache using only its metadata.
+        
+        Returns:
+        tuple: The source key (None if metadata is unavailable), the cached fingerprint (None on a miss) and, for
+        S3 objects, the HEAD metadata to open the document with on a miss, so that the object is read as keyed.
+        '''
+        source_key, metadata = self._source_key(path)
+        if not source_key:
+            return None, None, None
+        cached = get_fingerprint_cache().get(source_key)
+        if cached and ((SIMILARITY_ENABLED and cached["minhash"] is None) or (CHUNKING_ENABLED and cached["chunks"] is None)):
+            # Cached before similarity or chunking was enabled: extracted once more to compute the signature and chunks
+            cached = None
+        if cached:
+            print(f"Fingerprint cache hit for {path}")
+        return source_key, cached, metadata
+
+    def build_fingerprint(self, source_key: Optional[str], digest: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        '''
+        Records the digest of freshly extracted text in the fingerprint cache and returns the fingerprint.
+        '''
+        digest = digest or self.empty_digest([])
+        # Failed, empty or partial extractions are not cached so that transient errors are retried
+        if source_key and digest["text_hash"] and not digest["extraction_errors"]:
+            get_fingerprint_cache().put(
+                source_key, digest["text_hash"], digest["text_length"], digest["token_counts"], digest.get("minhash"),
+                digest.get("chunks")
+            )
+        return {
+            "text_hash": digest["text_hash"],
+            "text_length": digest["text_length"],
+            "token_counts": digest["token_counts"],
+            "minhash": digest.get("minhash"),
+            "chunks": digest.get("chunks"),
+            "extraction_errors": digest["extraction_errors"]
+        }
+
+    def get_fingerprint(self, path: str) -> Dict[str, Any]:
+        '''
+        Returns the text hash of the given file, served from the fingerprint cache when the source is unchanged.
+        
+        Args:
+        path (str): The path of the PDF/DOCX files.
+        
+        Returns:
+        dict: "text_hash" and "text_length" of the extracted text, "token_counts" keyed by tokenizer name
+        (may be empty for cache entries written before token counts were stored), the "minhash" similarity
+        signature (None unless [SIMILARITY] is enabled), the content-defined "chunks" (None unless [CHUNKING] is
+        enabled), and "extraction_errors" listing the pages that could not be extracted.
+        '''
+        source_key, cached, metadata = self.lookup_fingerprint(path)
+        if cached:
+            return {**cached, "extraction_errors": []}
+        print(f"\n--- Started text extraction ---\n")
+        try:
+            document = self.open_document(path, metadata=metadata)
+        except Exception as e:
+            print("Exception in get_fingerprint():   ", e)
+            return self.build_fingerprint(None, None)
+        with document:
+            return self.build_fingerprint(source_key, self.digest_document(document))
@@ -1,11 +1,17 @@
+import asyncio, math
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any
-from codescripts.i_check import MemoryManager
+from codescripts.i_check import get_memory_manager
+from codescripts.memory_backend import get_memory_backend
+from codescripts.result_cache import get_result_cache
+from codescripts.shared_memory import get_shared_memory
+from utils.s3_operations import get_s3_metrics
 from utils.process_agent_params import process_agent_params, get_standard_model_name
-from codescripts.text_extractor import ExtractText
+from codescripts.ingestion import DocumentIngestor
 from codescripts.optimiser import Optimiser
+from utils.tokenizers import tokenizer_name
 
 app = FastAPI()
 
@@ -15,6 +21,15 @@ class GetMemoryRequest(BaseModel):
     documents: List[str]
     parameters: Dict[str, Any]
 
+class MemoryCheck(BaseModel):
+    agent: str
+    parameters: Dict[str, Any]
+
+class BatchGetMemoryRequest(BaseModel):
+    user_id: str
+    documents: List[str]
+    checks: List[MemoryCheck]
+
 class StoreMemoryRequest(BaseModel):
     user_id: str
     agent: str
@@ -22,6 +37,69 @@ class StoreMemoryRequest(BaseModel):
     parameters: Dict[str, Any]
     provided_response: Dict[str, Any]
 
+class BatchStoreMemoryRequest(BaseModel):
+    items: List[StoreMemoryRequest]
+
+
+def document_tokens(fingerprints: List[Dict[str, Any]], model_name: str) -> int:
+    """
+    Sum the token counts stored with the document fingerprints for the model's tokenizer.
+    Fingerprints without a count for it (cached before counts were stored) fall back to ~4 chars per token.
+    """
+    name = tokenizer_name(model_name)
+    return sum(fingerprint["token_counts"].get(name, fingerprint["text_length"] // 4) for fingerprint in fingerprints)
+
+
+def document_sketches(fingerprints: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+    """
+    MinHash signatures of the documents by text hash (empty unless [SIMILARITY] is enabled).
+    """
+    return {fingerprint["text_hash"]: fingerprint["minhash"] for fingerprint in fingerprints if fingerprint.get("minhash")}
+
+
+def document_chunks(fingerprints: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Content-defined chunks of the documents by text hash (empty unless [CHUNKING] is enabled).
+    """
+    return {fingerprint["text_hash"]: fingerprint["chunks"] for fingerprint in fingerprints if fingerprint.get("chunks")}
+
+
+def uncovered_tokens(fingerprints: List[Dict[str, Any]], model_name: str, chunk_plan: Dict[str, Any]) -> int:
+    """
+    Token count of the chunks a chunk-level reuse leaves to process: each planned document's tokens in proportion
+    to the length of its uncovered chunks. Documents without a plan are covered by their own memory.
+    """
+    name = tokenizer_name(model_name)
+    total = 0
+    for fingerprint in fingerprints:
+        plan = chunk_plan.get(fingerprint["text_hash"])
+        if not plan or not fingerprint["text_length"]:
+            continue
+        tokens = fingerprint["token_counts"].get(name, fingerprint["text_length"] // 4)
+        uncovered_length = sum(chunk["length"] for chunk in plan["uncovered"])
+        total += math.ceil(tokens * uncovered_length / fingerprint["text_length"])
+    return total
+
+
+def compute_optimisation(model_name: str, agent: str, fingerprints: List[Dict[str, Any]], memory_content: Dict[str, Any], processed_params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compute the token/cost savings of a memory lookup result.
+    The shared tier marker of the result is moved into the metrics, so the response body keeps its shape.
+    A near match saves what the same result on the exact documents would; a chunk-level reuse saves all but the
+    processing of its uncovered chunks.
+    """
+    chunk_plan = memory_content.get("chunk_plan")
+    optimiser = Optimiser(
+        model_name, agent, document_tokens(fingerprints, model_name),
+        uncovered_tokens(fingerprints, model_name, chunk_plan) if chunk_plan else None
+    )
+    memory_tier = memory_content.pop("memory_tier", "user")
+    if agent == "k_search":
+        i_check_result = memory_content.get("near_match", {}).get("i_check_result") or memory_content.get("i_check_result", {})
+        return optimiser.compute(memory_content.get("processing_content", {}),memory_content.get("memory_content", {}), processed_params, i_check_result=i_check_result, memory_tier=memory_tier)
+    else:    
+        return optimiser.compute(memory_content.get("processing_content", {}),memory_content.get("memory_content", {}), processed_params, i_check_result=None, memory_tier=memory_tier)
+
 
 @app.post("/get_memory")
 async def get_memory(request: GetMemoryRequest):
@@ -41,33 +119,27 @@ async def get_memory(request: GetMemoryRequest):
 
         if not is_valid_params:
             raise ValueError(f"Missing parameters for agent {agent}: {missing_params}")
-        doc_hashes = []
-        total_extracted_text = ""
-        for doc in documents:    
-            try:
-                print('Extracting Text')
-                extracted_text = ExtractText().get_text(doc)
-                total_extracted_text += extracted_text
-                hashed_text = ExtractText().hash_text(extracted_text)
-                doc_hashes.append(hashed_text)
-
-            except Exception as e:
-                print(f"Error extracting text: {e}")
-                return JSONResponse(
-                    {
-                        "message": "Error extracting text from file(s)",
-                        "data": {}
-                    }, status_code = 500)
+        try:
+            print('Extracting Text')
+            fingerprints = await DocumentIngestor().ingest(documents)
+        except Exception as e:
+            print(f"Error extracting text: {e}")
+            return JSONResponse(
+                {
+                    "message": "Error extracting text from file(s)",
+                    "data": {}
+                }, status_code = 500)
+        doc_hashes = [fingerprint["text_hash"] for fingerprint in fingerprints]
         print(f"Document hashes: {doc_hashes}")
-        memory_content = MemoryManager().get_memory_content(user_id, agent, doc_hashes, processed_params)
+        memory_content = await get_memory_manager().get_memory_content(
+            user_id, agent, doc_hashes, processed_params, document_sketches(fingerprints), document_chunks(fingerprints)
+        )
         model_name = parameters.get("model_name", "gpt-4o")  
         model_name = get_standard_model_name(model_name)
 
-        optimiser = Optimiser(model_name, agent, total_extracted_text)
-        if agent == "k_search":
-            optimisation_metrics = optimiser.compute(memory_content.get("processing_content", {}),memory_content.get("memory_content", {}), processed_params, i_check_result=memory_content.get("i_check_result", {}))
-        else:    
-            optimisation_metrics = optimiser.compute(memory_content.get("processing_content", {}),memory_content.get("memory_content", {}), processed_params, i_check_result=None)
+        optimisation_metrics = compute_optimisation(
+            model_name, agent, fingerprints, memory_content, processed_params
+        )
 
         # Inject into response
         memory_content["optimisation"] = optimisation_metrics
@@ -82,6 +154,73 @@ async def get_memory(request: GetMemoryRequest):
             status_code=500
         )
 
+@app.post("/get_memory/batch")
+async def get_memory_batch(request: BatchGetMemoryRequest):
+    """
+    Retrieve memory content for several agent checks against the same documents in one round trip.
+    Documents are fingerprinted once; each result matches what an individual get_memory call returns.
+    """
+    try:
+        user_id = request.user_id
+        documents = request.documents
+        checks = request.checks
+
+        if not user_id or not documents or not checks:
+            raise ValueError("User ID or documents or checks are missing")
+
+        results = [None] * len(checks)
+        valid_checks = []
+        for index, check in enumerate(checks):
+            try:
+                if not check.agent:
+                    raise ValueError("Agent is missing")
+                is_valid_params, processed_params, missing_params = process_agent_params(check.agent, check.parameters)
+                if not is_valid_params:
+                    raise ValueError(f"Missing parameters for agent {check.agent}: {missing_params}")
+                valid_checks.append((index, check, processed_params))
+            except Exception as e:
+                results[index] = {"agent": check.agent, "message": "Error in retrieving memory: " + str(e)}
+
+        try:
+            print('Extracting Text')
+            fingerprints = await DocumentIngestor().ingest(documents)
+        except Exception as e:
+            print(f"Error extracting text: {e}")
+            return JSONResponse(
+                {
+                    "message": "Error extracting text from file(s)",
+                    "data": {}
+                }, status_code = 500)
+        doc_hashes = [fingerprint["text_hash"] for fingerprint in fingerprints]
+        print(f"Document hashes: {doc_hashes}")
+
+        memory_contents = await get_memory_manager().get_memory_contents(
+            user_id, doc_hashes, [(check.agent, processed_params) for _, check, processed_params in valid_checks],
+            document_sketches(fingerprints), document_chunks(fingerprints)
+        )
+
+        for (index, check, processed_params), memory_content in zip(valid_checks, memory_contents):
+            if isinstance(memory_content, Exception):
+                print(f"Error: {memory_content}")
+                results[index] = {"agent": check.agent, "message": "Error in retrieving memory: " + str(memory_content)}
+                continue
+            model_name = get_standard_model_name(check.parameters.get("model_name", "gpt-4o"))
+            memory_content["optimisation"] = compute_optimisation(
+                model_name, check.agent, fingerprints, memory_content, processed_params
+            )
+            results[index] = {"agent": check.agent, **memory_content}
+
+        return JSONResponse(
+            {"results": results},
+            status_code=200
+        )
+    except Exception as e:
+        print(f"Error: {e}")
+        return JSONResponse(
+            {"message": "Error in retrieving memory: " + str(e)},
+            status_code=500
+        )
+
 @app.post("/save_memory")
 async def save_memory(request: StoreMemoryRequest):
     """
@@ -102,24 +241,23 @@ async def save_memory(request: StoreMemoryRequest):
         if not is_valid_params:
             raise ValueError(f"Missing parameters for agent {agent}: {missing_params}")
 
-        doc_hashes = []
-        for doc in documents:    
-            try:
-                print('Extracting Text')
-                extracted_text = ExtractText().get_text(doc)
-                hashed_text = ExtractText().hash_text(extracted_text)
-                doc_hashes.append(hashed_text)
-
-            except Exception as e:
-                print(f"Error extracting text: {e}")
-                return JSONResponse(
-                    {
-                        "message": "Error extracting text from file(s)",
-                        "data": {}
-                    }, status_code = 500)
+        try:
+            print('Extracting Text')
+            fingerprints = await DocumentIngestor().ingest(documents)
+        except Exception as e:
+            print(f"Error extracting text: {e}")
+            return JSONResponse(
+                {
+                    "message": "Error extracting text from file(s)",
+                    "data": {}
+                }, status_code = 500)
+        doc_hashes = [fingerprint["text_hash"] for fingerprint in fingerprints]
         print(f"Document hashes: {doc_hashes}")
 
-        memory_content = MemoryManager().save_memory_content(user_id, agent, doc_hashes, processed_params, provided_response)
+        memory_content = await get_memory_manager().save_memory_content(
+            user_id, agent, doc_hashes, processed_params, provided_response, document_sketches(fingerprints),
+            document_chunks(fingerprints)
+        )
         
         return JSONResponse(
             {
@@ -132,4 +270,100 @@ async def save_memory(request: StoreMemoryRequest):
         return JSONResponse(
             {"message": "Error in saving memory: " + str(e)},
             status_code=500
-        )
\ No newline at end of file
+        )
+
+@app.post("/save_memory/batch")
+async def save_memory_batch(request: BatchStoreMemoryRequest):
+    """
+    Save many agent responses, for one or more users, in one round trip.
+    Each user's items are deduplicated against each other and applied with a single bulk write;
+    each result message means the same as the one an individual save_memory call returns.
+    """
+    try:
+        items = request.items
+        if not items:
+            raise ValueError("Items are missing")
+
+        results = [None] * len(items)
+        valid_items = []
+        for index, item in enumerate(items):
+            try:
+                if not item.user_id or not item.agent or not item.documents or not item.provided_response:
+                    raise ValueError("User ID or agent or documents or response are missing")
+                is_valid_params, processed_params, missing_params = process_agent_params(item.agent, item.parameters)
+                if not is_valid_params:
+                    raise ValueError(f"Missing parameters for agent {item.agent}: {missing_params}")
+                valid_items.append((index, item, processed_params))
+            except Exception as e:
+                results[index] = {"message": "Error in saving memory: " + str(e)}
+
+        # Fingerprint every distinct document once, whichever items it appears in
+        documents = list(dict.fromkeys(doc for _, item, _ in valid_items for doc in item.documents))
+        try:
+            print('Extracting Text')
+            fingerprints = await DocumentIngestor().ingest(documents)
+        except Exception as e:
+            print(f"Error extracting text: {e}")
+            return JSONResponse(
+                {
+                    "message": "Error extracting text from file(s)",
+                    "data": {}
+                }, status_code = 500)
+        hash_by_document = {doc: fingerprint["text_hash"] for doc, fingerprint in zip(documents, fingerprints)}
+        doc_sketches = document_sketches(fingerprints)
+        doc_chunks = document_chunks(fingerprints)
+
+        items_by_user = {}
+        for index, item, processed_params in valid_items:
+            doc_hashes = [hash_by_document[doc] for doc in item.documents]
+            items_by_user.setdefault(item.user_id, []).append(
+                (index, (item.agent, doc_hashes, processed_params, item.provided_response))
+            )
+
+        memory_manager = get_memory_manager()
+        user_ids = list(items_by_user)
+        user_outcomes = await asyncio.gather(
+            *(memory_manager.save_memory_contents(user_id, [entry for _, entry in items_by_user[user_id]], doc_sketches, doc_chunks) for user_id in user_ids),
+            return_exceptions=True
+        )
+
+        for user_id, outcomes in zip(user_ids, user_outcomes):
+            indices = [index for index, _ in items_by_user[user_id]]
+            if isinstance(outcomes, Exception):
+                print(f"Error: {outcomes}")
+                outcomes = [outcomes] * len(indices)
+            for index, outcome in zip(indices, outcomes):
+                if isinstance(outcome, Exception):
+                    results[index] = {"message": "Error in saving memory: " + str(outcome)}
+                else:
+                    results[index] = {"message": str(outcome)}
+
+        return JSONResponse(
+            {"results": results},
+            status_code=200
+        )
+    except Exception as e:
+        print(f"Error: {e}")
+        return JSONResponse(
+            {"message": "Error in saving memory: " + str(e)},
+            status_code=500
+        )
+
+@app.get("/health")
+async def health():
+    """
+    Readiness check reporting memory store connectivity (and, for Mongo, connection pool statistics), plus S3 transfer,
+    result cache and shared memory tier metrics.
+    """
+    backend = get_memory_backend()
+    db_health = {"backend": backend.name, **(await backend.health())}
+    return JSONResponse(
+        {
+            "status": "ok" if db_health["ready"] else "unavailable",
+            "database": db_health,
+            "s3": get_s3_metrics(),
+            "result_cache": get_result_cache().snapshot(),
+            "shared_memory": get_shared_memory().snapshot()
+        },
+        status_code=200 if db_health["ready"] else 503
+    )
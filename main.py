@@ -1,9 +1,26 @@
+import asyncio
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.i_check_router import router as i_check_router
+from codescripts.ingestion import shutdown_executors
+from codescripts.i_check import get_memory_manager
+from codescripts.memory_backend import get_memory_backend
+from codescripts.optimiser import warm_up
+from utils.s3_operations import shutdown_s3
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await get_memory_backend().init()
+    get_memory_manager()
+    await asyncio.to_thread(warm_up)
+    yield
+    await get_memory_backend().close()
+    shutdown_executors()
+    shutdown_s3()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1,7 +1,10 @@
 from fastapi import APIRouter
-from controllers.i_check_controller import get_memory, save_memory
+from controllers.i_check_controller import get_memory, get_memory_batch, save_memory, save_memory_batch, health
 
 router = APIRouter()
 
 router.post("/save_memory")(save_memory)
-router.post("/get_memory")(get_memory)
\ No newline at end of file
+router.post("/save_memory/batch")(save_memory_batch)
+router.post("/get_memory")(get_memory)
+router.post("/get_memory/batch")(get_memory_batch)
+router.get("/health")(health)
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+The application modules read config.ini from the working directory when they are imported, so the tests run in
+a temporary directory holding a test configuration: they never touch the configuration, SQLite files, MongoDB
+database or S3 buckets of a deployment (S3 tests run against moto's in-process mock). MongoDB tests use
+ICHECK_TEST_MONGO_URI (default: a local server) and are skipped when no server answers there.
+"""
+import asyncio, os, shutil, sys, tempfile
+from functools import lru_cache
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MONGO_URI = os.environ.get("ICHECK_TEST_MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.environ.get("ICHECK_TEST_MONGO_DB", "icheck_test")
+
+TEST_CONFIG = f"""[API_KEYS]
+OPENAI_API_KEY = test
+
+[DB_DETAILS]
+uri = {MONGO_URI}
+db = {MONGO_DB}
+server_selection_timeout_ms = 2000
+
+[STORAGE]
+backend = embedded
+
+[AWS]
+aws_region = us-east-1
+aws_access_key_id = test
+aws_secret_access_key = test
+"""
+
+sys.path.insert(0, REPO_ROOT)
+_original_directory = os.getcwd()
+_test_directory = tempfile.mkdtemp(prefix="icheck_tests_")
+
+
+def pytest_configure(config) -> None:
+    config.addinivalue_line("markers", "mongo: needs the MongoDB server at ICHECK_TEST_MONGO_URI (skipped without one)")
+
+
+def pytest_runtest_setup(item) -> None:
+    if item.get_closest_marker("mongo") and not mongo_available():
+        pytest.skip(f"no MongoDB server at {MONGO_URI}")
+
+
+def pytest_sessionstart(session) -> None:
+    # Before collection, which imports the application modules
+    with open(os.path.join(_test_directory, "config.ini"), "w") as f:
+        f.write(TEST_CONFIG)
+    os.chdir(_test_directory)
+
+
+def pytest_sessionfinish(session, exitstatus) -> None:
+    os.chdir(_original_directory)
+    shutil.rmtree(_test_directory, ignore_errors=True)
+
+
+@lru_cache(maxsize=None)
+def mongo_available() -> bool:
+    '''
+    Whether a MongoDB server answers at ICHECK_TEST_MONGO_URI (checked once per session).
+    '''
+    async def ping() -> None:
+        from pymongo import AsyncMongoClient
+        client = AsyncMongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+        try:
+            await client.admin.command("ping")
+        finally:
+            await client.close()
+
+    try:
+        asyncio.run(ping())
+    except Exception:
+        return False
+    return True
+
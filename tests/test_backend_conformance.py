@@ -0,0 +1,319 @@
+"""
+Storage backend conformance: the same save/get scenario is run against every backend (the embedded store in a
+temporary file, MongoDB in both layouts under a throwaway user) and must give the same observable results.
+"""
+import asyncio, random, re, uuid
+from typing import List, Dict, Any, Tuple
+import pytest
+from conftest import MONGO_URI, MONGO_DB
+from codescripts.memory_backend import MemoryBackend
+from codescripts.i_check import MemoryManager
+from codescripts.similarity import MinHash
+from codescripts.chunking import ContentChunker
+
+DOC_A = "a" * 64
+DOC_B = "b" * 64
+DOC_C = "c" * 64
+DOC_D = "d" * 64
+DOC_E = "e" * 64
+DOC_F = "f" * 64
+DOC_G = "0" * 64
+
+FAQ_PARAMS = {"question_count": 4, "focus_areas": ["risk", ""]}
+
+
+def _questions(*specs: Tuple[str, str, int]) -> Dict[str, Any]:
+    return {"questions": [
+        {"question": question, "answer": f"Answer to {question}", "focus_area": focus_area, "rank": rank}
+        for question, focus_area, rank in specs
+    ]}
+
+
+# (agent, doc_hashes, processed_params, provided_response), saved one at a time
+SINGLE_SAVES = [
+    ("summariser", [DOC_A, DOC_B], {"compression_ratio": 50, "focus_areas": ["risk"]}, {"summary": "Summary at 50."}),
+    ("summariser", [DOC_A, DOC_B], {"compression_ratio": 50, "focus_areas": ["risk"]}, {"summary": "Summary at 50."}),
+    ("summariser", [DOC_B], {"compression_ratio": 30, "focus_areas": []}, {"summary": "Summary at 30."}),
+    ("doc_extractor", [DOC_A], {}, {"entity_table": [{"entity_type": "Party", "values": ["Acme"]}]}),
+    ("doc_extractor", [DOC_A], {}, {"entity_table": [{"entity_type": "party", "values": ["Globex"]}, {"entity_type": "Date", "values": ["2025-01-01"]}]}),
+    ("faq_generator", [DOC_A], FAQ_PARAMS, _questions(("What is the term?", "", 1), ("Who bears the risk?", "risk", 2))),
+    ("faq_generator", [DOC_A], FAQ_PARAMS, _questions(("What is the term?", "", 1), ("Is there a penalty?", "risk", 3))),
+    ("faq_generator", [DOC_A], FAQ_PARAMS, _questions(("What is the term?", "", 1))),
+    ("k_search", [DOC_A], {"query_text": "What is the notice period?", "sources": "doc"}, {"response": "Thirty days."}),
+    ("k_search", [DOC_A, DOC_B], {"query_text": "Who signs the renewal notice?", "sources": "doc"}, {"response": "The buyer."}),
+    ("unknown_agent", [DOC_A], {}, {}),
+]
+
+# Saved as one batch after the single saves
+BATCH_SAVES = [
+    ("faq_generator", [DOC_C], FAQ_PARAMS, _questions(("When does it end?", "", 1))),
+    ("faq_generator", [DOC_C], FAQ_PARAMS, _questions(("When does it end?", "", 1), ("What is excluded?", "risk", 2))),
+    ("doc_extractor", [DOC_C], {}, {"entity_table": [{"entity_type": "Amount", "values": ["100"]}]}),
+    ("doc_extractor", [DOC_C], {}, {"entity_table": [{"entity_type": "Amount", "values": ["200"]}]}),
+    ("k_search", [DOC_C], {"query_text": "What is the notice period for renewal?", "sources": "doc"}, {"response": "Sixty days."}),
+    ("k_search", [DOC_C], {"query_text": "What is the notice period for renewal?", "sources": "doc"}, {"response": "Sixty days."}),
+    ("summariser", [DOC_C], {"compression_ratio": 40, "focus_areas": []}, {"summary": "Summary of C."}),
+]
+
+# (agent, doc_hashes, processed_params) looked up after the saves; none of them needs an LLM call
+LOOKUPS = [
+    ("summariser", [DOC_B, DOC_A], {"compression_ratio": 50, "focus_areas": ["risk"]}),
+    ("summariser", [DOC_A, DOC_B], {"compression_ratio": 70, "focus_areas": ["risk"]}),
+    ("summariser", [DOC_A, DOC_B], {"compression_ratio": 20, "focus_areas": ["risk"]}),
+    ("summariser", [DOC_A, DOC_B], {"compression_ratio": 50, "focus_areas": []}),
+    ("summariser", [DOC_C], {"compression_ratio": 40, "focus_areas": []}),
+    ("doc_extractor", [DOC_A], {"entity_list": ["Party", "Date"]}),
+    ("doc_extractor", [DOC_A], {"entity_list": ["PARTY", "Amount"]}),
+    ("doc_extractor", [DOC_C], {"entity_list": ["Amount"]}),
+    ("doc_extractor", [DOC_A, DOC_C], {"entity_list": ["Amount"]}),
+    ("faq_generator", [DOC_A], {"question_count": 3, "focus_areas": ["risk", ""]}),
+    ("faq_generator", [DOC_A, DOC_C], {"question_count": 5, "focus_areas": ["Risk", ""]}),
+    ("faq_generator", [DOC_B], {"question_count": 2, "focus_areas": []}),
+    ("k_search", [DOC_A], {"query_text": "what is the notice period?  ", "sources": "doc"}),
+    ("k_search", [DOC_B], {"query_text": "Who signs the renewal notice?", "sources": "doc"}),
+    ("k_search", [DOC_C], {"query_text": "Completely unrelated zebra question", "sources": "doc"}),
+]
+
+# Near-duplicate matching: memory is saved for DOC_D, then looked up for DOC_E, a re-export of it with a changed
+# footer, and for an unrelated document
+NEAR_BASE_TEXT = " ".join(f"Clause {i}: the supplier shall deliver lot {i} within {i % 30 + 1} days." for i in range(200))
+NEAR_TEXTS = {
+    "re-export": NEAR_BASE_TEXT + " Page 1 of 12, exported 2025-06-01.",
+    "unrelated": " ".join(f"Minutes item {i}: the board noted report {i * 7}." for i in range(200)),
+}
+NEAR_PARAMS = {"entity_list": ["Supplier"]}
+
+
+def _sketch(text: str) -> List[int]:
+    minhash = MinHash()
+    minhash.update(text)
+    return minhash.finish()
+
+
+# Chunk-level reuse: memory is saved for DOC_F, then looked up for DOC_G, the same text with an appendix, and for
+# an unrelated document
+CHUNK_BASE_TEXT = " ".join(f"Section {i}: premium rate {i * 3} applies to band {i % 17} of the schedule." for i in range(1500))
+CHUNK_TEXTS = {
+    "appendix": CHUNK_BASE_TEXT + " " + " ".join(f"Appendix item {i}: revised rate {i * 5}." for i in range(300)),
+    "unrelated": NEAR_TEXTS["unrelated"],
+}
+CHUNK_PARAMS = {"compression_ratio": 50, "focus_areas": []}
+
+
+def _chunks(text: str) -> List[Dict[str, Any]]:
+    chunker = ContentChunker()
+    chunker.update(text)
+    return chunker.finish()
+
+
+# (query_text, doc_hashes) searched in the retrieval index directly
+SEARCHES = [
+    ("notice period", [DOC_A, DOC_C]),
+    ("renewal notice", [DOC_B]),
+    ("who signs", [DOC_C]),
+]
+
+
+def _normalise(outcome: Any) -> Any:
+    # Record IDs are backend specific
+    if isinstance(outcome, Exception):
+        return f"{type(outcome).__name__}: {outcome}"
+    if isinstance(outcome, str):
+        return re.sub(r"Inserted object with ID: \S+", "Inserted object with ID: <id>", outcome)
+    return outcome
+
+
+async def run_scenario(backend: MemoryBackend, seed: int = 7) -> List[Tuple[str, Any]]:
+    '''
+    Runs the conformance scenario against a backend under a throwaway user and returns its
+    observable results as (step, result) pairs, with backend-specific IDs normalised away.
+    '''
+    memory_manager = MemoryManager(backend)
+    user_id = f"conformance_{uuid.uuid4().hex[:12]}"
+    results = []
+    try:
+        for step, (agent, doc_hashes, params, response) in enumerate(SINGLE_SAVES):
+            try:
+                outcome = await memory_manager.save_memory_content(user_id, agent, doc_hashes, params, response)
+            except Exception as e:
+                outcome = e
+            results.append((f"save {step} ({agent})", _normalise(outcome)))
+
+        outcomes = await memory_manager.save_memory_contents(user_id, BATCH_SAVES)
+        for step, ((agent, _, _, _), outcome) in enumerate(zip(BATCH_SAVES, outcomes)):
+            results.append((f"batch save {step} ({agent})", _normalise(outcome)))
+
+        for step, (agent, doc_hashes, params) in enumerate(LOOKUPS):
+            # FAQ selection breaks ties randomly
+            random.seed(seed + step)
+            try:
+                outcome = await memory_manager.get_memory_content(user_id, agent, doc_hashes, params)
+            except Exception as e:
+                outcome = e
+            results.append((f"get {step} ({agent})", _normalise(outcome)))
+
+        outcome = await memory_manager.save_memory_content(
+            user_id, "doc_extractor", [DOC_D], {}, {"entity_table": [{"entity_type": "Supplier", "values": ["Acme"]}]},
+            {DOC_D: _sketch(NEAR_BASE_TEXT)}
+        )
+        results.append(("near save", _normalise(outcome)))
+        for name, text in NEAR_TEXTS.items():
+            outcome = await memory_manager.get_memory_content(user_id, "doc_extractor", [DOC_E], NEAR_PARAMS, {DOC_E: _sketch(text)})
+            results.append((f"near get ({name})", outcome))
+
+        outcome = await memory_manager.save_memory_content(
+            user_id, "summariser", [DOC_F], CHUNK_PARAMS, {"summary": "Rates by band."}, None, {DOC_F: _chunks(CHUNK_BASE_TEXT)}
+        )
+        results.append(("chunk save", _normalise(outcome)))
+        for name, text in CHUNK_TEXTS.items():
+            outcome = await memory_manager.get_memory_content(user_id, "summariser", [DOC_G], CHUNK_PARAMS, None, {DOC_G: _chunks(text)})
+            results.append((f"chunk get ({name})", outcome))
+
+        for step, (query_text, doc_hashes) in enumerate(SEARCHES):
+            hits = await backend.search_k_search(user_id, query_text, doc_hashes)
+            docs = {doc["_id"]: doc for doc in await backend.find_by_ids(user_id, [qa_id for qa_id, _ in hits])}
+            results.append((f"search {step}", [(docs[qa_id]["query_text"], round(score, 6)) for qa_id, score in hits]))
+
+        rebuilt = await backend.rebuild_retrieval_index(user_id)
+        hits = await backend.search_k_search(user_id, SEARCHES[0][0], SEARCHES[0][1])
+        docs = {doc["_id"]: doc for doc in await backend.find_by_ids(user_id, [qa_id for qa_id, _ in hits])}
+        results.append(("rebuild", (rebuilt, [(docs[qa_id]["query_text"], round(score, 6)) for qa_id, score in hits])))
+    finally:
+        await backend.delete_user(user_id)
+    return results
+
+
+def compare(expected: List[Tuple[str, Any]], actual: List[Tuple[str, Any]]) -> List[str]:
+    '''
+    Returns a description of every step whose result differs between two scenario runs.
+    '''
+    mismatches = []
+    for (step, expected_result), (_, actual_result) in zip(expected, actual):
+        if expected_result != actual_result:
+            mismatches.append(f"{step}: expected {expected_result!r}, got {actual_result!r}")
+    if len(expected) != len(actual):
+        mismatches.append(f"step count: expected {len(expected)}, got {len(actual)}")
+    return mismatches
+
+
+async def _run_on(name: str, directory) -> List[Tuple[str, Any]]:
+    if name == "embedded":
+        from codescripts.embedded_backend import EmbeddedMemoryBackend
+        backend = EmbeddedMemoryBackend(path=str(directory / "conformance.sqlite3"))
+        try:
+            return await run_scenario(backend)
+        finally:
+            await backend.close()
+
+    from pymongo import AsyncMongoClient
+    from codescripts.mongo_backend import MongoMemoryBackend
+    from codescripts.retrieval_index import RetrievalIndex
+    from codescripts.answer_cache import AnswerCache
+    # A client of its own, and a retrieval index and answer cache on it rather than the process-wide ones, which
+    # would outlive the client (MongoMemoryBackend.close() closes the process-wide client instead)
+    client = AsyncMongoClient(MONGO_URI)
+    try:
+        db = client[MONGO_DB]
+        backend = MongoMemoryBackend(
+            db=db, retrieval_index=RetrievalIndex(db=db), answer_cache=AnswerCache(db=db),
+            layout="shared" if name == "mongo_shared" else "per_user"
+        )
+        return await run_scenario(backend)
+    finally:
+        await client.close()
+
+
+def _outcome(result: Any) -> Any:
+    return result["i_check_result"] if isinstance(result, dict) and "i_check_result" in result else result
+
+
+# Outcome of every step of the scenario: the message of saves, the i_check_result of lookups, and the
+# (query_text, score) hits of searches
+SAVED = "Inserted object with ID: <id>"
+DUPLICATE = "Not re-inserted since duplicate found"
+MERGED_ENTITIES = "Updated existing Doc Extractor memory with merged entity data."
+NOTICE_HITS = [
+    ("What is the notice period?", 0.617355),
+    ("What is the notice period for renewal?", 0.480787),
+    ("Who signs the renewal notice?", 0.200144),
+]
+EXPECTED_OUTCOMES = [
+    ("save 0 (summariser)", SAVED),
+    ("save 1 (summariser)", DUPLICATE),
+    ("save 2 (summariser)", SAVED),
+    ("save 3 (doc_extractor)", SAVED),
+    ("save 4 (doc_extractor)", MERGED_ENTITIES),
+    ("save 5 (faq_generator)", SAVED),
+    ("save 6 (faq_generator)", "Updated existing FAQ memory with 1 new question(s)."),
+    ("save 7 (faq_generator)", "No new questions to add to existing FAQ memory."),
+    ("save 8 (k_search)", SAVED),
+    ("save 9 (k_search)", SAVED),
+    ("save 10 (unknown_agent)", "ValueError: Unsupported agent type: unknown_agent"),
+    ("batch save 0 (faq_generator)", SAVED),
+    ("batch save 1 (faq_generator)", "Updated existing FAQ memory with 1 new question(s)."),
+    ("batch save 2 (doc_extractor)", SAVED),
+    ("batch save 3 (doc_extractor)", MERGED_ENTITIES),
+    ("batch save 4 (k_search)", SAVED),
+    ("batch save 5 (k_search)", DUPLICATE),
+    ("batch save 6 (summariser)", SAVED),
+    ("get 0 (summariser)", "Full Match"),
+    ("get 1 (summariser)", "Partial Match"),
+    ("get 2 (summariser)", "No Match"),
+    ("get 3 (summariser)", "No Match"),
+    ("get 4 (summariser)", "Full Match"),
+    ("get 5 (doc_extractor)", "Full Match"),
+    ("get 6 (doc_extractor)", "Partial Match"),
+    ("get 7 (doc_extractor)", "Full Match"),
+    ("get 8 (doc_extractor)", "No Match"),
+    ("get 9 (faq_generator)", "Full Match"),
+    ("get 10 (faq_generator)", "Full Match"),
+    ("get 11 (faq_generator)", "No Match"),
+    ("get 12 (k_search)", "Full Match"),
+    ("get 13 (k_search)", "Full Match"),
+    ("get 14 (k_search)", "No Match"),
+    ("near save", SAVED),
+    ("near get (re-export)", "Near Match"),
+    ("near get (unrelated)", "No Match"),
+    ("chunk save", SAVED),
+    ("chunk get (appendix)", "Partial Match"),
+    ("chunk get (unrelated)", "No Match"),
+    ("search 0", NOTICE_HITS),
+    ("search 1", [("Who signs the renewal notice?", 0.532007)]),
+    ("search 2", []),
+    ("rebuild", (3, NOTICE_HITS)),
+]
+
+
+@pytest.fixture(scope="module")
+def embedded_results(tmp_path_factory) -> List[Tuple[str, Any]]:
+    return asyncio.run(_run_on("embedded", tmp_path_factory.mktemp("embedded")))
+
+
+@pytest.mark.parametrize("name", [
+    "embedded",
+    pytest.param("mongo", marks=pytest.mark.mongo),
+    pytest.param("mongo_shared", marks=pytest.mark.mongo),
+])
+def test_scenario_outcomes(name, embedded_results, tmp_path):
+    results = embedded_results if name == "embedded" else asyncio.run(_run_on(name, tmp_path))
+    assert [(step, _outcome(result)) for step, result in results] == EXPECTED_OUTCOMES
+
+
+@pytest.mark.mongo
+@pytest.mark.parametrize("name", ["mongo", "mongo_shared"])
+def test_backend_conforms_to_embedded(name, embedded_results, tmp_path):
+    assert compare(embedded_results, asyncio.run(_run_on(name, tmp_path))) == []
+
+
+def test_chunk_reuse_keeps_the_agent_processing_content(embedded_results, tmp_path):
+    result = dict(embedded_results)["chunk get (appendix)"]
+    assert result["processing_content"] == CHUNK_PARAMS
+    plan = result["chunk_plan"][DOC_G]
+    assert plan["reused_from"] == DOC_F and plan["covered"] and plan["uncovered"]
+
+    from codescripts.embedded_backend import EmbeddedMemoryBackend
+    memory_manager = MemoryManager(EmbeddedMemoryBackend(path=str(tmp_path / "unused.sqlite3")))
+    faq = memory_manager._request_processing_content("faq_generator", {"question_count": 5, "focus_areas": ["risk", ""]})
+    assert sorted(entry["focus_areas"][0] for entry in faq) == ["", "risk"]
+    assert sorted(entry["question_count"] for entry in faq) == [2, 3]
+    assert memory_manager._request_processing_content("doc_extractor", {"entity_list": ["Party"]}) == {"entity_list": ["Party"]}
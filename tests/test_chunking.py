@@ -0,0 +1,49 @@
+from codescripts.chunking import ContentChunker, chunk_coverage
+
+TEXT = " ".join(f"Section {i}: premium rate {i * 3} applies to band {i % 17} of the schedule." for i in range(3000))
+
+
+def _chunks(*pieces, **kwargs):
+    chunker = ContentChunker(**kwargs)
+    for piece in pieces:
+        chunker.update(piece)
+    return chunker.finish()
+
+
+def test_chunks_tile_the_text():
+    chunks = _chunks(TEXT)
+    assert len(chunks) > 1
+    assert chunks[0]["start"] == 0
+    for chunk, following in zip(chunks, chunks[1:]):
+        # Consecutive chunks are separated by one space
+        assert following["start"] == chunk["start"] + chunk["length"] + 1
+    assert chunks[-1]["start"] + chunks[-1]["length"] == len(TEXT)
+
+
+def test_chunk_sizes_are_bounded():
+    chunks = _chunks(TEXT, target_words=100, min_words=50, max_words=150)
+    sizes = [len(TEXT[chunk["start"]:chunk["start"] + chunk["length"]].split()) for chunk in chunks]
+    assert all(50 <= size <= 150 for size in sizes[:-1])
+    assert sizes[-1] <= 150
+
+
+def test_chunks_do_not_depend_on_the_pieces():
+    whole = _chunks(TEXT)
+    assert _chunks(*(TEXT[i:i + 17] for i in range(0, len(TEXT), 17))) == whole
+    assert _chunks("", TEXT[:1], TEXT[1:]) == whole
+
+
+def test_an_insertion_only_changes_the_chunks_around_it():
+    words = TEXT.split(" ")
+    middle = len(words) // 2
+    edited = " ".join(words[:middle] + ["Inserted", "sentence", "here."] + words[middle:])
+    original_chunks, edited_chunks = _chunks(TEXT), _chunks(edited)
+    assert chunk_coverage(edited_chunks, original_chunks) > 0.8
+    assert chunk_coverage(original_chunks, edited_chunks) > 0.8
+    assert chunk_coverage(original_chunks, original_chunks) == 1.0
+
+
+def test_empty_text():
+    assert _chunks("") is None
+    assert _chunks(" \n ") is None
+    assert chunk_coverage([], _chunks(TEXT)) == 0.0
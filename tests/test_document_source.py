@@ -0,0 +1,126 @@
+"""
+DocumentSource.from_s3 against moto's in-process S3: objects below the spill threshold stay in memory, larger
+ones go to a uniquely named temp file removed on close(), and every ranged GET is pinned to the HEAD it follows.
+"""
+import os
+import boto3
+import pytest
+from moto import mock_aws
+import utils.s3_operations as s3_operations
+import codescripts.document_source as document_source
+from codescripts.document_source import DocumentSource
+
+BUCKET = "documents"
+VERSIONED_BUCKET = "documents-versioned"
+SPILL_MIN_BYTES = 256 * 1024
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    # Small ranges, so that every object takes several GETs and the larger ones the concurrent path
+    monkeypatch.setattr(s3_operations, "range_chunk_bytes", 64 * 1024)
+    monkeypatch.setattr(s3_operations, "multipart_threshold", 192 * 1024)
+    monkeypatch.setattr(document_source, "TMP_DIR", str(tmp_path))
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        client.create_bucket(Bucket=VERSIONED_BUCKET)
+        client.put_bucket_versioning(Bucket=VERSIONED_BUCKET, VersioningConfiguration={"Status": "Enabled"})
+        try:
+            yield client
+        finally:
+            # The shared clients and range pool were created against the mock
+            s3_operations.shutdown_s3()
+
+
+@pytest.fixture
+def get_requests(s3):
+    '''The parameters of every GetObject the application's shared client sends.'''
+    requests = []
+    s3_operations.get_s3_client().meta.events.register(
+        "before-parameter-build.s3.GetObject", lambda params, **kwargs: requests.append(dict(params))
+    )
+    return requests
+
+
+def _data(size: int, seed: int = 0) -> bytes:
+    return bytes((i * 31 + seed) % 251 for i in range(size))
+
+
+def _read(source: DocumentSource) -> bytes:
+    target = source.open()
+    if isinstance(target, str):
+        with open(target, "rb") as f:
+            return f.read()
+    return target.read()
+
+
+def test_small_object_is_read_into_memory(s3, tmp_path):
+    data = _data(100 * 1024)
+    s3.put_object(Bucket=BUCKET, Key="contracts/small.pdf", Body=data)
+    with DocumentSource.from_s3(BUCKET, "contracts/small.pdf", spill_min_bytes=SPILL_MIN_BYTES) as source:
+        assert source.local_path is None and source.buffer is not None
+        assert source.size == len(data) and source.extension == ".pdf"
+        assert _read(source) == data
+        assert os.listdir(tmp_path) == []
+
+
+def test_large_object_spills_to_a_temp_file_removed_on_close(s3, tmp_path):
+    data = _data(600 * 1024)
+    s3.put_object(Bucket=BUCKET, Key="contracts/large.pdf", Body=data)
+    source = DocumentSource.from_s3(BUCKET, "contracts/large.pdf", spill_min_bytes=SPILL_MIN_BYTES)
+    path = source.local_path
+    assert source.buffer is None
+    assert os.path.dirname(path) == str(tmp_path)
+    name = os.path.basename(path)
+    assert name.startswith("icheck-") and name.endswith(".pdf") and name != "large.pdf"
+    assert _read(source) == data
+    source.close()
+    assert not os.path.exists(path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_same_basename_under_different_keys(s3, tmp_path):
+    first, second = _data(300 * 1024, seed=1), _data(400 * 1024, seed=2)
+    s3.put_object(Bucket=BUCKET, Key="tenant-a/report.docx", Body=first)
+    s3.put_object(Bucket=BUCKET, Key="tenant-b/report.docx", Body=second)
+    with DocumentSource.from_s3(BUCKET, "tenant-a/report.docx", spill_min_bytes=SPILL_MIN_BYTES) as source_a:
+        with DocumentSource.from_s3(BUCKET, "tenant-b/report.docx", spill_min_bytes=SPILL_MIN_BYTES) as source_b:
+            assert source_a.local_path != source_b.local_path
+            assert _read(source_a) == first
+            assert _read(source_b) == second
+        # Closing one leaves the other's file in place
+        assert os.path.exists(source_a.local_path)
+        assert _read(source_a) == first
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("size", [100 * 1024, 600 * 1024], ids=["in-memory", "spilled"])
+def test_ranged_gets_are_pinned_to_the_version(s3, get_requests, size):
+    old, new = _data(size, seed=3), _data(size, seed=4)
+    s3.put_object(Bucket=VERSIONED_BUCKET, Key="policy.pdf", Body=old)
+    metadata = s3_operations.S3Helper(VERSIONED_BUCKET).head_object("policy.pdf")
+    # Overwritten between the HEAD and the read: the read still returns the version the HEAD saw
+    s3.put_object(Bucket=VERSIONED_BUCKET, Key="policy.pdf", Body=new)
+    with DocumentSource.from_s3(VERSIONED_BUCKET, "policy.pdf", spill_min_bytes=SPILL_MIN_BYTES, metadata=metadata) as source:
+        assert _read(source) == old
+    assert len(get_requests) == -(-size // s3_operations.range_chunk_bytes)
+    for request in get_requests:
+        assert request["VersionId"] == metadata["version_id"] and "IfMatch" not in request
+        assert request["Range"].startswith("bytes=")
+
+
+@pytest.mark.parametrize("size", [100 * 1024, 600 * 1024], ids=["in-memory", "spilled"])
+def test_ranged_gets_are_pinned_to_the_etag(s3, get_requests, tmp_path, size):
+    s3.put_object(Bucket=BUCKET, Key="policy.pdf", Body=_data(size, seed=5))
+    metadata = s3_operations.S3Helper(BUCKET).head_object("policy.pdf")
+    assert metadata["version_id"] is None
+    with DocumentSource.from_s3(BUCKET, "policy.pdf", spill_min_bytes=SPILL_MIN_BYTES, metadata=metadata):
+        pass
+    assert get_requests and all(request["IfMatch"] == f'"{metadata["etag"]}"' for request in get_requests)
+
+    # Without versioning an overwrite fails the read instead of mixing two versions, and leaves no temp file behind
+    s3.put_object(Bucket=BUCKET, Key="policy.pdf", Body=_data(size, seed=6))
+    with pytest.raises(Exception):
+        DocumentSource.from_s3(BUCKET, "policy.pdf", spill_min_bytes=SPILL_MIN_BYTES, metadata=metadata)
+    assert os.listdir(tmp_path) == []
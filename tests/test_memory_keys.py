@@ -0,0 +1,53 @@
+from utils.memory_keys import set_key, remove_meta_fields, content_digest, lookup_keys, focus_area_key, merge_key
+
+DOC_A = "a" * 64
+DOC_B = "b" * 64
+
+
+def test_set_key_is_order_independent():
+    assert set_key([DOC_A, DOC_B]) == set_key([DOC_B, DOC_A])
+    assert set_key([DOC_A]) != set_key([DOC_A, DOC_B])
+    assert set_key([]) == set_key([])
+
+
+def test_set_key_normalises_subdocuments():
+    # Legacy records may hold focus areas as subdocuments, stored with any key order
+    assert set_key([{"name": "risk", "weight": 1}, "term"]) == set_key(["term", {"weight": 1, "name": "risk"}])
+    assert set_key([{"name": "risk"}]) != set_key([{"name": "term"}])
+
+
+def test_content_digest_ignores_metadata_and_key_order():
+    record = {"agent": "summariser", "doc_hashes": [DOC_A], "summary": "S.", "compression_ratio": 50}
+    stored = {
+        "_id": "1", "user_id": "u", "timestamp": "2025-01-01", "content_digest": "x",
+        "doc_set_key": "k", "focus_set_key": "f", "query_key": "q",
+        **dict(reversed(list(record.items())))
+    }
+    assert remove_meta_fields(stored) == record
+    assert content_digest(stored) == content_digest(record)
+    assert content_digest({**record, "summary": "Other."}) != content_digest(record)
+
+
+def test_lookup_keys_per_agent():
+    summary = lookup_keys({"agent": "Summariser", "doc_hashes": [DOC_B, DOC_A], "focus_areas": ["risk", "term"]})
+    assert summary == {"doc_set_key": set_key([DOC_A, DOC_B]), "focus_set_key": set_key(["term", "risk"])}
+    assert lookup_keys({"agent": "summariser", "doc_hashes": [DOC_A]})["focus_set_key"] == set_key([])
+
+    k_search = lookup_keys({"agent": "k_search", "doc_hashes": [DOC_A], "query_text": "  What is the Term? "})
+    assert k_search == {"doc_set_key": set_key([DOC_A]), "query_key": "what is the term?"}
+
+    assert lookup_keys({"agent": "doc_extractor", "doc_hashes": [DOC_A]}) == {"doc_set_key": set_key([DOC_A])}
+
+
+def test_focus_area_key():
+    assert focus_area_key("  Risk ") == "risk"
+    assert focus_area_key(None) == ""
+
+
+def test_merge_key():
+    faq = {"agent": "faq_generator", "doc_hashes": [DOC_A], "parameters": {"question_count": 4}}
+    assert merge_key(faq) == merge_key(dict(faq))
+    assert merge_key(faq) != merge_key({**faq, "parameters": {"question_count": 5}})
+    extractor = {"agent": "doc_extractor", "doc_hashes": [DOC_A], "entity_table": []}
+    assert merge_key(extractor) == merge_key({**extractor, "entity_table": [{"entity_type": "Party"}]})
+    assert merge_key({"agent": "summariser", "doc_hashes": [DOC_A]}) is None
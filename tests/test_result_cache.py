@@ -0,0 +1,85 @@
+import asyncio
+from codescripts.result_cache import ResultCache
+
+DOC_A = "a" * 64
+DOC_B = "b" * 64
+PARAMS = {"focus_areas": ["risk"]}
+
+
+def _cache(shared_tier="none"):
+    return ResultCache(enabled=True, max_entries=100, ttl_seconds=60, shared_tier=shared_tier)
+
+
+def test_cached_values_are_copies():
+    async def scenario():
+        cache = _cache()
+        key = await cache.key("u1", "summariser", [DOC_A], PARAMS)
+        value = {"summary": "S.", "doc_hashes": [DOC_A]}
+        await cache.put(key, value)
+        value["summary"] = "changed"
+        cached = await cache.get(key)
+        assert cached == {"summary": "S.", "doc_hashes": [DOC_A]}
+        cached["summary"] = "changed"
+        assert (await cache.get(key))["summary"] == "S."
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_moves_the_document_set_to_a_new_generation():
+    async def scenario():
+        cache = _cache()
+        key = await cache.key("u1", "summariser", [DOC_A, DOC_B], PARAMS)
+        await cache.put(key, {"summary": "S."})
+        assert await cache.key("u1", "summariser", [DOC_B, DOC_A], PARAMS) == key
+
+        # Saves to another document set, agent or user leave the entry alone
+        await cache.invalidate("u1", "summariser", [DOC_A])
+        await cache.invalidate("u1", "doc_extractor", [DOC_A, DOC_B])
+        await cache.invalidate("u2", "summariser", [DOC_A, DOC_B])
+        assert await cache.key("u1", "summariser", [DOC_A, DOC_B], PARAMS) == key
+
+        await cache.invalidate("u1", "summariser", [DOC_A, DOC_B])
+        new_key = await cache.key("u1", "summariser", [DOC_A, DOC_B], PARAMS)
+        assert new_key != key
+        assert await cache.get(new_key) is None
+
+    asyncio.run(scenario())
+
+
+def test_overlap_agents_are_invalidated_per_document():
+    async def scenario():
+        cache = _cache()
+        both = await cache.key("u1", "k_search", [DOC_A, DOC_B], PARAMS)
+        only_b = await cache.key("u1", "k_search", [DOC_B], PARAMS)
+        # A save to A alone reaches lookups over any set containing A
+        await cache.invalidate("u1", "k_search", [DOC_A])
+        assert await cache.key("u1", "k_search", [DOC_A, DOC_B], PARAMS) != both
+        assert await cache.key("u1", "k_search", [DOC_B], PARAMS) == only_b
+
+    asyncio.run(scenario())
+
+
+def test_shared_tier_invalidates_every_worker():
+    async def scenario():
+        worker_1, worker_2 = _cache("local"), _cache("local")
+        worker_2.shared = worker_1.shared
+        key = await worker_1.key("u1", "faq_generator", [DOC_A], None)
+        assert await worker_2.key("u1", "faq_generator", [DOC_A], None) == key
+        await worker_1.put(key, ["Q1"])
+        assert await worker_2.get(key) == ["Q1"]
+
+        await worker_1.invalidate("u1", "faq_generator", [DOC_A])
+        new_key = await worker_2.key("u1", "faq_generator", [DOC_A], None)
+        assert new_key != key
+        assert await worker_2.get(new_key) is None
+
+    asyncio.run(scenario())
+
+
+def test_disabled_cache_never_keys():
+    async def scenario():
+        cache = ResultCache(enabled=False, max_entries=100, ttl_seconds=60, shared_tier="local")
+        assert cache.shared is None
+        assert await cache.key("u1", "summariser", [DOC_A], PARAMS) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,132 @@
+import math
+from collections import Counter
+import numpy as np
+import pytest
+from codescripts.retrieval_index import (
+    SCORERS, TfidfScorer, BM25Scorer, HashedNgramScorer, IndexStats, TermMatrices, rank_candidates, top_k_indices, select_terms,
+    candidate_batches
+)
+
+QUESTIONS = [
+    "What is the notice period for termination?",
+    "Who pays the delivery costs?",
+    "What is the notice period for a price change?",
+    "When does the warranty expire?",
+    "Which law governs the contract?",
+    "Can the supplier terminate the contract early?",
+]
+QUERIES = ["notice period for termination", "warranty expiry", "who pays costs of delivery"]
+
+
+def _index(scorer):
+    candidates, df = [], Counter()
+    for qa_id, question in enumerate(QUESTIONS):
+        features = scorer.features(question)
+        candidates.append({"qa_id": qa_id, "features": [{"t": t, "n": n} for t, n in features.items()], "length": sum(features.values())})
+        df.update(features.keys())
+    return candidates, IndexStats(len(candidates), sum(c["length"] for c in candidates), dict(df))
+
+
+def _cosine(a, b):
+    dot = sum(a[t] * b.get(t, 0) for t in a)
+    norms = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norms if norms else 0.0
+
+
+def _tfidf(query, entry, stats):
+    weigh = lambda counts: {t: n * (math.log((1 + stats.doc_count) / (1 + stats.df.get(t, 0))) + 1) for t, n in counts.items()}
+    return _cosine(weigh(query), weigh(entry))
+
+
+def _bm25(query, entry, stats, k1=1.5, b=0.75):
+    length = sum(entry.values())
+    score = 0.0
+    for term in query:
+        if term in entry:
+            df = stats.df.get(term, 0)
+            idf = math.log(1 + (stats.doc_count - df + 0.5) / (df + 0.5))
+            score += idf * entry[term] * (k1 + 1) / (entry[term] + k1 * (1 - b + b * length / stats.avg_length))
+    return score
+
+
+REFERENCES = {
+    TfidfScorer: _tfidf,
+    BM25Scorer: _bm25,
+    HashedNgramScorer: lambda query, entry, stats: _cosine(query, entry),
+}
+
+
+@pytest.mark.parametrize("scorer_class", list(SCORERS.values()), ids=list(SCORERS))
+def test_score_matrix_matches_the_scalar_formula(scorer_class):
+    scorer = scorer_class()
+    candidates, stats = _index(scorer)
+    queries = [scorer.features(query) for query in QUERIES]
+    scores = scorer.score_matrix(TermMatrices(queries, candidates), stats)
+    assert scores.shape == (len(QUERIES), len(QUESTIONS))
+    for row, query in enumerate(queries):
+        for column, candidate in enumerate(candidates):
+            entry = {f["t"]: f["n"] for f in candidate["features"]}
+            assert scores[row, column] == pytest.approx(REFERENCES[scorer_class](query, entry, stats))
+
+
+@pytest.mark.parametrize("scorer_class", [TfidfScorer, HashedNgramScorer])
+def test_identical_text_scores_one(scorer_class):
+    scorer = scorer_class()
+    candidates, stats = _index(scorer)
+    ranked = rank_candidates(scorer, [scorer.features(QUESTIONS[3])], candidates, stats, min_score=0.0, top_k=1)
+    assert ranked[0][0][0] == 3
+    assert ranked[0][0][1] == pytest.approx(1.0)
+
+
+def test_rank_candidates_orders_and_filters():
+    scorer = TfidfScorer()
+    candidates, stats = _index(scorer)
+    queries = [scorer.features(query) for query in QUERIES]
+    ranked = rank_candidates(scorer, queries, candidates, stats, min_score=0.1, top_k=2)
+    assert [qa_id for qa_id, _ in ranked[0]] == [0, 2]
+    assert [qa_id for qa_id, _ in ranked[1]] == [3]
+    assert all(score > 0.1 for row in ranked for _, score in row)
+    # A query only ranks the candidates holding the terms it selected
+    restricted = rank_candidates(scorer, queries[:1], candidates, stats, min_score=0.0, top_k=10, selected_terms=[["termination"]])
+    assert [qa_id for qa_id, _ in restricted[0]] == [0]
+    assert rank_candidates(scorer, queries, [], stats, min_score=0.0, top_k=2) == [[], [], []]
+
+
+def test_top_k_indices():
+    scores = np.array([0.5, 0.9, 0.5, 0.1, 0.9, 0.5, 0.0])
+    eligible = np.ones(len(scores), dtype=bool)
+    assert top_k_indices(scores, eligible, 0.0, 3).tolist() == [1, 4, 0]
+    # Ties at the k-th score keep candidate order
+    assert top_k_indices(scores, eligible, 0.0, 4).tolist() == [1, 4, 0, 2]
+    assert top_k_indices(scores, eligible, 0.0, 10).tolist() == [1, 4, 0, 2, 5, 3]
+    assert top_k_indices(scores, eligible, 0.5, 10).tolist() == [1, 4]
+    eligible[1] = False
+    assert top_k_indices(scores, eligible, 0.0, 2).tolist() == [4, 0]
+    assert top_k_indices(scores, eligible, 0.0, 0).tolist() == []
+
+
+def test_top_k_indices_matches_a_full_sort():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        scores = rng.integers(0, 5, size=40) / 4
+        eligible = rng.random(40) > 0.2
+        top_k = int(rng.integers(1, 45))
+        expected = sorted((i for i in range(40) if eligible[i] and scores[i] > 0.25), key=lambda i: (-scores[i], i))[:top_k]
+        assert top_k_indices(scores, eligible, 0.25, top_k).tolist() == expected
+
+
+def test_select_terms_takes_the_rarest_postings_within_budget():
+    df = {"contract": 40, "notice": 5, "period": 12, "unknown": 0}
+    query = {"contract": 1, "notice": 1, "period": 1, "unknown": 1}
+    assert select_terms(query, df, 20) == ["notice", "period"]
+    assert select_terms(query, df, 100) == ["notice", "period", "contract"]
+    # The rarest term is always read, even above the budget
+    assert select_terms(query, df, 1) == ["notice"]
+    assert select_terms({"unknown": 1}, df, 100) == []
+
+
+def test_candidate_batches():
+    df = {"a": 3, "b": 4, "c": 50}
+    assert candidate_batches([["a"], ["c"], [], ["a", "b"]], df, 10) == [[0, 3], [1]]
+    assert candidate_batches([["c"]], df, 10) == [[0]]
+    assert candidate_batches([[]], df, 10) == []
@@ -0,0 +1,77 @@
+"""
+The cross-user shared tier only serves memory of the exact documents requested: near-duplicate and chunk-level
+matches stay within a tenant's own memory.
+"""
+import asyncio
+from typing import Any, Dict, List
+from codescripts.i_check import MemoryManager
+from codescripts.embedded_backend import EmbeddedMemoryBackend
+from codescripts.result_cache import ResultCache
+from codescripts.shared_memory import SharedMemory
+from codescripts.similarity import MinHash
+from codescripts.chunking import ContentChunker
+
+DOC_D = "d" * 64
+DOC_E = "e" * 64
+DOC_F = "f" * 64
+DOC_G = "0" * 64
+
+NEAR_BASE_TEXT = " ".join(f"Clause {i}: the supplier shall deliver lot {i} within {i % 30 + 1} days." for i in range(200))
+NEAR_TEXT = NEAR_BASE_TEXT + " Page 1 of 12, exported 2025-06-01."
+NEAR_PARAMS = {"entity_list": ["Supplier"]}
+
+CHUNK_BASE_TEXT = " ".join(f"Section {i}: premium rate {i * 3} applies to band {i % 17} of the schedule." for i in range(1500))
+CHUNK_TEXT = CHUNK_BASE_TEXT + " " + " ".join(f"Appendix item {i}: revised rate {i * 5}." for i in range(300))
+CHUNK_PARAMS = {"compression_ratio": 50, "focus_areas": []}
+
+
+def _sketch(text: str) -> List[int]:
+    minhash = MinHash()
+    minhash.update(text)
+    return minhash.finish()
+
+
+def _chunks(text: str) -> List[Dict[str, Any]]:
+    chunker = ContentChunker()
+    chunker.update(text)
+    return chunker.finish()
+
+
+async def _lookups(path: str) -> Dict[str, Dict[str, Any]]:
+    backend = EmbeddedMemoryBackend(path=path)
+    memory_manager = MemoryManager(
+        backend, result_cache=ResultCache(enabled=False),
+        shared_memory=SharedMemory(enabled=True, policy="opt_in", tenants=["tenant-a", "tenant-b"])
+    )
+    try:
+        await memory_manager.save_memory_content(
+            "tenant-a", "doc_extractor", [DOC_D], {}, {"entity_table": [{"entity_type": "Supplier", "values": ["Acme"]}]},
+            {DOC_D: _sketch(NEAR_BASE_TEXT)}
+        )
+        await memory_manager.save_memory_content(
+            "tenant-a", "summariser", [DOC_F], CHUNK_PARAMS, {"summary": "Rates by band."}, None, {DOC_F: _chunks(CHUNK_BASE_TEXT)}
+        )
+        near_sketches = {DOC_E: _sketch(NEAR_TEXT)}
+        changed_chunks = {DOC_G: _chunks(CHUNK_TEXT)}
+        return {
+            "exact": await memory_manager.get_memory_content("tenant-b", "doc_extractor", [DOC_D], NEAR_PARAMS),
+            "own near": await memory_manager.get_memory_content("tenant-a", "doc_extractor", [DOC_E], NEAR_PARAMS, near_sketches),
+            "other near": await memory_manager.get_memory_content("tenant-b", "doc_extractor", [DOC_E], NEAR_PARAMS, near_sketches),
+            "own chunks": await memory_manager.get_memory_content("tenant-a", "summariser", [DOC_G], CHUNK_PARAMS, None, changed_chunks),
+            "other chunks": await memory_manager.get_memory_content("tenant-b", "summariser", [DOC_G], CHUNK_PARAMS, None, changed_chunks),
+        }
+    finally:
+        await backend.close()
+
+
+def test_shared_tier_only_matches_exact_documents(tmp_path):
+    results = asyncio.run(_lookups(str(tmp_path / "shared.sqlite3")))
+    assert results["exact"]["i_check_result"] == "Full Match"
+    assert results["exact"]["memory_tier"] == "shared"
+    # The tenant that saved the memory still gets near and chunk-level matches from its own memory
+    assert results["own near"]["i_check_result"] == "Near Match"
+    assert results["own chunks"]["i_check_result"] == "Partial Match"
+    # Another tenant's near-duplicate or changed document gets nothing from the shared tier
+    for name in ("other near", "other chunks"):
+        assert results[name]["i_check_result"] == "No Match"
+        assert "memory_tier" not in results[name]
@@ -0,0 +1,43 @@
+from codescripts.similarity import MinHash, band_keys, similarity, NUM_PERM, BANDS, THRESHOLD
+
+BASE = " ".join(f"Clause {i}: the supplier shall deliver lot {i} within {i % 30 + 1} days." for i in range(200))
+NEAR = BASE + " Page 1 of 12, exported 2025-06-01."
+UNRELATED = " ".join(f"Minutes item {i}: the board noted report {i * 7}." for i in range(200))
+
+
+def _signature(*pieces):
+    minhash = MinHash()
+    for piece in pieces:
+        minhash.update(piece)
+    return minhash.finish()
+
+
+def test_signature_does_not_depend_on_the_pieces():
+    whole = _signature(BASE)
+    assert len(whole) == NUM_PERM
+    assert _signature(*(BASE[i:i + 13] for i in range(0, len(BASE), 13))) == whole
+    # Words are compared lower-cased
+    assert _signature(BASE.upper()) == whole
+
+
+def test_similarity_estimates():
+    base = _signature(BASE)
+    assert similarity(base, base) == 1.0
+    assert similarity(base, _signature(NEAR)) >= THRESHOLD
+    assert similarity(base, _signature(UNRELATED)) < 0.2
+    assert similarity(base, base[:-1]) == 0.0
+
+
+def test_near_duplicates_share_a_band_key():
+    base_keys = band_keys(_signature(BASE))
+    assert len(base_keys) == BANDS
+    assert set(base_keys) & set(band_keys(_signature(NEAR)))
+    assert not set(base_keys) & set(band_keys(_signature(UNRELATED)))
+
+
+def test_short_and_empty_texts():
+    assert _signature("") is None
+    assert _signature("  ") is None
+    short = _signature("two words")
+    assert short is not None and short == _signature("two ", "words")
+    assert similarity(short, _signature("other words")) < 1.0
@@ -0,0 +1,58 @@
+import hashlib
+from codescripts.text_digest import TextDigest
+
+TEXT = "  Clause 1:\tthe supplier\n\nshall deliver.  " + " ".join(f"Item {i}: lot {i % 7} within {i} days." for i in range(3000)) + " \n"
+
+# Ways of cutting the same text into pieces, including cuts inside words and inside whitespace runs
+SPLITS = [
+    [TEXT],
+    [TEXT[:1], TEXT[1:2], TEXT[2:]],
+    [TEXT[i:i + 7] for i in range(0, len(TEXT), 7)],
+    [TEXT[i:i + 1000] for i in range(0, len(TEXT), 1000)],
+    ["", TEXT[:40], "", TEXT[40:41], TEXT[41:]],
+]
+
+
+def _count_words(text):
+    # Deterministic stand-in for count_tokens(), whose tiktoken encodings may need downloading
+    return {"words": len(text.split())}
+
+
+def _digest(pieces, similarity=True, chunking=True, token_counter=_count_words):
+    digest = TextDigest(similarity=similarity, chunking=chunking, token_counter=token_counter)
+    for piece in pieces:
+        digest.update(piece)
+    return digest.finish()
+
+
+def test_digest_equals_hash_of_normalised_text():
+    # What extract_local_text() + remove_formatting() + hash_text() give for the whole text
+    normalised = " ".join(TEXT.split()) + "\n"
+    for pieces in SPLITS:
+        result = _digest(pieces, similarity=False, chunking=False)
+        assert result["text_hash"] == hashlib.sha256(normalised.encode("utf-8")).hexdigest()
+        assert result["text_length"] == len(normalised)
+        # Counts are taken on word-aligned pieces, so they add up to the count of the whole text
+        assert result["token_counts"] == {"words": len(normalised.split())}
+        assert result["minhash"] is None and result["chunks"] is None
+
+
+def test_signature_and_chunks_do_not_depend_on_the_pieces():
+    whole = _digest(SPLITS[0])
+    assert whole["minhash"] is not None and whole["chunks"]
+    for pieces in SPLITS[1:]:
+        result = _digest(pieces)
+        assert result["minhash"] == whole["minhash"]
+        assert result["chunks"] == whole["chunks"]
+
+
+def test_empty_text():
+    result = _digest(["", "  \n\t "])
+    assert result["text_hash"] == hashlib.sha256(b"\n").hexdigest()
+    assert result["minhash"] is None and result["chunks"] is None
+
+
+def test_token_counting_can_be_switched_off():
+    result = _digest(SPLITS[2], similarity=False, chunking=False, token_counter=None)
+    assert result["token_counts"] == {}
+    assert result["text_hash"] == _digest(SPLITS[0], similarity=False, chunking=False)["text_hash"]
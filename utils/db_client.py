@@ -0,0 +1,152 @@
+import configparser, threading, time
+from typing import Optional, Dict, Any
+from pymongo import AsyncMongoClient, monitoring
+from pymongo.asynchronous.database import AsyncDatabase
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+mongo_uri = config.get("DB_DETAILS", "uri")
+db_name = config.get("DB_DETAILS", "db")
+max_pool_size = config.getint("DB_DETAILS", "max_pool_size", fallback=100)
+min_pool_size = config.getint("DB_DETAILS", "min_pool_size", fallback=0)
+max_idle_time_ms = config.getint("DB_DETAILS", "max_idle_time_ms", fallback=300000)
+connect_timeout_ms = config.getint("DB_DETAILS", "connect_timeout_ms", fallback=5000)
+server_selection_timeout_ms = config.getint("DB_DETAILS", "server_selection_timeout_ms", fallback=5000)
+socket_timeout_ms = config.getint("DB_DETAILS", "socket_timeout_ms", fallback=30000)
+
+# Collections used internally (indexes, caches) are prefixed so they are never mistaken for a user's memory
+INTERNAL_COLLECTION_PREFIX = "icheck."
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    '''
+    Keeps running counters of connection pool events so that pool usage can be reported by the health endpoint.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.stats = {
+            "connections_open": 0,
+            "connections_in_use": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "check_out_failures": 0,
+            "pool_clears": 0,
+        }
+
+    def _add(self, key: str, value: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += value
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        self._add("pool_clears")
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        self._add("connections_created")
+        self._add("connections_open")
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        self._add("connections_closed")
+        self._add("connections_open", -1)
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def connection_check_out_failed(self, event) -> None:
+        self._add("check_out_failures")
+
+    def connection_checked_out(self, event) -> None:
+        self._add("connections_in_use")
+
+    def connection_checked_in(self, event) -> None:
+        self._add("connections_in_use", -1)
+
+
+_client: Optional[AsyncMongoClient] = None
+_pool_listener = PoolStatsListener()
+
+
+def get_client() -> AsyncMongoClient:
+    '''
+    Returns the process-wide MongoDB client, creating it on first use.
+    All requests share this client and therefore its connection pool.
+    '''
+    global _client
+    if _client is None:
+        _client = AsyncMongoClient(
+            mongo_uri,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            maxIdleTimeMS=max_idle_time_ms,
+            connectTimeoutMS=connect_timeout_ms,
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+            socketTimeoutMS=socket_timeout_ms,
+            event_listeners=[_pool_listener],
+        )
+    return _client
+
+
+def get_database() -> AsyncDatabase:
+    return get_client()[db_name]
+
+
+async def init_db() -> None:
+    '''
+    Creates the shared client and connects eagerly so that the first request does not pay the handshake.
+    '''
+    try:
+        await get_database().command("ping")
+        print(f"Connected to MongoDB database '{db_name}' (max pool size {max_pool_size})")
+    except Exception as e:
+        print(f"Exception in init_db(): {e}")
+
+
+async def close_db() -> None:
+    '''
+    Closes the shared client and its connection pool (called on application shutdown).
+    '''
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def get_db_health() -> Dict[str, Any]:
+    '''
+    Pings the database and reports connection pool statistics.
+    '''
+    started = time.perf_counter()
+    try:
+        await get_database().command("ping")
+        ready = True
+        error = None
+    except Exception as e:
+        ready = False
+        error = str(e)
+    return {
+        "ready": ready,
+        "ping_ms": round((time.perf_counter() - started) * 1000, 2),
+        "error": error,
+        "pool": {
+            "max_pool_size": max_pool_size,
+            "min_pool_size": min_pool_size,
+            **_pool_listener.snapshot(),
+        },
+    }
@@ -1,13 +1,27 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
 import configparser
 
 config = configparser.ConfigParser()
 config.read("config.ini")
 api_key = config.get("API_KEYS", "OPENAI_API_KEY")
 
-def call_llm(prompt: str, model: str = "gpt-4o") -> str:
+SYSTEM_PROMPT = "You are a precise assistant. Always follow instructions exactly."
+# Returned when the LLM call fails
+FALLBACK_RESPONSE = '{"answerable": false}'
+
+_async_openai_client = None
+
+def _get_async_openai_client() -> AsyncOpenAI:
+    # Shared so that concurrent requests reuse the client's HTTP connection pool
+    global _async_openai_client
+    if _async_openai_client is None:
+        _async_openai_client = AsyncOpenAI(api_key=api_key)
+    return _async_openai_client
+
+async def call_llm_async(prompt: str, model: str = "gpt-4o") -> str:
     """
-    Calls OpenAI's GPT-4o model with the given prompt, expecting a JSON response.
+    Calls OpenAI's GPT-4o model with the given prompt, expecting a JSON response, without blocking the
+    event loop while waiting for the model.
 
     Args:
         prompt (str): The full instruction to be sent.
@@ -16,26 +30,17 @@ def call_llm(prompt: str, model: str = "gpt-4o") -> str:
     Returns:
         str: The raw JSON response from the model as a string.
     """
-    openai_client = OpenAI(api_key=api_key)
     try:
-                 
-        response = openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                {
-                    "role": "system",
-                    "content": "You are a precise assistant. Always follow instructions exactly."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-                ],
-                temperature=0.2,
-            )
-        content = str(response.choices[0].message.content).strip()
-        return content
+        response = await _get_async_openai_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+        )
+        return str(response.choices[0].message.content).strip()
 
     except Exception as ex:
         print(f"[Unexpected Error] {ex}")
-        return '{"answerable": false}'
+        return FALLBACK_RESPONSE
@@ -0,0 +1,59 @@
+import hashlib, json
+from typing import Any, List, Optional
+
+# Fields that are not part of a memory record's content (user_id is only stored by the shared MongoDB layout)
+META_FIELDS = ["_id", "user_id", "timestamp", "content_digest", "doc_set_key", "focus_set_key", "query_key"]
+
+
+def set_key(values: List[Any]) -> str:
+    '''
+    Order-independent key of a list of strings (e.g. document hashes or focus areas). Other values, such as
+    the subdocuments some legacy records hold, are keyed by their JSON with sorted keys.
+
+    Args:
+    values (List[Any]): The values to key.
+
+    Returns:
+    str: SHA-256 of the sorted values, equal for any permutation of the list.
+    '''
+    normalised = [v if isinstance(v, str) else json.dumps(v, sort_keys=True, separators=(",", ":"), default=str) for v in values]
+    canonical = json.dumps(sorted(normalised), separators=(",", ":"))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def remove_meta_fields(doc: dict) -> dict:
+    """Remove metadata fields (_id, timestamp and derived keys) for comparison."""
+    return {k: v for k, v in doc.items() if k not in META_FIELDS}
+
+
+def content_digest(doc: dict) -> str:
+    """Stable hash of a memory record's content, independent of key order and metadata fields."""
+    canonical = json.dumps(remove_meta_fields(doc), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def lookup_keys(doc: dict) -> dict:
+    """
+    Derived keys used for equality lookups: the order-independent key of a record's document set,
+    of its focus areas (summaries) and its normalised query (k_search).
+    """
+    keys = {"doc_set_key": set_key(doc.get("doc_hashes", []))}
+    if doc.get("agent", "").lower() == "summariser":
+        keys["focus_set_key"] = set_key(doc.get("focus_areas") or [])
+    elif doc.get("agent", "").lower() == "k_search":
+        keys["query_key"] = (doc.get("query_text") or "").strip().lower()
+    return keys
+
+
+def focus_area_key(focus_area: Optional[str]) -> str:
+    """Normalised focus area of a stored FAQ question, as matched against requested focus areas."""
+    return (focus_area or "").strip().lower()
+
+
+def merge_key(doc: dict) -> Optional[str]:
+    """Primary key under which FAQ (agent + doc_hashes + parameters) and Doc Extractor (agent + doc_hashes) records are merged."""
+    if doc["agent"].lower() == "faq_generator":
+        return json.dumps([doc["agent"], doc["doc_hashes"], doc["parameters"]], default=str)
+    if doc["agent"].lower() == "doc_extractor":
+        return json.dumps([doc["agent"], doc["doc_hashes"]], default=str)
+    return None
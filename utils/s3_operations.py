@@ -1,6 +1,12 @@
 import os
 import boto3
 import configparser
+import threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, BinaryIO, Dict, Any
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 
 config = configparser.ConfigParser()
 config.read("config.ini")
@@ -8,6 +14,131 @@ config.read("config.ini")
 aws_access_key_id = config['AWS']['aws_access_key_id']
 aws_secret_access_key = config['AWS']['aws_secret_access_key']
 aws_region_name = config['AWS']['aws_region']
+# Optional: S3-compatible endpoint, e.g. a local moto server (http://127.0.0.1:5000)
+aws_endpoint_url = config.get('AWS', 'endpoint_url', fallback=None)
+# Size of each ranged GET when streaming an object
+range_chunk_bytes = config.getint('AWS', 'range_chunk_bytes', fallback=8 * 1024 * 1024)
+stream_read_bytes = 256 * 1024
+# HTTP connections kept per client (shared by all threads using it)
+max_pool_connections = config.getint('AWS', 'max_pool_connections', fallback=50)
+# Parallel ranged GETs / multipart parts per object, and the size from which transfers are split
+transfer_max_concurrency = config.getint('AWS', 'transfer_max_concurrency', fallback=8)
+multipart_threshold = config.getint('AWS', 'multipart_threshold', fallback=16 * 1024 * 1024)
+multipart_chunksize = config.getint('AWS', 'multipart_chunksize', fallback=8 * 1024 * 1024)
+# Optional: region of buckets outside aws_region, e.g. "my-eu-bucket = eu-west-1"
+bucket_regions = dict(config.items('S3_BUCKET_REGIONS')) if config.has_section('S3_BUCKET_REGIONS') else {}
+
+transfer_config = TransferConfig(
+    multipart_threshold=multipart_threshold,
+    multipart_chunksize=multipart_chunksize,
+    max_concurrency=transfer_max_concurrency,
+)
+
+
+class S3Metrics:
+    '''
+    Running totals of S3 requests, bytes transferred and time spent, reported by the health endpoint.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "bytes_downloaded": 0,
+            "bytes_uploaded": 0,
+            "seconds": 0.0,
+            "clients_created": 0,
+        }
+
+    def record(self, started: float, bytes_downloaded: int = 0, bytes_uploaded: int = 0, error: bool = False) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["errors"] += int(error)
+            self.stats["bytes_downloaded"] += bytes_downloaded
+            self.stats["bytes_uploaded"] += bytes_uploaded
+            self.stats["seconds"] += time.perf_counter() - started
+
+    def client_created(self) -> None:
+        with self._lock:
+            self.stats["clients_created"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = dict(self.stats)
+        snapshot["seconds"] = round(snapshot["seconds"], 3)
+        return snapshot
+
+
+_metrics = S3Metrics()
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+_session: Optional[boto3.session.Session] = None
+_range_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_s3_client(region_name: str = aws_region_name):
+    '''
+    Returns the process-wide S3 client for a region, creating it on first use.
+    boto3 clients are thread-safe, so every helper for a bucket in the region shares its connection pool
+    and resolved credentials instead of building a new client per document.
+    '''
+    client = _clients.get(region_name)
+    if client is not None:
+        return client
+    global _session
+    with _clients_lock:
+        if region_name not in _clients:
+            # Sessions are not thread-safe, so clients are only ever created under the lock
+            if _session is None:
+                _session = boto3.session.Session(
+                    aws_access_key_id=aws_access_key_id,
+                    aws_secret_access_key=aws_secret_access_key
+                )
+            _clients[region_name] = _session.client(
+                's3',
+                region_name=region_name,  # Specified the region for the S3 client
+                endpoint_url=aws_endpoint_url,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    retries={"mode": "standard"},
+                    tcp_keepalive=True
+                )
+            )
+            _metrics.client_created()
+        return _clients[region_name]
+
+
+def _get_range_executor() -> ThreadPoolExecutor:
+    global _range_executor
+    if _range_executor is None:
+        with _clients_lock:
+            if _range_executor is None:
+                _range_executor = ThreadPoolExecutor(max_workers=transfer_max_concurrency, thread_name_prefix="s3-range")
+    return _range_executor
+
+
+def shutdown_s3() -> None:
+    '''
+    Stops the ranged-GET thread pool and closes the shared clients (called on application shutdown).
+    '''
+    global _range_executor
+    if _range_executor is not None:
+        _range_executor.shutdown(wait=True)
+        _range_executor = None
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def get_s3_metrics() -> Dict[str, Any]:
+    return {
+        "clients": sorted(_clients),
+        "max_pool_connections": max_pool_connections,
+        **_metrics.snapshot(),
+    }
+
 
 class S3Helper:
     def __init__(self,s3_bucket_name) -> None:
@@ -15,39 +146,134 @@ class S3Helper:
         Initializes the S3Helper object.
         '''
         self.bucket_name = s3_bucket_name
-        self.s3_client = boto3.client(
-            's3',
-            region_name=aws_region_name,  # Specified the region for the S3 client
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
-        )
-        
+        self.s3_client = get_s3_client(bucket_regions.get(s3_bucket_name, aws_region_name))
+
 
     def upload_file_to_s3(self, file_name: str, object_name: str) -> None:
         '''
         Uploads a file to S3 bucket.
         '''
+        started = time.perf_counter()
         try:
-            self.s3_client.upload_file(file_name, self.bucket_name, object_name)
+            self.s3_client.upload_file(file_name, self.bucket_name, object_name, Config=transfer_config)
+            _metrics.record(started, bytes_uploaded=os.path.getsize(file_name))
             print(f"File '{file_name}' uploaded to S3 bucket '{self.bucket_name}' as '{object_name}'.")
         except Exception as e:
+            _metrics.record(started, error=True)
             print(f"Exception in upload_file_to_s3(): File - '{file_name}', S3 bucket - '{self.bucket_name}', object_name - '{object_name}'")
 
     def download_file_from_s3(self, object_name: str, file_name: str) -> None:
         '''
         Downloads a file from S3 bucket.
         '''
+        started = time.perf_counter()
         try:
             print(f"Downloading file from S3: Bucket - '{self.bucket_name}', Object - '{object_name}', Local - '{file_name}'")
-            self.s3_client.download_file(self.bucket_name, object_name, file_name)
+            self.s3_client.download_file(self.bucket_name, object_name, file_name, Config=transfer_config)
+            _metrics.record(started, bytes_downloaded=os.path.getsize(file_name))
             print(f"File '{object_name}' downloaded from S3 bucket '{self.bucket_name}' to '{file_name}'.")
         except boto3.exceptions.S3UploadFailedError as e:
+            _metrics.record(started, error=True)
             print(f"S3UploadFailedError in download_file_from_s3(): File - '{object_name}', S3 bucket - '{self.bucket_name}', to - '{file_name}'")
             raise e
         except Exception as e:
+            _metrics.record(started, error=True)
             print(f"Exception in download_file_from_s3(): File - '{object_name}', S3 bucket - '{self.bucket_name}', to - '{file_name}'")
             raise e
 
+    def head_object(self, object_name: str) -> dict:
+        '''
+        Fetches the metadata (ETag, VersionId, ContentLength) of an S3 object without downloading it.
+        '''
+        started = time.perf_counter()
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=object_name)
+            _metrics.record(started)
+            return {
+                "etag": response.get("ETag", "").strip('"'),
+                "version_id": response.get("VersionId"),
+                "content_length": response.get("ContentLength", 0)
+            }
+        except Exception as e:
+            _metrics.record(started, error=True)
+            print(f"Exception in head_object(): File - '{object_name}', S3 bucket - '{self.bucket_name}'")
+            raise e
+
+    def _range_request(self, object_name: str, start: int, end: int, etag: Optional[str], version_id: Optional[str]) -> Dict[str, Any]:
+        request = {"Bucket": self.bucket_name, "Key": object_name, "Range": f"bytes={start}-{end}"}
+        # Pin every range to the version/ETag seen by head_object() so that a concurrent overwrite
+        # fails the read instead of mixing two versions
+        if version_id:
+            request["VersionId"] = version_id
+        elif etag:
+            request["IfMatch"] = f'"{etag}"'
+        return request
+
+    def _stream_range(self, request: Dict[str, Any], destination: BinaryIO) -> int:
+        started = time.perf_counter()
+        written = 0
+        try:
+            body = self.s3_client.get_object(**request)["Body"]
+            for chunk in body.iter_chunks(stream_read_bytes):
+                destination.write(chunk)
+                written += len(chunk)
+        except Exception:
+            _metrics.record(started, bytes_downloaded=written, error=True)
+            raise
+        _metrics.record(started, bytes_downloaded=written)
+        return written
+
+    def _fetch_range(self, request: Dict[str, Any]) -> bytes:
+        started = time.perf_counter()
+        try:
+            data = self.s3_client.get_object(**request)["Body"].read()
+        except Exception:
+            _metrics.record(started, error=True)
+            raise
+        _metrics.record(started, bytes_downloaded=len(data))
+        return data
+
+    def read_object(self, object_name: str, destination: BinaryIO, size: int, etag: Optional[str] = None, version_id: Optional[str] = None) -> int:
+        '''
+        Reads an S3 object into a writable binary file with ranged GETs, without buffering it whole.
+        Objects of at least `multipart_threshold` bytes are fetched with up to `transfer_max_concurrency`
+        ranges in flight, written in order; smaller ones are streamed range by range.
+        
+        Returns:
+        int: The number of bytes written.
+        '''
+        ranges = [
+            self._range_request(object_name, start, min(start + range_chunk_bytes, size) - 1, etag, version_id)
+            for start in range(0, size, range_chunk_bytes)
+        ]
+        written = 0
+        try:
+            if size < multipart_threshold or len(ranges) == 1:
+                for request in ranges:
+                    written += self._stream_range(request, destination)
+                return written
+
+            executor = _get_range_executor()
+            in_flight = deque()
+            try:
+                for request in ranges:
+                    in_flight.append(executor.submit(self._fetch_range, request))
+                    if len(in_flight) >= transfer_max_concurrency:
+                        data = in_flight.popleft().result()
+                        destination.write(data)
+                        written += len(data)
+                while in_flight:
+                    data = in_flight.popleft().result()
+                    destination.write(data)
+                    written += len(data)
+            finally:
+                for future in in_flight:
+                    future.cancel()
+            return written
+        except Exception as e:
+            print(f"Exception in read_object(): File - '{object_name}', S3 bucket - '{self.bucket_name}'")
+            raise e
+
     def upload_directory(self, dir_name: str, prefix: str = "") -> None:
         '''
         Uploads a directory to S3 bucket.
@@ -80,6 +306,6 @@ class S3Helper:
                     os.makedirs(os.path.dirname(local_path), exist_ok=True)
 
                     # Download the object
-                    self.s3_client.download_file(self.bucket_name, key, local_path)
+                    self.download_file_from_s3(key, local_path)
         except Exception as e:
             print(f"Exception in download_directory(): {e}")
\ No newline at end of file
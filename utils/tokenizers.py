@@ -0,0 +1,81 @@
+import configparser
+from functools import lru_cache
+from typing import Callable, Dict, Tuple
+import tiktoken
+from utils.model_prices import MODEL_PRICING
+
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+# Optional offline tokenizer.json files (HuggingFace `tokenizers` format) for non-GPT models, keyed by
+# standard model name, e.g. "deepseek-v3 = /models/deepseek-v3/tokenizer.json"
+TOKENIZER_FILES = dict(config.items("TOKENIZERS")) if config.has_section("TOKENIZERS") else {}
+
+HEURISTIC_TOKENIZER = "chars/4"
+
+
+def _heuristic_count(text: str) -> int:
+    # Fallback: assume ~4 chars per token as heuristic
+    return max(1, len(text) // 4)
+
+
+@lru_cache(maxsize=None)
+def _hf_tokenizer(path: str):
+    from tokenizers import Tokenizer
+    return Tokenizer.from_file(path)
+
+
+@lru_cache(maxsize=None)
+def _resolve(model_name: str) -> Tuple[str, Callable[[str], int]]:
+    if model_name.lower().startswith("gpt"):
+        encoding = tiktoken.encoding_for_model(model_name)
+        # disallowed_special=() so that text containing special-token strings is counted rather than rejected
+        return encoding.name, lambda text: len(encoding.encode(text, disallowed_special=()))
+    path = TOKENIZER_FILES.get(model_name.lower())
+    if path:
+        try:
+            tokenizer = _hf_tokenizer(path)
+            return f"hf:{model_name.lower()}", lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+        except Exception as e:
+            print(f"Exception in get_tokenizer(): could not load tokenizer for {model_name}: {e}")
+    return HEURISTIC_TOKENIZER, _heuristic_count
+
+
+def tokenizer_name(model_name: str) -> str:
+    '''
+    Name of the tokenizer used for a model: a tiktoken encoding, "hf:<model>" for a configured
+    tokenizer.json, or "chars/4" for the length heuristic. Models with the same name tokenise identically.
+    '''
+    return _resolve(model_name)[0]
+
+
+def get_tokenizer(model_name: str) -> Callable[[str], int]:
+    '''
+    Returns a token counting function for the model. Encodings are loaded once per process.
+
+    Args:
+    model_name (str): Standard model name (see get_standard_model_name).
+
+    Returns:
+    Callable[[str], int]: Function returning the number of tokens in a text.
+    '''
+    return _resolve(model_name)[1]
+
+
+def count_tokens(text: str) -> Dict[str, int]:
+    '''
+    Counts the tokens of a text once per distinct tokenizer of the priced models, so that the count
+    can be stored with the document fingerprint and reused for any model at lookup time.
+
+    Args:
+    text (str): Extracted document text.
+
+    Returns:
+    Dict[str, int]: Token count keyed by tokenizer name (see tokenizer_name).
+    '''
+    counts = {}
+    for model_name in MODEL_PRICING:
+        name, tokenizer = _resolve(model_name)
+        if name not in counts:
+            counts[name] = tokenizer(text)
+    return counts